@@ -1,5 +1,5 @@
-from davincirunsdk.notebook.sdk import init_rank_table, start_distributed_train, wait_distributed_train, \
-    start_and_wait_distributed_train, set_random_ms_cache_dir
+import importlib
+import sys
 
 __all__ = [
     'init_rank_table',
@@ -8,3 +8,23 @@ __all__ = [
     'start_and_wait_distributed_train',
     'set_random_ms_cache_dir'
 ]
+
+# the notebook sdk is imported on first access (PEP 562),
+# so `davincirun` and the other submodules don't pay for it
+_SDK_MODULE = 'davincirunsdk.notebook.sdk'
+
+
+def __getattr__(name):
+    if name in __all__:
+        return getattr(importlib.import_module(_SDK_MODULE), name)
+    raise AttributeError('module %r has no attribute %r' % (__name__, name))
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
+
+
+if sys.version_info < (3, 7):
+    # module __getattr__ is not supported
+    from davincirunsdk.notebook.sdk import init_rank_table, start_distributed_train, wait_distributed_train, \
+        start_and_wait_distributed_train, set_random_ms_cache_dir
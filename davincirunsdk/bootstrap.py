@@ -0,0 +1,126 @@
+import os
+import threading
+import time
+
+from davincirunsdk.common import ModelArtsLog
+
+log = ModelArtsLog.get_modelarts_logger()
+
+
+class StageError(Exception):
+    """
+    a stage (or a stage it requires) failed
+    """
+
+    def __init__(self, name, cause):
+        super().__init__('bootstrap stage [%s] failed: %s: %s' % (name, type(cause).__name__, cause))
+        self.name = name
+        self.cause = cause
+
+
+class Stage:
+    def __init__(self, name, func, requires):
+        self.name = name
+        self.func = func
+        self.requires = requires
+
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+        # time.time() when the stage is added, its requirements are done, and it's finished
+        self.add_time = time.time()
+        self.start_time = None
+        self.end_time = None
+
+    def get_timing(self):
+        """
+        :return: (seconds waiting for the requirements, seconds running), None if the stage is not finished
+        """
+        if self.end_time is None:
+            return None
+        start_time = self.start_time if self.start_time is not None else self.end_time
+        return start_time - self.add_time, self.end_time - start_time
+
+
+class StagedBootstrap:
+    """
+    run the bootstrap stages of davincirun concurrently, in the order of their dependencies
+
+    a stage is func(*results of the stages it requires), it starts as soon as the required stages are done,
+    and fails without running if one of them failed.
+    wait(name) blocks until a stage is done, so the training launch only gates on the stages it needs.
+
+    the stages run in daemon threads, a stage blocked forever (e.g. waiting for the rank table)
+    doesn't keep the process alive after davincirun exits.
+    set DAVINCIRUN_SERIAL_BOOTSTRAP=true to run the stages one by one in the calling thread
+    """
+    SERIAL_BOOTSTRAP_ENV = 'DAVINCIRUN_SERIAL_BOOTSTRAP'
+
+    def __init__(self, concurrent=None):
+        if concurrent is None:
+            concurrent = os.getenv(StagedBootstrap.SERIAL_BOOTSTRAP_ENV, 'false').lower() != 'true'
+        self.concurrent = concurrent
+        self.stages = {}
+
+    def add_stage(self, name, func, requires=()):
+        """
+        :param requires: names of the stages added before, their results are the args of func
+        """
+        if name in self.stages:
+            raise ValueError('bootstrap stage [%s] is already added' % name)
+        for required_name in requires:
+            if required_name not in self.stages:
+                raise ValueError('bootstrap stage [%s] requires an unknown stage [%s]' % (name, required_name))
+
+        stage = Stage(name, func, tuple(requires))
+        self.stages[name] = stage
+        if self.concurrent:
+            threading.Thread(target=self.run_stage, args=(stage,), name='bootstrap-%s' % name, daemon=True).start()
+        else:
+            self.run_stage(stage)
+        return stage
+
+    def run_stage(self, stage):
+        try:
+            args = [self.wait(required_name) for required_name in stage.requires]
+            stage.start_time = time.time()
+            stage.result = stage.func(*args)
+        except StageError as e:
+            # a required stage failed
+            stage.error = e
+        except BaseException as e:
+            stage.error = StageError(stage.name, e)
+            log.error('%s' % stage.error)
+        finally:
+            stage.end_time = time.time()
+            stage.done.set()
+
+    def wait(self, name, timeout=None):
+        """
+        :return: the result of the stage
+        :raise StageError: the stage or a stage it requires failed
+        :raise TimeoutError: the stage is not done within the timeout
+        """
+        stage = self.stages[name]
+        if not stage.done.wait(timeout):
+            raise TimeoutError('bootstrap stage [%s] is not done in %ss' % (name, timeout))
+        if stage.error is not None:
+            raise stage.error
+        return stage.result
+
+    def get_timings(self):
+        """
+        :return: {name: (seconds waiting for the requirements, seconds running)} of the finished stages
+        """
+        timings = {}
+        for name, stage in self.stages.items():
+            timing = stage.get_timing()
+            if timing is not None:
+                timings[name] = timing
+        return timings
+
+    def log_timings(self):
+        for name, (wait_time, run_time) in self.get_timings().items():
+            log.info('bootstrap stage [%s]: %.3fs (waited %.3fs for %s)' % (
+                name, run_time, wait_time, ', '.join(self.stages[name].requires) or 'nothing'))
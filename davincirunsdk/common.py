@@ -1,9 +1,12 @@
+import fcntl
 import logging
 import os
 import signal
 import errno
 import json
 import socket
+import tempfile
+from contextlib import contextmanager
 
 logo = 'ModelArts'
 
@@ -16,15 +19,13 @@ class BatchEnv:
 
     @staticmethod
     def get_pod_name():
-        if BatchEnv.POD_NAME in os.environ and os.environ[BatchEnv.POD_NAME]:
-            return os.environ[BatchEnv.POD_NAME]
-
-        return None
+        return JobContext.current().pod_name
 
     @staticmethod
     def get_batch_stdout_log():
-        if BatchEnv.BATCH_TASK_LOG_PATH in os.environ and os.environ[BatchEnv.BATCH_TASK_LOG_PATH]:
-            return os.path.join(os.environ[BatchEnv.BATCH_TASK_LOG_PATH], 'stdout.log')
+        batch_log_path = JobContext.current().batch_log_path
+        if batch_log_path:
+            return os.path.join(batch_log_path, 'stdout.log')
 
         return None
 
@@ -70,29 +71,15 @@ class OpEnv:
 
     @staticmethod
     def should_handle_operator():
-        if OpEnv.MA_ALGORITHM_OPERATOR in os.environ and os.environ[OpEnv.MA_ALGORITHM_OPERATOR] != '':
-            op_str = os.environ[OpEnv.MA_ALGORITHM_OPERATOR]
-            op_json_info = json.loads(op_str)
-            if OpEnv.OBS_TYPE in op_json_info and OpEnv.OBS_URL in op_json_info[OpEnv.OBS_TYPE]:
-                return True
-        return False
+        return JobContext.current().op_obs_url is not None
 
     @staticmethod
     def get_op_obs_uri():
-        if OpEnv.should_handle_operator():
-            op_str = os.environ[OpEnv.MA_ALGORITHM_OPERATOR]
-            op_json_info = json.loads(op_str)
-            return op_json_info[OpEnv.OBS_TYPE][OpEnv.OBS_URL]
-        return None
+        return JobContext.current().op_obs_url
 
     @staticmethod
     def ide_mode():
-        if OpEnv.should_handle_operator():
-            op_str = os.environ[OpEnv.MA_ALGORITHM_OPERATOR]
-            op_json_info = json.loads(op_str)
-            if OpEnv.IDE_MODE in op_json_info and op_json_info[OpEnv.IDE_MODE]:
-                return True
-        return False
+        return JobContext.current().ide_mode
 
 
 class ModelArts:
@@ -118,46 +105,35 @@ class ModelArts:
 
     @staticmethod
     def get_current_instance_name():
-        if BatchEnv.POD_NAME in os.environ:
-            # v1
-            return os.environ[BatchEnv.POD_NAME]
-
-        if ModelArts.MA_CURRENT_INSTANCE_NAME_ENV in os.environ:
-            # v2
-            return os.environ[ModelArts.MA_CURRENT_INSTANCE_NAME_ENV]
-
-        # edge
-        return None
+        return JobContext.current().instance_name
 
     @staticmethod
     def get_current_host_ip():
-        return os.environ.get(ModelArts.MA_CURRENT_HOST_IP)
+        return JobContext.current().host_ip
 
     @staticmethod
     def get_job_id():
-        if BatchEnv.BATCH_JOB_ID in os.environ:
-            return os.environ[BatchEnv.BATCH_JOB_ID]
-
-        if ModelArts.MA_VJ_NAME in os.environ:
-            ma_vj_name = os.environ[ModelArts.MA_VJ_NAME]
-            return ma_vj_name.replace('ma-job', 'modelarts-job', 1)
-
-        return socket.gethostname()
+        return JobContext.current().job_id
 
     @staticmethod
     def enable_log_upload():
-        if ModelArts.MA_UPLOAD_LOG_OBS_ENV in os.environ and os.environ[ModelArts.MA_UPLOAD_LOG_OBS_ENV] and \
-                ModelArts.MA_USE_UPLOADER_ENV in os.environ:
-            return True
-
-        return False
+        return JobContext.current().log_upload_url is not None
 
     @staticmethod
     def get_log_upload_url():
-        if ModelArts.enable_log_upload():
-            return os.environ[ModelArts.MA_UPLOAD_LOG_OBS_ENV]
+        return JobContext.current().log_upload_url
 
-        return None
+    @staticmethod
+    def import_moxing():
+        """
+        :return: the moxing module, None if it's not installed
+        moxing is slow to import, only import it when OBS is really used
+        """
+        try:
+            import moxing
+        except ImportError:
+            return None
+        return moxing
 
     @staticmethod
     def is_edge_job():
@@ -194,23 +170,166 @@ class ModelArts:
 
     @staticmethod
     def only_keep_v1_special_channel_env():
-        if ModelArts.MA_INPUTS in os.environ and os.environ[ModelArts.MA_INPUTS] != "":
-            input_json = json.loads(os.environ[ModelArts.MA_INPUTS])
-            v1_special_input_json = ModelArts.generate_v1_channel_from_v2_channel("inputs", input_json, "data_url")
+        job_context = JobContext.current()
+        if job_context.inputs is not None:
+            v1_special_input_json = ModelArts.generate_v1_channel_from_v2_channel("inputs", job_context.inputs,
+                                                                                  "data_url")
             if v1_special_input_json is not None:
                 os.environ[ModelArts.MA_INPUTS] = v1_special_input_json
             else:
                 del os.environ[ModelArts.MA_INPUTS]
 
-        if ModelArts.MA_OUTPUTS in os.environ and os.environ[ModelArts.MA_OUTPUTS] != "":
-            output_json = json.loads(os.environ[ModelArts.MA_OUTPUTS])
-            v1_special_output_json = ModelArts.generate_v1_channel_from_v2_channel("outputs", output_json, "train_url")
+        if job_context.outputs is not None:
+            v1_special_output_json = ModelArts.generate_v1_channel_from_v2_channel("outputs", job_context.outputs,
+                                                                                   "train_url")
             if v1_special_output_json is not None:
                 os.environ[ModelArts.MA_OUTPUTS] = v1_special_output_json
             else:
                 del os.environ[ModelArts.MA_OUTPUTS]
 
 
+class JobContext:
+    """
+    typed view of the job env, the values are evaluated on first access
+
+    the contexts are cached by the raw strings of ENV_NAMES, so the env JSON (MA_ALGORITHM_OPERATOR, MA_INPUTS,
+    MA_OUTPUTS) is parsed once, and a changed env (e.g. by only_keep_v1_special_channel_env) gets a new context.
+    the parsed JSON is shared, don't modify it
+    """
+    ENV_NAMES = (
+        BatchEnv.BATCH_JOB_ID,
+        BatchEnv.POD_NAME,
+        BatchEnv.BATCH_TASK_LOG_PATH,
+        ModelArts.MA_VJ_NAME,
+        ModelArts.MA_CURRENT_INSTANCE_NAME_ENV,
+        ModelArts.MA_CURRENT_HOST_IP,
+        ModelArts.MA_MOUNT_PATH_ENV,
+        ModelArts.MA_UPLOAD_LOG_OBS_ENV,
+        ModelArts.MA_USE_UPLOADER_ENV,
+        ModelArts.MA_INPUTS,
+        ModelArts.MA_OUTPUTS,
+        OpEnv.MA_ALGORITHM_OPERATOR,
+    )
+
+    MAX_CACHED_CONTEXTS = 16
+
+    _contexts = {}
+
+    def __init__(self, raw_envs):
+        """
+        :param raw_envs: (env value or None, ...), aligned with ENV_NAMES
+        """
+        self.raw_envs = dict(zip(JobContext.ENV_NAMES, raw_envs))
+        self.values = {}
+
+    @staticmethod
+    def current(environ=None):
+        """
+        :param environ: os.environ if None
+        """
+        environ = os.environ if environ is None else environ
+        raw_envs = tuple(environ.get(env_name) for env_name in JobContext.ENV_NAMES)
+        job_context = JobContext._contexts.get(raw_envs)
+        if job_context is None:
+            if len(JobContext._contexts) >= JobContext.MAX_CACHED_CONTEXTS:
+                JobContext._contexts.clear()
+            job_context = JobContext._contexts[raw_envs] = JobContext(raw_envs)
+        return job_context
+
+    def get_env(self, env_name):
+        return self.raw_envs[env_name]
+
+    def lazy(self, name, compute):
+        if name not in self.values:
+            self.values[name] = compute()
+        return self.values[name]
+
+    def load_json(self, env_name):
+        """
+        :return: the parsed env, None if the env is not set or empty
+        """
+        raw = self.get_env(env_name)
+        if not raw:
+            return None
+        return self.lazy('json:' + env_name, lambda: json.loads(raw))
+
+    @property
+    def job_id(self):
+        return self.lazy('job_id', self.compute_job_id)
+
+    def compute_job_id(self):
+        if self.get_env(BatchEnv.BATCH_JOB_ID) is not None:
+            return self.get_env(BatchEnv.BATCH_JOB_ID)
+
+        if self.get_env(ModelArts.MA_VJ_NAME) is not None:
+            return self.get_env(ModelArts.MA_VJ_NAME).replace('ma-job', 'modelarts-job', 1)
+
+        return socket.gethostname()
+
+    @property
+    def instance_name(self):
+        if self.get_env(BatchEnv.POD_NAME) is not None:
+            # v1
+            return self.get_env(BatchEnv.POD_NAME)
+
+        # v2, or None for edge
+        return self.get_env(ModelArts.MA_CURRENT_INSTANCE_NAME_ENV)
+
+    @property
+    def pod_name(self):
+        return self.get_env(BatchEnv.POD_NAME) or None
+
+    @property
+    def host_ip(self):
+        return self.get_env(ModelArts.MA_CURRENT_HOST_IP)
+
+    @property
+    def mount_path(self):
+        return self.get_env(ModelArts.MA_MOUNT_PATH_ENV)
+
+    @property
+    def batch_log_path(self):
+        return self.get_env(BatchEnv.BATCH_TASK_LOG_PATH) or None
+
+    @property
+    def log_upload_url(self):
+        """
+        :return: None if the log upload is not enabled
+        """
+        if self.get_env(ModelArts.MA_USE_UPLOADER_ENV) is None:
+            return None
+        return self.get_env(ModelArts.MA_UPLOAD_LOG_OBS_ENV) or None
+
+    @property
+    def operator(self):
+        return self.load_json(OpEnv.MA_ALGORITHM_OPERATOR)
+
+    @property
+    def op_obs_url(self):
+        """
+        :return: obs url of the operators, None if there are no operators to handle
+        """
+        operator = self.operator
+        if operator is None or OpEnv.OBS_TYPE not in operator or OpEnv.OBS_URL not in operator[OpEnv.OBS_TYPE]:
+            return None
+        return operator[OpEnv.OBS_TYPE][OpEnv.OBS_URL]
+
+    @property
+    def ide_mode(self):
+        return self.op_obs_url is not None and bool(self.operator.get(OpEnv.IDE_MODE))
+
+    @property
+    def inputs(self):
+        """
+        :return: the channels of MA_INPUTS, None if it's not set
+        """
+        return self.load_json(ModelArts.MA_INPUTS)
+
+    @property
+    def outputs(self):
+        return self.load_json(ModelArts.MA_OUTPUTS)
+
+
 class HwHiAiUser:
     PRE_STOP_SCRIPTS = '/usr/local/Ascend/driver/tools/docker_stop_post_sys.sh'
 
@@ -239,6 +358,140 @@ class HwHiAiUser:
         return os.environ.get(HwHiAiUser.FMK_WORKSPACE_ENV, HwHiAiUser.FMK_WORKSPACE_DEFAULT_VALUE)
 
 
+class AscendDriverInfo:
+    """
+    the driver version file (version.info), parsed once and cached per process
+
+    e.g.
+    ---
+    Version=20.1.0
+    ascendhal_version=4.0.0
+    aicpu_version=1.0
+    package_version=6.0.RC1
+    ---
+    version: the value of the first line (Version), only the first line tells the driver version
+    components: {name: version} of the `*_version` lines
+    features: {feature: bool} derived from the version
+    """
+    DRIVER_VERSION_FILE_PATH = '/usr/local/Ascend/driver/version.info'
+
+    # the logical device id (ASCEND_DEVICE_ID) is supported after c75-tr5
+    C75_TR5_VERSION_LINE = 'Version=20.1.0'
+    FEATURE_LOGICAL_DEVICE_ID = 'logical_device_id'
+
+    # file path -> ((size, mtime_ns, inode), AscendDriverInfo)
+    _cache = {}
+
+    def __init__(self, file_path, first_line, fields):
+        self.file_path = file_path
+        self.first_line = first_line
+        self.fields = fields
+
+        version_key, _, version = first_line.partition('=')
+        self.version = version if version_key == 'Version' else None
+        self.components = {name[:-len('_version')]: value for name, value in fields.items()
+                           if name.endswith('_version')}
+        self.is_c75_tr5 = first_line == AscendDriverInfo.C75_TR5_VERSION_LINE
+        self.features = {
+            AscendDriverInfo.FEATURE_LOGICAL_DEVICE_ID: not self.is_c75_tr5,
+        }
+
+    @staticmethod
+    def parse(file_path, content):
+        lines = [line.strip() for line in content.splitlines()]
+        fields = {}
+        for line in lines:
+            name, sep, value = line.partition('=')
+            if sep:
+                fields.setdefault(name, value)
+        return AscendDriverInfo(file_path, lines[0] if lines else '', fields)
+
+    @staticmethod
+    def probe(file_path=DRIVER_VERSION_FILE_PATH):
+        """
+        :return: AscendDriverInfo, None if the file does not exist,
+                 the file is read again only when its size, mtime or inode is changed
+        """
+        try:
+            file_stat = os.stat(file_path)
+        except OSError:
+            AscendDriverInfo._cache.pop(file_path, None)
+            return None
+
+        state = (file_stat.st_size, file_stat.st_mtime_ns, file_stat.st_ino)
+        cached = AscendDriverInfo._cache.get(file_path)
+        if cached is not None and cached[0] == state:
+            return cached[1]
+
+        try:
+            with open(file_path) as version_file:
+                driver_info = AscendDriverInfo.parse(file_path, version_file.read())
+        except (OSError, UnicodeDecodeError):
+            return None
+
+        AscendDriverInfo._cache[file_path] = (state, driver_info)
+        return driver_info
+
+
+class FileHelper:
+
+    @staticmethod
+    @contextmanager
+    def atomic_write(file_path, mode='w', file_mode=0o644):
+        """
+        write a temp file in the same directory and os.replace it to file_path when the block exits,
+        readers see the old file or the complete new file, never a partial one
+        """
+        dir_path = os.path.dirname(file_path) or '.'
+        fd, tmp_path = tempfile.mkstemp(prefix='.%s.' % os.path.basename(file_path), suffix='.tmp', dir=dir_path)
+        try:
+            with os.fdopen(fd, mode) as f:
+                yield f
+                f.flush()
+                os.fsync(f.fileno())
+            os.chmod(tmp_path, file_mode)
+            os.replace(tmp_path, file_path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    @staticmethod
+    @contextmanager
+    def lock(lock_path):
+        """
+        exclusive lock between processes (and threads) by fcntl.flock on lock_path
+        """
+        fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            # closing the fd releases the lock
+            os.close(fd)
+
+
+class EnvHelper:
+
+    @staticmethod
+    def get_int_env(env_name, default_value, min_value=0):
+        """
+        :return: the int value of the env, default_value if it's not set or invalid
+        """
+        env_value = os.getenv(env_name)
+        if env_value is None:
+            return default_value
+
+        try:
+            return max(int(env_value), min_value)
+        except ValueError:
+            ModelArtsLog.get_modelarts_logger().warning('invalid env %s: %s, use the default value %s',
+                                                        env_name, env_value, default_value)
+            return default_value
+
+
 class ModelArtsLog:
 
     @staticmethod
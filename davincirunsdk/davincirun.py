@@ -6,8 +6,10 @@ from davincirunsdk.common import ModelArtsLog
 from davincirunsdk.common import ModelArts
 from davincirunsdk.common import RankTableEnv
 
+from davincirunsdk.bootstrap import StagedBootstrap
 from davincirunsdk.rank_table import RankTable, RankTableV0, RankTableV1
 from davincirunsdk.sdr import RouteHelper
+from davincirunsdk.topology import Topology
 
 from davincirunsdk.manager import OpManager
 from davincirunsdk.manager import SlogdManager
@@ -17,34 +19,7 @@ from davincirunsdk.manager import BatchLogManager
 from davincirunsdk.manager import AscendVersionManager
 
 
-def main():
-    # entrypoint for console scripts
-    log = ModelArtsLog.setup_modelarts_logger()
-    SigHandler.register_sig_child_handler()
-
-    if len(sys.argv) <= 1:
-        log.error('there are not enough args')
-        sys.exit(1)
-
-    batch_log_manager = BatchLogManager()
-    batch_log_manager.run()
-
-    op_manager = OpManager()
-    return_code = op_manager.run()
-    if return_code != 0:
-        sys.exit(return_code)
-    op_manager.destroy()
-
-    AscendVersionManager.print_ascend_driver_version()
-    if not AscendVersionManager.is_atlas_c75_tr5():
-        log.info('you are advised to use ASCEND_DEVICE_ID env instead of DEVICE_ID,'
-                 ' as the DEVICE_ID env will be discarded in later versions')
-        log.info('particularly, ${ASCEND_DEVICE_ID} == ${DEVICE_ID}, it\'s the logical device id')
-
-    train_command = sys.argv[1:]
-    log.info('Davinci training command')
-    log.info(train_command)
-
+def prepare_rank_table():
     if os.environ.get(RankTableEnv.RANK_TABLE_FILE_V1) is not None:
         # notebook generated rank_table with new v1 format
         rank_table_path = os.environ.get(RankTableEnv.RANK_TABLE_FILE_V1)
@@ -57,26 +32,83 @@ def main():
         rank_table = RankTableV0(rank_table_path_origin)
 
     RankTableEnv.set_rank_table_env(rank_table.get_rank_table_path())
+    return rank_table
 
+
+def start_slogd():
     slogd_manager = SlogdManager()
     slogd_manager.run()
+    return slogd_manager
+
 
+def plan_route(rank_table):
+    """
+    :return: (current instance, the rank table of the topology)
+    """
     instance = rank_table.get_current_instance()
     server = rank_table.get_server(instance.server_id)
     # compare with instance, current_instance append rank_id in device
     current_instance = RankTable.convert_server_to_instance(server)
 
+    topology_rank_table = rank_table
     new_current_instance = RouteHelper().do_route_plan(rank_table.get_rank_table_path(), instance)
     if new_current_instance is not None:
         current_instance = new_current_instance
+        # the ranks are re-planned in the new rank table
+        topology_rank_table = RankTableV1(os.environ[RankTableEnv.RANK_TABLE_FILE])
+
+    return current_instance, topology_rank_table
+
+
+def main():
+    # entrypoint for console scripts
+    log = ModelArtsLog.setup_modelarts_logger()
+    SigHandler.register_sig_child_handler()
+
+    if len(sys.argv) <= 1:
+        log.error('there are not enough args')
+        sys.exit(1)
+
+    batch_log_manager = BatchLogManager(max_upload_bandwidth=BatchLogManager.get_max_upload_bandwidth())
+    batch_log_manager.run()
+
+    # the stages are independent except route plan, which needs the rank table
+    bootstrap = StagedBootstrap()
+    op_manager = OpManager()
+    bootstrap.add_stage('op', op_manager.run)
+    bootstrap.add_stage('rank_table', prepare_rank_table)
+    bootstrap.add_stage('slogd', start_slogd)
+    bootstrap.add_stage('route_plan', plan_route, requires=['rank_table'])
+
+    AscendVersionManager.print_ascend_driver_version()
+    if not AscendVersionManager.is_atlas_c75_tr5():
+        log.info('you are advised to use ASCEND_DEVICE_ID env instead of DEVICE_ID,'
+                 ' as the DEVICE_ID env will be discarded in later versions')
+        log.info('particularly, ${ASCEND_DEVICE_ID} == ${DEVICE_ID}, it\'s the logical device id')
+
+    train_command = sys.argv[1:]
+    log.info('Davinci training command')
+    log.info(train_command)
+
+    # the training processes need the operators installed, the slogd started and the (planned) rank table
+    return_code = bootstrap.wait('op')
+    if return_code != 0:
+        sys.exit(return_code)
+    op_manager.destroy()
+
+    bootstrap.wait('slogd')
+    rank_table = bootstrap.wait('rank_table')
+    current_instance, topology_rank_table = bootstrap.wait('route_plan')
+    bootstrap.log_timings()
 
     # TODO: delete it when new Ascend910 ModelArts Algorithms release or
     # AlgoRancher support Ascend910 v1 training mode
     # only keep special channel (data_url, train_url) in v1 format (for ModelArts Algorithm)
     ModelArts.only_keep_v1_special_channel_env()
 
-    fmk_manager = FMKManager(current_instance)
-    fmk_manager.run(rank_table.get_device_num(), train_command)
+    fmk_manager = FMKManager(current_instance, topology=Topology.from_rank_table(topology_rank_table),
+                             **FMKManager.get_log_rotation())
+    fmk_manager.run(rank_table.get_device_num(), train_command, spawn_workers=FMKManager.get_spawn_workers())
     return_code = fmk_manager.monitor()
 
     fmk_manager.destroy()
@@ -0,0 +1,146 @@
+import ctypes
+import ctypes.util
+import os
+import selectors
+import time
+
+from davincirunsdk.common import ModelArtsLog
+
+log = ModelArtsLog.get_modelarts_logger()
+
+
+class Inotify:
+    """
+    a minimal ctypes binding of linux inotify, only used to be woken up
+    """
+    IN_MODIFY = 0x00000002
+    IN_ATTRIB = 0x00000004
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+
+    _libc = None
+
+    @staticmethod
+    def get_libc():
+        if Inotify._libc is None:
+            libc = ctypes.CDLL(ctypes.util.find_library('c') or None, use_errno=True)
+            # raise AttributeError if inotify is not supported by the libc
+            libc.inotify_init1.argtypes = [ctypes.c_int]
+            libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+            Inotify._libc = libc
+        return Inotify._libc
+
+    def __init__(self, dir_path, mask):
+        libc = Inotify.get_libc()
+        self.fd = libc.inotify_init1(Inotify.IN_NONBLOCK | Inotify.IN_CLOEXEC)
+        if self.fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+
+        if libc.inotify_add_watch(self.fd, os.fsencode(dir_path), mask) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            self.fd = None
+            raise OSError(errno, os.strerror(errno), dir_path)
+
+    def drain(self):
+        try:
+            while os.read(self.fd, 4096):
+                pass
+        except BlockingIOError:
+            pass
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+class FileChangeWatcher:
+    """
+    wait for the changes of a file, which may not exist yet
+
+    the change events come from (in order of preference):
+    ---
+    inotify: watch the parent directory, so creating, atomic replacing (rename) and k8s volume updates are seen,
+             still wake up every `max_period` seconds in case the events are lost, e.g. on network file systems
+    stat: wake up every `period` seconds
+    ---
+    changed() tells whether the file is changed (size or mtime) since the last call,
+    so the caller only reads the file when needed
+    """
+    MODE_INOTIFY = 'inotify'
+    MODE_STAT = 'stat'
+
+    WATCH_MASK = (Inotify.IN_MODIFY | Inotify.IN_ATTRIB | Inotify.IN_CLOSE_WRITE | Inotify.IN_MOVED_FROM |
+                  Inotify.IN_MOVED_TO | Inotify.IN_CREATE | Inotify.IN_DELETE)
+
+    def __init__(self, file_path, period=1, max_period=10):
+        self.file_path = file_path
+        self.period = period
+        self.max_period = max(max_period, period)
+
+        self.last_state = None
+        self.inotify = None
+        self.selector = None
+
+        try:
+            self.inotify = Inotify(os.path.dirname(os.path.abspath(file_path)), FileChangeWatcher.WATCH_MASK)
+        except (OSError, AttributeError) as e:
+            log.debug('inotify is not available: %s' % e)
+            self.mode = FileChangeWatcher.MODE_STAT
+        else:
+            self.selector = selectors.DefaultSelector()
+            self.selector.register(self.inotify.fd, selectors.EVENT_READ)
+            self.mode = FileChangeWatcher.MODE_INOTIFY
+
+        log.debug('file change watcher mode: %s' % self.mode)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def get_state(self):
+        """
+        :return: (size, mtime_ns, inode), None if the file does not exist
+        """
+        try:
+            file_stat = os.stat(self.file_path)
+        except OSError:
+            return None
+        return file_stat.st_size, file_stat.st_mtime_ns, file_stat.st_ino
+
+    def changed(self):
+        state = self.get_state()
+        if state is None or state == self.last_state:
+            return False
+        self.last_state = state
+        return True
+
+    def wait(self, timeout=None):
+        """
+        block until the directory of the file has changed or timeout
+        """
+        if self.mode == FileChangeWatcher.MODE_STAT:
+            time.sleep(self.period if timeout is None else min(timeout, self.period))
+            return
+
+        timeout = self.max_period if timeout is None else min(timeout, self.max_period)
+        if self.selector.select(timeout):
+            self.inotify.drain()
+
+    def close(self):
+        if self.selector is not None:
+            self.selector.close()
+            self.selector = None
+        if self.inotify is not None:
+            self.inotify.close()
+            self.inotify = None
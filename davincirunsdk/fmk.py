@@ -1,103 +1,192 @@
 import os
 import subprocess
+import time
 import pathlib
 from contextlib import contextmanager
 
 from davincirunsdk.common import ModelArtsLog
 from davincirunsdk.common import ModelArts
-from davincirunsdk.common import BatchEnv
 from davincirunsdk.common import HwHiAiUser
-from davincirunsdk.common import OpEnv
+from davincirunsdk.common import JobContext
+from davincirunsdk.log_mux import LogMultiplexer, FdSink
 
 log = ModelArtsLog.get_modelarts_logger()
 
 
-class FMK:
-
-    def __init__(self, c75_tr5, index, device):
-        self.c75_tr5 = c75_tr5
-
-        self.job_id = ModelArts.get_job_id()
-        self.rank_id = device.rank_id
-        if not c75_tr5:
-            # logic device id after c75-tr5
-            # specially, mindspore needs logic device id in c75-tr5 and after
-            self.device_id = str(index)
-        else:
-            # physical device id in c75-tr5 (and before)
-            self.device_id = device.device_id
-
-    def gen_env_for_fmk(self, rank_size):
-        current_envs = os.environ.copy()
-        current_envs['JOB_ID'] = self.job_id
-
-        if not self.c75_tr5:
-            # import a new ASCEND_DEVICE_ID env as the logical device id after c75-tr5
-            current_envs['ASCEND_DEVICE_ID'] = self.device_id
-        # the DEVICE_ID env will be deprecated, keep it in order to be compatible with moxing and mindspore
-        # physical device id in c75-tr5 (non mindspore)
-        # logical device id after c75-tr5
-        current_envs['DEVICE_ID'] = self.device_id
+class FMKEnvTemplate:
+    """
+    the env of the training processes, computed once per launch
+
+    ---
+    envs: os.environ + the env shared by all the ranks (JOB_ID, RANK_SIZE, the diag mode env, ...)
+    overlay: the env of a rank (RANK_ID, DEVICE_ID, the log paths, ...), see get_overlay()
+    ---
+    the env of a rank = envs + overlay, diff() tells the difference of an env from the template
+    """
+
+    def __init__(self, rank_size, log_dir, job_id=None, base_envs=None):
+        self.base_envs = os.environ.copy() if base_envs is None else dict(base_envs)
+        self.rank_size = rank_size
+        self.log_dir = log_dir
+        # the job env of the launch, not the env of the davincirun process
+        self.job_context = JobContext.current(self.base_envs)
+        self.job_id = job_id or self.job_context.job_id
+
+        self.diag_mode = self.base_envs.get('MA_DIAG_MODE_ENV', '')
+        self.envs = self.base_envs.copy()
+        self.gen_shared_envs(self.envs)
+
+    def set_env_if_not_exist(self, envs, env_name, env_value, verbose=True):
+        if env_name in self.base_envs:
+            if verbose:
+                log.info('env already exists. env_name: %s, env_value: %s ' % (env_name, env_value))
+            return
+        envs[env_name] = env_value
 
-        current_envs['RANK_ID'] = self.rank_id
-        current_envs['RANK_SIZE'] = str(rank_size)
+    def gen_shared_envs(self, envs):
+        envs['JOB_ID'] = self.job_id
+        envs['RANK_SIZE'] = str(self.rank_size)
 
-        FMK.set_env_if_not_exist(current_envs, HwHiAiUser.HCCL_CONNECT_TIMEOUT, str(1800))  # 30min
+        self.set_env_if_not_exist(envs, HwHiAiUser.HCCL_CONNECT_TIMEOUT, str(1800))  # 30min
 
-        if OpEnv.ide_mode():
-            current_envs['SLOG_PRINT_TO_STDOUT'] = '1'
+        if self.job_context.ide_mode:
+            envs['SLOG_PRINT_TO_STDOUT'] = '1'
 
-        self.gen_diag_mode_env(current_envs)
+        self.gen_diag_mode_env(envs)
 
-        return current_envs
+        # the log paths set by the user are shared by the ranks, make them once
+        shared_log_env_names = ['ASCEND_PROCESS_LOG_PATH']
+        if self.diag_mode == 'faults':
+            # NPU_COLLECT_PATH is only used to collect the faults
+            shared_log_env_names.append('NPU_COLLECT_PATH')
+        for env_name in shared_log_env_names:
+            if env_name in self.base_envs:
+                self.make_log_dirs(env_name, self.base_envs[env_name])
 
-    def gen_diag_mode_env(self, current_envs):
-        log_dir = FMK.get_log_dir()
-        process_log_path = os.path.join(log_dir, self.job_id, 'ascend', 'process_log', 'rank_' + self.rank_id)
-        FMK.set_env_if_not_exist(current_envs, 'ASCEND_PROCESS_LOG_PATH', process_log_path)
-        pathlib.Path(current_envs['ASCEND_PROCESS_LOG_PATH']).mkdir(parents=True, exist_ok=True)
-        diag_mode = current_envs.get('MA_DIAG_MODE_ENV', '')
-        run_mode = current_envs.get('MA_RUN_MODE_ENV', '')
-        engine_version = current_envs.get("MA_ENGINE_VERSION", '')
+    def gen_diag_mode_env(self, envs):
+        log_dir = self.log_dir
+        run_mode = self.base_envs.get('MA_RUN_MODE_ENV', '')
+        engine_version = self.base_envs.get("MA_ENGINE_VERSION", '')
         glog_dir = ms_rdr_path = ms_om_path = os.path.join(log_dir, self.job_id, 'mindspore', 'log')
-        if diag_mode == 'faults':
-            FMK.set_env_if_not_exist(current_envs, 'PRINT_MODEL', str(1))
-            FMK.set_env_if_not_exist(current_envs, 'DUMP_GE_GRAPH', str(2))
-            FMK.set_env_if_not_exist(current_envs, 'DUMP_GRAPH_LEVEL', str(2))
-            FMK.set_env_if_not_exist(current_envs, 'ASCEND_GLOBAL_LOG_LEVEL', str(1))
-            FMK.set_env_if_not_exist(current_envs, 'ASCEND_HOST_LOG_FILE_NUM', str(1000))
-
-            npu_collect_path = os.path.join(log_dir, self.job_id, 'ascend', 'npu_collect', 'rank_' + self.rank_id)
-            FMK.set_env_if_not_exist(current_envs, 'NPU_COLLECT_PATH', npu_collect_path)
-            pathlib.Path(os.path.join(current_envs['NPU_COLLECT_PATH'], 'extra-info', 'graph')).mkdir(parents=True, exist_ok=True)
+        if self.diag_mode == 'faults':
+            self.set_env_if_not_exist(envs, 'PRINT_MODEL', str(1))
+            self.set_env_if_not_exist(envs, 'DUMP_GE_GRAPH', str(2))
+            self.set_env_if_not_exist(envs, 'DUMP_GRAPH_LEVEL', str(2))
+            self.set_env_if_not_exist(envs, 'ASCEND_GLOBAL_LOG_LEVEL', str(1))
+            self.set_env_if_not_exist(envs, 'ASCEND_HOST_LOG_FILE_NUM', str(1000))
 
             framework_name_version = next(iter(engine_version.split('-')[0:1]), '')
             framework_version = next(iter(framework_name_version.split('_')[1:2]), '')
             if HwHiAiUser.MINDSPORE_FRAMEWORK_NAME in framework_name_version and HwHiAiUser.MINDSPORE_FRAMEWORK_FAULTS_DIAG_VERSION <= framework_version:
-                FMK.set_env_if_not_exist(current_envs, 'GLOG_v', str(1))
-                FMK.set_env_if_not_exist(current_envs, 'GLOG_log_dir', glog_dir)
-                FMK.set_env_if_not_exist(current_envs, 'GLOG_logtostderr', str(0))
-                FMK.set_env_if_not_exist(current_envs, 'MS_RDR_ENABLE', str(1))
-                FMK.set_env_if_not_exist(current_envs, 'MS_RDR_PATH', ms_rdr_path)
-                FMK.set_env_if_not_exist(current_envs, 'MS_OM_PATH', ms_om_path)
-
-        elif diag_mode == 'accuracy' or diag_mode == 'profile':
+                self.set_env_if_not_exist(envs, 'GLOG_v', str(1))
+                self.set_env_if_not_exist(envs, 'GLOG_log_dir', glog_dir)
+                self.set_env_if_not_exist(envs, 'GLOG_logtostderr', str(0))
+                self.set_env_if_not_exist(envs, 'MS_RDR_ENABLE', str(1))
+                self.set_env_if_not_exist(envs, 'MS_RDR_PATH', ms_rdr_path)
+                self.set_env_if_not_exist(envs, 'MS_OM_PATH', ms_om_path)
+
+        elif self.diag_mode == 'accuracy' or self.diag_mode == 'profile':
             diag_data_path = os.path.join(log_dir, self.job_id, 'mindspore', 'diagnostic_data')
-            FMK.set_env_if_not_exist(current_envs, 'MS_DIAGNOSTIC_DATA_PATH', diag_data_path)
+            self.set_env_if_not_exist(envs, 'MS_DIAGNOSTIC_DATA_PATH', diag_data_path)
 
         elif run_mode == 'performance':
-            FMK.set_env_if_not_exist(current_envs, 'ASCEND_GLOBAL_LOG_LEVEL', str(3))
-            FMK.set_env_if_not_exist(current_envs, 'ASCEND_GLOBAL_EVENT_LEVEL', str(0))
-            FMK.set_env_if_not_exist(current_envs, 'GLOG_v', str(3))
-            FMK.set_env_if_not_exist(current_envs, 'GLOG_log_dir', glog_dir)
-            FMK.set_env_if_not_exist(current_envs, 'GLOG_logtostderr', str(0))
-            FMK.set_env_if_not_exist(current_envs, 'MS_OM_PATH', ms_om_path)
+            self.set_env_if_not_exist(envs, 'ASCEND_GLOBAL_LOG_LEVEL', str(3))
+            self.set_env_if_not_exist(envs, 'ASCEND_GLOBAL_EVENT_LEVEL', str(0))
+            self.set_env_if_not_exist(envs, 'GLOG_v', str(3))
+            self.set_env_if_not_exist(envs, 'GLOG_log_dir', glog_dir)
+            self.set_env_if_not_exist(envs, 'GLOG_logtostderr', str(0))
+            self.set_env_if_not_exist(envs, 'MS_OM_PATH', ms_om_path)
 
         elif run_mode == 'normal':
-            FMK.set_env_if_not_exist(current_envs, 'GLOG_v', str(1))
-            FMK.set_env_if_not_exist(current_envs, 'GLOG_log_dir', glog_dir)
-            FMK.set_env_if_not_exist(current_envs, 'GLOG_logtostderr', str(0))
-            FMK.set_env_if_not_exist(current_envs, 'MS_OM_PATH', ms_om_path)
+            self.set_env_if_not_exist(envs, 'GLOG_v', str(1))
+            self.set_env_if_not_exist(envs, 'GLOG_log_dir', glog_dir)
+            self.set_env_if_not_exist(envs, 'GLOG_logtostderr', str(0))
+            self.set_env_if_not_exist(envs, 'MS_OM_PATH', ms_om_path)
+
+    @staticmethod
+    def make_log_dirs(env_name, path):
+        if env_name == 'NPU_COLLECT_PATH':
+            pathlib.Path(os.path.join(path, 'extra-info', 'graph')).mkdir(parents=True, exist_ok=True)
+        else:
+            pathlib.Path(path).mkdir(parents=True, exist_ok=True)
+
+    def get_overlay(self, rank_id, device_id, c75_tr5):
+        """
+        :return: the env of the rank on top of the template
+        """
+        overlay = {}
+        if not c75_tr5:
+            # import a new ASCEND_DEVICE_ID env as the logical device id after c75-tr5
+            overlay['ASCEND_DEVICE_ID'] = device_id
+        # the DEVICE_ID env will be deprecated, keep it in order to be compatible with moxing and mindspore
+        # physical device id in c75-tr5 (non mindspore)
+        # logical device id after c75-tr5
+        overlay['DEVICE_ID'] = device_id
+        overlay['RANK_ID'] = rank_id
+
+        rank_log_paths = [
+            ('ASCEND_PROCESS_LOG_PATH', os.path.join(self.log_dir, self.job_id, 'ascend', 'process_log',
+                                                     'rank_' + rank_id))
+        ]
+        if self.diag_mode == 'faults':
+            rank_log_paths.append(('NPU_COLLECT_PATH', os.path.join(self.log_dir, self.job_id, 'ascend',
+                                                                    'npu_collect', 'rank_' + rank_id)))
+        for env_name, path in rank_log_paths:
+            if env_name not in self.base_envs:
+                overlay[env_name] = path
+                self.make_log_dirs(env_name, path)
+
+        return overlay
+
+    def get_envs(self, overlay):
+        envs = self.envs.copy()
+        envs.update(overlay)
+        return envs
+
+    def diff(self, envs):
+        """
+        :return: {env_name: env_value} of the env which is added or changed against the template
+        """
+        return {env_name: env_value for env_name, env_value in envs.items() if self.envs.get(env_name) != env_value}
+
+
+class FMK:
+
+    def __init__(self, c75_tr5, index, device, topology=None):
+        self.c75_tr5 = c75_tr5
+        # Topology of the rank table, shared by the ranks
+        self.topology = topology
+
+        self.job_id = JobContext.current().job_id
+        self.rank_id = device.rank_id
+        if not c75_tr5:
+            # logic device id after c75-tr5
+            # specially, mindspore needs logic device id in c75-tr5 and after
+            self.device_id = str(index)
+        else:
+            # physical device id in c75-tr5 (and before)
+            self.device_id = device.device_id
+
+        # seconds from the beginning of run() to the training process spawned
+        self.spawn_latency = None
+        # the env of the rank on top of FMKEnvTemplate
+        self.env_overlay = None
+
+    def gen_env_overlay(self, env_template):
+        overlay = env_template.get_overlay(self.rank_id, self.device_id, self.c75_tr5)
+        if self.topology is not None:
+            for env_name, env_value in self.topology.get_envs(self.rank_id).items():
+                env_template.set_env_if_not_exist(overlay, env_name, env_value, verbose=False)
+        return overlay
+
+    def gen_env_for_fmk(self, rank_size, env_template=None):
+        """
+        :param env_template: FMKEnvTemplate shared by the ranks, computed here if None
+        """
+        if env_template is None:
+            env_template = FMKEnvTemplate(rank_size, FMK.get_log_dir(), self.job_id)
+        self.env_overlay = self.gen_env_overlay(env_template)
+        return env_template.get_envs(self.env_overlay)
 
     @contextmanager
     def switch_directory(self, directory):
@@ -114,11 +203,12 @@ class FMK:
 
     @staticmethod
     def get_log_dir():
-        batch_log_path = os.getenv(BatchEnv.BATCH_TASK_LOG_PATH)
+        job_context = JobContext.current()
+        batch_log_path = job_context.batch_log_path
         if batch_log_path and os.path.exists(batch_log_path):
             return batch_log_path
 
-        modelarts_mount_path = os.getenv(ModelArts.MA_MOUNT_PATH_ENV)
+        modelarts_mount_path = job_context.mount_path
         if modelarts_mount_path:
             modelarts_log_path = os.path.join(modelarts_mount_path, 'log')
             if os.path.exists(modelarts_log_path):
@@ -126,47 +216,47 @@ class FMK:
 
         return ModelArts.tmp_log_dir
 
-    @staticmethod
-    def set_env_if_not_exist(envs, env_name, env_value):
-        if env_name in os.environ:
-            log.info('env already exists. env_name: %s, env_value: %s ' % (env_name, env_value))
-            return
-        envs[env_name] = env_value
-
-    def run(self, rank_size, command):
-        envs = self.gen_env_for_fmk(rank_size)
+    def run(self, rank_size, command, log_mux=None, env_template=None):
+        start_time = time.time()
+        envs = self.gen_env_for_fmk(rank_size, env_template)
         log.info('bootstrap proc-rank-%s-device-%s' % (self.rank_id, self.device_id))
 
         working_dir = self.get_working_dir()
         if not os.path.exists(working_dir):
-            os.makedirs(working_dir)
+            os.makedirs(working_dir, exist_ok=True)
 
         log_dir = FMK.get_log_dir()
         if not os.path.exists(log_dir):
-            os.makedirs(log_dir)
+            os.makedirs(log_dir, exist_ok=True)
 
+        # ranks may be spawned concurrently, use `cwd` instead of the process-global chdir
+        # start_new_session: change the process(forked) group id to itself, same as os.setsid
         if self.c75_tr5:
-            with self.switch_directory(working_dir):
-                return subprocess.Popen(command, env=envs, preexec_fn=os.setsid)
+            training_proc = subprocess.Popen(command, env=envs, cwd=working_dir, start_new_session=True)
+            self.spawn_latency = time.time() - start_time
+            return training_proc
 
-        # we `tee` a proc log of each training processes after c75-tr5
+        # we split a proc log of each training processes after c75-tr5
 
         # AOM collect (*.trace | *.log | *.out) log file
         # let log_file end with .txt, avoid AOM collect it
         log_file = '%s-proc-rank-%s-device-%s.txt' % (self.job_id, self.rank_id, self.device_id)
         log_file_path = os.path.join(log_dir, log_file)
+        # the same outputs as `tee`: the proc log file and the stdout (fd 1) of the launcher
+        log_mux = log_mux or LogMultiplexer.default()
+        log_sinks = [log_mux.file_sink(log_file_path), FdSink(1)]
 
-        with self.switch_directory(working_dir):
-            # os.setsid: change the process(forked) group id to itself
-            training_proc = subprocess.Popen(command, env=envs, preexec_fn=os.setsid,
-                                             stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        training_proc = subprocess.Popen(command, env=envs, cwd=working_dir, start_new_session=True,
+                                         stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        self.spawn_latency = time.time() - start_time
 
-            log.info('proc-rank-%s-device-%s (pid: %d)', self.rank_id, self.device_id, training_proc.pid)
+        log.info('proc-rank-%s-device-%s (pid: %d)', self.rank_id, self.device_id, training_proc.pid)
 
-            # https://docs.python.org/3/library/subprocess.html#subprocess.Popen.wait
-            # modelarts_pipe_cmd should consume the stdout in time and avoid proc deadlock
-            # and currently, we use `tee` instead of `modelarts-pipe`, as the modelarts-pipe requires singleton
-            # TODO: limit the splitting log file size < 1GB
-            subprocess.Popen([ModelArts.modelarts_pipe_cmd, log_file_path], stdin=training_proc.stdout)
+        # https://docs.python.org/3/library/subprocess.html#subprocess.Popen.wait
+        # the log multiplexer should consume the stdout in time and avoid proc deadlock
+        # it reads the pipes of all ranks in one thread, instead of a `tee` process for each rank
+        # the proc log files are rotated by the size cap of log_mux
+        log_mux.add_source(training_proc.stdout, log_sinks,
+                           name='proc-rank-%s-device-%s' % (self.rank_id, self.device_id))
 
-            return training_proc
+        return training_proc
@@ -0,0 +1,462 @@
+import codecs
+import gzip
+import os
+import queue
+import shutil
+import selectors
+import sys
+import threading
+import time
+
+from davincirunsdk.common import ModelArtsLog
+
+log = ModelArtsLog.get_modelarts_logger()
+
+
+def write_all(fd, data):
+    view = memoryview(data)
+    while view:
+        written = os.write(fd, view)
+        view = view[written:]
+
+
+class FileSink:
+    """
+    write the log into a file, truncated at open (the same as `tee`)
+    """
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.fd = os.open(file_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o640)
+
+    def write(self, data):
+        write_all(self.fd, data)
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+class SegmentCompressor:
+    """
+    compress the rotated segments of all the RotatingFileSinks in one background thread, in rotation order
+    """
+    _default = None
+    _default_lock = threading.Lock()
+
+    def __init__(self):
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    @classmethod
+    def default(cls):
+        with cls._default_lock:
+            if cls._default is None:
+                cls._default = cls()
+            return cls._default
+
+    def submit(self, sink, pending_path):
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.loop, name='log-compressor', daemon=True)
+                self.thread.start()
+        self.queue.put((sink, pending_path))
+
+    def loop(self):
+        while True:
+            sink, pending_path = self.queue.get()
+            sink.finish_segment(pending_path)
+
+
+class RotatingFileSink(FileSink):
+    """
+    FileSink with a size cap
+
+    rotated segments keep the name of the log file as the prefix:
+    ---
+    ${file}: the current segment
+    ${file}.1[.gz]: the latest closed segment
+    ...
+    ${file}.${backup_count}[.gz]: the oldest closed segment, dropped at the next rotation
+    ---
+    e.g. xxx-proc-rank-0-device-0.txt.1.gz, which still avoids AOM collecting (*.trace | *.log | *.out)
+
+    with compress, the closed segment is only renamed to ${file}.pending-${n} by the writer,
+    SegmentCompressor compresses it and shifts the segments in the background
+    """
+
+    def __init__(self, file_path, max_bytes=0, backup_count=0, compress=False):
+        if max_bytes > 0 and backup_count < 1:
+            # the log would be thrown away at every rotation
+            raise ValueError('backup_count must be at least 1 when max_bytes is set')
+
+        super().__init__(file_path)
+        # 0: no limit
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.compress = compress
+
+        self.size = 0
+        self.rotation_count = 0
+        # the segments waiting for SegmentCompressor
+        self.pending_segments = 0
+        self.pending_changed = threading.Condition()
+
+    def write(self, data):
+        if self.max_bytes > 0 and self.size > 0 and self.size + len(data) > self.max_bytes:
+            self.rotate()
+
+        super().write(data)
+        self.size += len(data)
+
+    def get_segment_path(self, index):
+        segment_path = '%s.%d' % (self.file_path, index)
+        if self.compress:
+            segment_path += '.gz'
+        return segment_path
+
+    def shift_segments(self):
+        for index in range(self.backup_count - 1, 0, -1):
+            segment_path = self.get_segment_path(index)
+            if os.path.exists(segment_path):
+                os.replace(segment_path, self.get_segment_path(index + 1))
+
+    def rotate(self):
+        os.close(self.fd)
+
+        if self.compress:
+            # do not block the multiplexer, or the training processes will be blocked by the full pipes
+            self.rotation_count += 1
+            pending_path = '%s.pending-%d' % (self.file_path, self.rotation_count)
+            os.replace(self.file_path, pending_path)
+            with self.pending_changed:
+                self.pending_segments += 1
+            SegmentCompressor.default().submit(self, pending_path)
+        else:
+            self.shift_segments()
+            os.replace(self.file_path, self.get_segment_path(1))
+
+        self.fd = os.open(self.file_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o640)
+        self.size = 0
+
+    def finish_segment(self, pending_path):
+        """
+        called by SegmentCompressor
+        """
+        try:
+            with self.pending_changed:
+                dropped = self.pending_segments > self.backup_count
+            if dropped:
+                # the newer pending segments will push it out anyway
+                os.remove(pending_path)
+                return
+
+            gz_tmp_path = pending_path + '.gz.tmp'
+            with open(pending_path, 'rb') as segment_file, gzip.open(gz_tmp_path, 'wb') as gz_file:
+                shutil.copyfileobj(segment_file, gz_file, 1 << 20)
+            self.shift_segments()
+            os.replace(gz_tmp_path, self.get_segment_path(1))
+            os.remove(pending_path)
+        except OSError as e:
+            log.error('compress log segment %s failed: %s', pending_path, e)
+        finally:
+            with self.pending_changed:
+                self.pending_segments -= 1
+                self.pending_changed.notify_all()
+
+    def wait_compressed(self, timeout=None):
+        """
+        :return: False if there are still segments to compress after timeout
+        """
+        with self.pending_changed:
+            return self.pending_changed.wait_for(lambda: self.pending_segments == 0, timeout)
+
+    def close(self):
+        super().close()
+        self.wait_compressed()
+
+
+class FdSink:
+    """
+    write the log into an inherited fd, e.g. 1 for the stdout of the launcher
+    """
+
+    def __init__(self, fd):
+        self.fd = fd
+
+    def write(self, data):
+        write_all(self.fd, data)
+
+    def close(self):
+        # the fd is not owned by the sink
+        pass
+
+
+class PrefixLineSink:
+    """
+    print the log line by line with a prefix, e.g. into the notebook
+    """
+
+    def __init__(self, prefix, stream=None):
+        self.prefix = prefix
+        self.stream = stream
+        self.decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        self.partial_line = ''
+
+    def write(self, data):
+        lines = (self.partial_line + self.decoder.decode(data)).split('\n')
+        self.partial_line = lines.pop()
+        self.print_lines([line + '\n' for line in lines])
+
+    def print_lines(self, lines):
+        if not lines:
+            return
+
+        # sys.stdout may be replaced (e.g. by ipykernel), look it up every time
+        stream = self.stream or sys.stdout
+        stream.write(''.join('%s: %s' % (self.prefix, line) for line in lines))
+        stream.flush()
+
+    def close(self):
+        remain = self.partial_line + self.decoder.decode(b'', final=True)
+        self.partial_line = ''
+        if remain:
+            self.print_lines([remain + '\n'])
+
+
+class LogSource:
+    def __init__(self, pipe, sinks, name):
+        self.pipe = pipe
+        self.fd = pipe.fileno()
+        self.sinks = sinks
+        self.name = name
+        self.closed = threading.Event()
+
+    def dispatch(self, data):
+        for sink in list(self.sinks):
+            try:
+                sink.write(data)
+            except Exception as e:
+                # one broken sink should not stop the others, or the training process will be blocked
+                log.error('write log of %s to %s failed: %s', self.name, type(sink).__name__, e)
+                self.sinks.remove(sink)
+                self.close_sink(sink)
+
+    def close(self):
+        for sink in self.sinks:
+            self.close_sink(sink)
+        self.sinks = []
+        self.pipe.close()
+        self.closed.set()
+
+    def close_sink(self, sink):
+        try:
+            sink.close()
+        except Exception as e:
+            log.error('close log sink %s of %s failed: %s', type(sink).__name__, self.name, e)
+
+
+class LogMultiplexer:
+    """
+    read the stdout pipes of all ranks in one thread and fan out to the sinks
+
+    replace a `tee` (and a `tail -f` in notebook) process of each rank,
+    the thread exits when all the pipes are closed and restarts when a new pipe is added,
+    the wakeup pipe of the thread lives as long as the thread, so nothing is left open without close()
+    """
+    READ_SIZE = 1 << 16
+
+    # rotation of the proc log files, limit the splitting log file size < 1GB
+    DEFAULT_MAX_BYTES = 1 << 30
+    DEFAULT_BACKUP_COUNT = 4
+
+    _default = None
+    _default_lock = threading.Lock()
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, backup_count=DEFAULT_BACKUP_COUNT, compress=False):
+        if max_bytes > 0 and backup_count < 1:
+            raise ValueError('backup_count must be at least 1 when max_bytes is set')
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.compress = compress
+
+        self.lock = threading.Lock()
+        self.thread = None
+        self.sources = {}
+        self.pending_sources = []
+        self.stopping = False
+        self.closed = False
+
+        # opened when the thread starts, closed by the thread when it exits
+        self.wakeup_r = None
+        self.wakeup_w = None
+
+    @classmethod
+    def default(cls):
+        with cls._default_lock:
+            if cls._default is None:
+                cls._default = cls()
+            return cls._default
+
+    def file_sink(self, file_path):
+        """
+        a file sink with the rotation policy of the multiplexer
+        """
+        return RotatingFileSink(file_path, self.max_bytes, self.backup_count, self.compress)
+
+    def add_source(self, pipe, sinks, name=None):
+        """
+        :param pipe: readable binary pipe, e.g. Popen.stdout, owned by the multiplexer from now on
+        :param sinks: [FileSink, FdSink, PrefixLineSink, ...]
+        """
+        os.set_blocking(pipe.fileno(), False)
+        source = LogSource(pipe, list(sinks), name or 'fd %d' % pipe.fileno())
+
+        with self.lock:
+            if self.closed:
+                raise RuntimeError('log multiplexer is closed')
+
+            self.sources[pipe] = source
+            self.pending_sources.append(source)
+            if self.thread is None:
+                self.stopping = False
+                self.wakeup_r, self.wakeup_w = os.pipe()
+                os.set_blocking(self.wakeup_r, False)
+                os.set_blocking(self.wakeup_w, False)
+                self.thread = threading.Thread(target=self.loop, args=(self.wakeup_r, self.wakeup_w),
+                                               name='log-mux', daemon=True)
+                self.thread.start()
+            else:
+                self.wakeup()
+
+        return source
+
+    def wakeup(self):
+        # called with self.lock held
+        if self.wakeup_w is None:
+            return
+        try:
+            os.write(self.wakeup_w, b'\0')
+        except BlockingIOError:
+            pass
+
+    @staticmethod
+    def drain_wakeup_pipe(wakeup_r):
+        try:
+            while os.read(wakeup_r, 512):
+                pass
+        except BlockingIOError:
+            pass
+
+    def register_pending_sources(self, selector):
+        with self.lock:
+            pending_sources, self.pending_sources = self.pending_sources, []
+
+        for source in pending_sources:
+            selector.register(source.fd, selectors.EVENT_READ, source)
+
+    def read_source(self, selector, source):
+        try:
+            data = os.read(source.fd, LogMultiplexer.READ_SIZE)
+        except BlockingIOError:
+            return
+        except OSError as e:
+            log.error('read log of %s failed: %s', source.name, e)
+            data = b''
+
+        if data:
+            source.dispatch(data)
+            return
+
+        # EOF, all the writers of the pipe have exited
+        self.close_source(selector, source)
+
+    def close_source(self, selector, source):
+        selector.unregister(source.fd)
+        with self.lock:
+            self.sources.pop(source.pipe, None)
+        source.close()
+
+    def detach_thread(self, wakeup_r):
+        # called with self.lock held, a new thread (and wakeup pipe) is started by the next add_source()
+        if self.wakeup_r == wakeup_r:
+            self.thread = None
+            self.wakeup_r = self.wakeup_w = None
+
+    def should_exit(self, wakeup_r):
+        with self.lock:
+            if self.stopping or (not self.sources and not self.pending_sources):
+                self.detach_thread(wakeup_r)
+                return True
+        return False
+
+    def loop(self, wakeup_r, wakeup_w):
+        selector = selectors.DefaultSelector()
+        selector.register(wakeup_r, selectors.EVENT_READ)
+        try:
+            while True:
+                self.register_pending_sources(selector)
+                if self.should_exit(wakeup_r):
+                    break
+
+                for key, _ in selector.select():
+                    if key.fd == wakeup_r:
+                        LogMultiplexer.drain_wakeup_pipe(wakeup_r)
+                    else:
+                        self.read_source(selector, key.data)
+        finally:
+            # stopped by close(), the rest of the pipes are left unread
+            for key in list(selector.get_map().values()):
+                if key.fd != wakeup_r:
+                    self.close_source(selector, key.data)
+            selector.close()
+
+            with self.lock:
+                self.detach_thread(wakeup_r)
+            os.close(wakeup_r)
+            os.close(wakeup_w)
+
+    def wait_closed(self, pipe, timeout=None):
+        """
+        wait until all the log of the pipe has been written to the sinks
+
+        :return: False if timeout
+        """
+        with self.lock:
+            source = self.sources.get(pipe)
+        if source is None:
+            return True
+        return source.closed.wait(timeout)
+
+    def close(self, timeout=None):
+        """
+        wait for all the pipes closed (EOF), at most `timeout` seconds, then stop the thread
+        calling it again does nothing
+        """
+        with self.lock:
+            if self.closed:
+                return
+
+        deadline = None if timeout is None else time.time() + timeout
+        with self.lock:
+            sources = list(self.sources.values())
+        for source in sources:
+            remain_time = None if deadline is None else max(deadline - time.time(), 0)
+            if not source.closed.wait(remain_time):
+                log.warning('log of %s is not finished in %s seconds', source.name, timeout)
+                break
+
+        with self.lock:
+            if self.closed:
+                # closed by another thread in the meantime
+                return
+            thread = self.thread
+            self.stopping = True
+            self.closed = True
+            self.wakeup()
+
+        # the thread closes its wakeup pipe on exit
+        if thread is not None:
+            thread.join()
@@ -0,0 +1,273 @@
+import os
+import time
+
+from davincirunsdk.common import ModelArts
+from davincirunsdk.common import ModelArtsLog
+
+log = ModelArtsLog.get_modelarts_logger()
+
+
+class ObsAppendBackend:
+    """
+    ship the new bytes of the log to an appendable object of OBS
+    the object is complete after every append, nothing to stitch
+    """
+
+    def __init__(self, mox=None):
+        self.mox = mox or ModelArts.import_moxing()
+
+    def write(self, remote_url, offset, data):
+        mox = self.mox
+        if offset == 0 and mox.file.exists(remote_url):
+            # the local log is uploaded from the beginning, e.g. truncated
+            mox.file.remove(remote_url, recursive=False)
+        mox.file.append(remote_url, data, binary=True)
+
+    def finalize(self, remote_url):
+        pass
+
+
+class LocalPartBackend:
+    """
+    stand-in of OBS, the remote url is a local file path
+
+    the new bytes are shipped as part files (${remote_url}.parts/${offset}),
+    and stitched to the remote file when there are `compact_parts` parts or at finalize
+    """
+
+    def __init__(self, compact_parts=16):
+        self.compact_parts = compact_parts
+
+    @staticmethod
+    def get_parts_dir(remote_url):
+        return remote_url + '.parts'
+
+    def write(self, remote_url, offset, data):
+        parts_dir = LocalPartBackend.get_parts_dir(remote_url)
+        if offset == 0:
+            self.reset(remote_url)
+        os.makedirs(parts_dir, exist_ok=True)
+
+        part_path = os.path.join(parts_dir, '%020d' % offset)
+        with open(part_path + '.tmp', 'wb') as part_file:
+            part_file.write(data)
+        os.replace(part_path + '.tmp', part_path)
+
+        if len(os.listdir(parts_dir)) >= self.compact_parts:
+            self.compact(remote_url)
+
+    @staticmethod
+    def reset(remote_url):
+        parts_dir = LocalPartBackend.get_parts_dir(remote_url)
+        if os.path.isdir(parts_dir):
+            for part_name in os.listdir(parts_dir):
+                os.remove(os.path.join(parts_dir, part_name))
+        if os.path.exists(remote_url):
+            os.remove(remote_url)
+
+    @staticmethod
+    def compact(remote_url):
+        parts_dir = LocalPartBackend.get_parts_dir(remote_url)
+        if not os.path.isdir(parts_dir):
+            return
+
+        # offsets are zero-padded, the name order is the offset order
+        part_names = sorted(part_name for part_name in os.listdir(parts_dir) if not part_name.endswith('.tmp'))
+        with open(remote_url, 'ab') as remote_file:
+            for part_name in part_names:
+                part_path = os.path.join(parts_dir, part_name)
+                with open(part_path, 'rb') as part_file:
+                    remote_file.write(part_file.read())
+                os.remove(part_path)
+
+    def finalize(self, remote_url):
+        self.compact(remote_url)
+
+
+class IncrementalLogUploader:
+    """
+    upload a growing log file by shipping the bytes after the last uploaded offset
+
+    the backend should provide:
+    ---
+    write(remote_url, offset, data): ship `data` at `offset` of the remote log, offset 0 starts a new log
+    finalize(remote_url): stitch or compact the shipped parts
+    ---
+    """
+    # max bytes shipped by one backend.write
+    PART_SIZE = 64 << 20
+
+    def __init__(self, local_path, remote_url, backend, part_size=PART_SIZE, limiter=None):
+        self.local_path = local_path
+        self.remote_url = remote_url
+        self.backend = backend
+        self.part_size = part_size
+        # BandwidthLimiter
+        self.limiter = limiter
+
+        # bytes of the local log have been uploaded
+        self.offset = 0
+
+    def upload(self):
+        """
+        :return: bytes uploaded this time
+        """
+        if self.backend is None:
+            return 0
+
+        size = os.path.getsize(self.local_path)
+        if size < self.offset:
+            log.warning('%s is truncated (%d < %d), upload it from the beginning',
+                        self.local_path, size, self.offset)
+            self.offset = 0
+
+        part_size = self.part_size
+        if self.limiter is not None and self.limiter.enabled():
+            # smaller parts, smoother throttling
+            part_size = max(min(part_size, self.limiter.max_bytes_per_second), 1)
+
+        uploaded_size = 0
+        with open(self.local_path, 'rb') as local_file:
+            local_file.seek(self.offset)
+            while self.offset < size:
+                data = local_file.read(min(part_size, size - self.offset))
+                if not data:
+                    break
+
+                self.backend.write(self.remote_url, self.offset, data)
+                self.offset += len(data)
+                uploaded_size += len(data)
+
+                if self.limiter is not None:
+                    self.limiter.consume(len(data))
+
+        return uploaded_size
+
+    def finalize(self):
+        uploaded_size = self.upload()
+        if self.backend is not None:
+            self.backend.finalize(self.remote_url)
+        return uploaded_size
+
+    @staticmethod
+    def get_default_backend():
+        # nothing to upload without moxing
+        mox = ModelArts.import_moxing()
+        return None if mox is None else ObsAppendBackend(mox)
+
+
+class BandwidthLimiter:
+    """
+    cap the average upload bandwidth by sleeping after each part
+
+    the sleeping is broken and the cap is lifted once `ticker` is set,
+    so that the final upload at exit is not throttled
+    """
+
+    def __init__(self, max_bytes_per_second, ticker=None):
+        # 0: no limit
+        self.max_bytes_per_second = max_bytes_per_second
+        self.ticker = ticker
+
+        self.window_start_time = None
+        self.window_bytes = 0
+
+    def enabled(self):
+        if self.max_bytes_per_second <= 0:
+            return False
+        return self.ticker is None or not self.ticker.is_set()
+
+    def consume(self, size):
+        if not self.enabled():
+            return
+
+        now = time.time()
+        if self.window_start_time is None or now - self.window_start_time > 1:
+            # only the recent burst is taken into account
+            self.window_start_time = now
+            self.window_bytes = 0
+        self.window_bytes += size
+
+        delay = self.window_bytes / self.max_bytes_per_second - (now - self.window_start_time)
+        if delay <= 0:
+            return
+
+        if self.ticker is not None:
+            self.ticker.wait(delay)
+        else:
+            time.sleep(delay)
+
+
+class AdaptiveUploadScheduler:
+    """
+    decide when to upload the log next time
+
+    ---
+    skip: the log file is not changed (size and mtime) since the last upload
+    stretch: an upload should not take more than `max_duty_cycle` of the interval,
+             so slow uploads do not pile up against the training I/O
+    shrink: when the log grows fast, upload more often to keep each upload about `target_upload_size`
+    ---
+    the interval is always within [min_interval, max_interval]
+    """
+    # weight of the latest measurement in the moving averages
+    SMOOTHING = 0.3
+
+    def __init__(self, base_interval=30, min_interval=5, max_interval=300, max_duty_cycle=0.1,
+                 target_upload_size=16 << 20):
+        self.base_interval = base_interval
+        self.min_interval = min(min_interval, base_interval)
+        self.max_interval = max(max_interval, base_interval)
+        self.max_duty_cycle = max_duty_cycle
+        self.target_upload_size = target_upload_size
+
+        self.interval = base_interval
+
+        # moving averages, seconds per upload and bytes per second
+        self.upload_time = None
+        self.growth_rate = None
+
+        # (size, mtime_ns) of the log file at the last upload
+        self.last_file_state = None
+        self.last_upload_end_time = None
+
+    @staticmethod
+    def get_file_state(file_path):
+        try:
+            file_stat = os.stat(file_path)
+        except OSError:
+            return None
+        return file_stat.st_size, file_stat.st_mtime_ns
+
+    def should_upload(self, file_state):
+        return file_state is not None and file_state != self.last_file_state
+
+    def smooth(self, average, value):
+        if average is None:
+            return value
+        return average + AdaptiveUploadScheduler.SMOOTHING * (value - average)
+
+    def record(self, file_state, upload_time, end_time=None):
+        """
+        record an upload and adjust the interval
+        """
+        end_time = end_time or time.time()
+
+        if self.last_file_state is not None and self.last_upload_end_time is not None:
+            elapsed = end_time - self.last_upload_end_time
+            if elapsed > 0:
+                growth_size = max(file_state[0] - self.last_file_state[0], 0)
+                self.growth_rate = self.smooth(self.growth_rate, growth_size / elapsed)
+
+        self.upload_time = self.smooth(self.upload_time, upload_time)
+        self.last_file_state = file_state
+        self.last_upload_end_time = end_time
+
+        interval = self.base_interval
+        if self.growth_rate:
+            interval = min(interval, self.target_upload_size / self.growth_rate)
+        if self.max_duty_cycle > 0:
+            interval = max(interval, self.upload_time / self.max_duty_cycle)
+
+        self.interval = min(max(interval, self.min_interval), self.max_interval)
+        return self.interval
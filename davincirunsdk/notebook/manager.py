@@ -15,21 +15,20 @@ import signal
 import threading
 
 from davincirunsdk.common import ModelArtsLog
+from davincirunsdk.common import AscendDriverInfo
 from davincirunsdk.common import SigHandler
 from davincirunsdk.common import ModelArts
 from davincirunsdk.common import HwHiAiUser
-from davincirunsdk.common import OpEnv
+from davincirunsdk.common import JobContext
 from davincirunsdk.common import BatchEnv
 from davincirunsdk.notebook.exception import DistributedRuntimeError
+from davincirunsdk.fmk import FMKEnvTemplate
 from davincirunsdk.notebook.fmk import FMK
 from davincirunsdk.notebook.tailer import LogRecorder
-
-try:
-    import moxing as mox
-except ImportError:
-    debug = True
-else:
-    debug = False
+from davincirunsdk.proc_watcher import ProcessExitWatcher
+from davincirunsdk.log_mux import LogMultiplexer
+from davincirunsdk.manager import RankSpawner
+from davincirunsdk.log_upload import IncrementalLogUploader, AdaptiveUploadScheduler, BandwidthLimiter
 
 log = ModelArtsLog.get_modelarts_logger()
 
@@ -44,11 +43,13 @@ class Manager:
             subprocess.call([HwHiAiUser.PRE_STOP_SCRIPTS])
 
 
-class FMKManager:
+class FMKManager(RankSpawner):
     # max destroy time: ~20 (15 + 5)
     # ~ 15 (1 + 2 + 4 + 8)
     MAX_TEST_PROC_CNT = 4
     KILL_WAIT_TIME = 5
+    # max time to wait for the rest of the proc log after the processes exited
+    LOG_DRAIN_TIME = 3
 
     _registered = False
 
@@ -60,63 +61,112 @@ class FMKManager:
         SigHandler.register_sig_child_handler()
         cls._registered = True
 
-    def __init__(self, instance):
+    def __init__(self, instance, log_max_bytes=LogMultiplexer.DEFAULT_MAX_BYTES,
+                 log_backup_count=LogMultiplexer.DEFAULT_BACKUP_COUNT, log_compress=False, topology=None):
         self.instance = instance
+        # Topology, export the topology env vars (DAVINCIRUN_TOPO_*) to the ranks
+        self.topology = topology
+        # FMKEnvTemplate of the launch, the env shared by the ranks
+        self.env_template = None
         self.fmk = []
         self.fmk_processes = []
         self.get_sigterm = False
+        self.exit_watcher = None
+        # fan out the stdout of all the training processes
+        self.log_mux = LogMultiplexer(log_max_bytes, log_backup_count, log_compress)
         self._register()
 
     # break the monitor and destory processes when get terminate signal
     def term_handle(func):
-        def receive_term(signum, stack):
-            log.info('Received terminate signal %d, try to destroyed all processes' % signum)
-            stack.f_locals['self'].get_sigterm = True
-
         def handle_func(self, *args, **kwargs):
+            def receive_term(signum, stack):
+                log.info('Received terminate signal %d, try to destroyed all processes' % signum)
+                self.get_sigterm = True
+                # the monitor may be blocked in waiting for process exit events
+                if self.exit_watcher is not None:
+                    self.exit_watcher.interrupt()
+
             origin_handle = signal.getsignal(signal.SIGTERM)
             signal.signal(signal.SIGTERM, receive_term)
-            res = func(self, *args, **kwargs)
-            signal.signal(signal.SIGTERM, origin_handle)
-            return res
+            try:
+                return func(self, *args, **kwargs)
+            finally:
+                signal.signal(signal.SIGTERM, origin_handle)
 
         return handle_func
 
-    def run(self, rank_size, command, work_dir, log_dir, *, output_notebook=False, random_cache_dir=True):
+    def run(self, rank_size, command, work_dir, log_dir, *, output_notebook=False, random_cache_dir=True,
+            spawn_workers=1):
         c75_tr5_flag = AscendVersionManager.is_atlas_c75_tr5()
-        for index, device in enumerate(self.instance.devices):
-            fmk_instance = FMK(c75_tr5_flag, index, device)
-            self.fmk.append(fmk_instance)
-
-            self.fmk_processes.append(
-                fmk_instance.run(rank_size, command, work_dir, log_dir, output_notebook=output_notebook))
+        # the shared env is computed once, each rank only adds its overlay
+        self.env_template = FMKEnvTemplate(rank_size, FMK.get_log_dir())
+        fmk_instances = [FMK(c75_tr5_flag, index, device, self.topology)
+                         for index, device in enumerate(self.instance.devices)]
+
+        start_time = time.time()
+        if spawn_workers > 1 and len(fmk_instances) > 1:
+            self.spawn_concurrently(fmk_instances, spawn_workers, rank_size, command, work_dir, log_dir,
+                                    output_notebook=output_notebook, log_mux=self.log_mux,
+                                    env_template=self.env_template)
+        else:
+            for fmk_instance in fmk_instances:
+                self.fmk.append(fmk_instance)
+
+                self.fmk_processes.append(
+                    fmk_instance.run(rank_size, command, work_dir, log_dir, output_notebook=output_notebook,
+                                     log_mux=self.log_mux, env_template=self.env_template))
+
+        self.log_spawn_latency(time.time() - start_time)
+
+    def get_rank_env_overlays(self):
+        """
+        :return: {rank_id: the env of the rank on top of env_template}
+        """
+        return {fmk.rank_id: fmk.env_overlay for fmk in self.fmk}
+
+    def get_rank_env(self, rank_id):
+        """
+        :return: the final env of the rank, None if the rank is not spawned by this manager
+        """
+        for fmk in self.fmk:
+            if fmk.rank_id == str(rank_id) and fmk.env_overlay is not None:
+                return self.env_template.get_envs(fmk.env_overlay)
+        return None
 
     @term_handle
     def monitor(self, period=1, raise_exception=True):
-        # busy waiting for all fmk processes exit by zero
+        # waiting for all fmk processes exit by zero
         # or there is one process exit by non-zero
+        # exit events come from ProcessExitWatcher (pidfd or SIGCHLD),
+        # `period` is only used as the polling interval when neither of them is available
 
         fmk_cnt = len(self.fmk_processes)
-        zero_ret_cnt = 0
-        while zero_ret_cnt != fmk_cnt:
-            zero_ret_cnt = 0
-            for index in range(fmk_cnt):
-                fmk = self.fmk[index]
-                fmk_process = self.fmk_processes[index]
-                if fmk_process.poll() is not None:
-                    if fmk_process.returncode != 0:
-                        log.error('proc-rank-%s-device-%s (pid: %d) has exited with non-zero code: %d'
-                                  % (fmk.rank_id, fmk.device_id, fmk_process.pid, fmk_process.returncode))
-                        # only works when start by output_notebook=True
-                        err_log = LogRecorder.get_log_from_pid(fmk_process.pid)
-                        if raise_exception:
-                            raise DistributedRuntimeError('\n' + err_log)
-                        return fmk_process.returncode
-
-                    zero_ret_cnt += 1
-            if self.get_sigterm:
-                break
-            time.sleep(period)
+        with ProcessExitWatcher(self.fmk_processes, period) as watcher:
+            self.exit_watcher = watcher
+            try:
+                while True:
+                    zero_ret_cnt = 0
+                    for index in range(fmk_cnt):
+                        fmk = self.fmk[index]
+                        fmk_process = self.fmk_processes[index]
+                        if fmk_process.poll() is not None:
+                            if fmk_process.returncode != 0:
+                                log.error('proc-rank-%s-device-%s (pid: %d) has exited with non-zero code: %d'
+                                          % (fmk.rank_id, fmk.device_id, fmk_process.pid, fmk_process.returncode))
+                                # only works when start by output_notebook=True
+                                if fmk_process.stdout is not None:
+                                    self.log_mux.wait_closed(fmk_process.stdout, self.LOG_DRAIN_TIME)
+                                err_log = LogRecorder.get_log_from_pid(fmk_process.pid)
+                                if raise_exception:
+                                    raise DistributedRuntimeError('\n' + err_log)
+                                return fmk_process.returncode
+
+                            zero_ret_cnt += 1
+                    if zero_ret_cnt == fmk_cnt or self.get_sigterm:
+                        break
+                    watcher.wait()
+            finally:
+                self.exit_watcher = None
 
         return 0
 
@@ -124,6 +174,7 @@ class FMKManager:
         log.info('Begin destroy training processes')
         self.send_sigterm_to_fmk_process()
         self.wait_fmk_process_end(base_period)
+        self.log_mux.close(self.LOG_DRAIN_TIME)
         log.info('End destroy training processes')
 
     def send_sigterm_to_fmk_process(self):
@@ -239,14 +290,15 @@ class OpManager:
         return subprocess.Popen(op_run, shell=True).wait()
 
     def run(self):
-        if not OpEnv.should_handle_operator():
+        op_obs_url = JobContext.current().op_obs_url
+        if op_obs_url is None:
             return 0
 
         log.info('download the operator archive from obs')
         tmp_op_path = '%s/%s' % (self.op_workspace, HwHiAiUser.MIND_STUDIO_OP_DIR)
         os.makedirs(tmp_op_path)
 
-        return_code = OpManager.download_from_obs(OpEnv.get_op_obs_uri(), tmp_op_path)
+        return_code = OpManager.download_from_obs(op_obs_url, tmp_op_path)
         if return_code != 0:
             log.error('download the operator archive from obs failed, return code: [%d]' % return_code)
             return return_code
@@ -265,19 +317,30 @@ class OpManager:
 
 class BatchLogManager:
 
-    def __init__(self, upload_interval=30, upload_time_warning_threshold=8):
+    def __init__(self, upload_interval=30, upload_time_warning_threshold=8, upload_backend=None,
+                 min_upload_interval=5, max_upload_interval=300, max_upload_bandwidth=0):
         self.local_stdout_log_path = None
         self.obs_log_url = None
 
+        # upload_interval is the base of the adaptive interval, see AdaptiveUploadScheduler
         self.upload_interval = upload_interval
+        self.min_upload_interval = min_upload_interval
+        self.max_upload_interval = max_upload_interval
+        # bytes per second, 0: no limit
+        self.max_upload_bandwidth = max_upload_bandwidth
 
         self.background_uploader_thread = None
         self.ticker = threading.Event()
 
         self.upload_time_warning_threshold = upload_time_warning_threshold
 
+        # see IncrementalLogUploader, OBS (moxing) by default
+        self.upload_backend = upload_backend
+        self.uploader = None
+
     def run(self):
-        if not ModelArts.enable_log_upload() or not BatchEnv.get_batch_stdout_log() or not BatchEnv.get_pod_name():
+        job_context = JobContext.current()
+        if job_context.log_upload_url is None or not job_context.batch_log_path or not job_context.pod_name:
             return
 
         if self.background_uploader_thread is not None:
@@ -288,46 +351,64 @@ class BatchLogManager:
             log.warn('stdout log %s is not found' % self.local_stdout_log_path)
             return
 
-        self.obs_log_url = os.path.join(ModelArts.get_log_upload_url(), BatchLogManager.get_obs_log_file_name())
+        self.obs_log_url = os.path.join(job_context.log_upload_url, BatchLogManager.get_obs_log_file_name())
         log.info('background upload stdout log to %s' % self.obs_log_url)
 
+        # only the bytes appended since the last upload are shipped every tick
+        upload_backend = self.upload_backend or IncrementalLogUploader.get_default_backend()
+        self.uploader = IncrementalLogUploader(self.local_stdout_log_path, self.obs_log_url, upload_backend,
+                                               limiter=BandwidthLimiter(self.max_upload_bandwidth, self.ticker))
+        scheduler = AdaptiveUploadScheduler(self.upload_interval, self.min_upload_interval, self.max_upload_interval)
+
         self.background_uploader_thread = threading.Thread(target=BatchLogManager.background_upload_log_to_obs,
                                                            args=(self.ticker,
-                                                                 self.upload_interval,
+                                                                 scheduler,
                                                                  self.upload_time_warning_threshold,
-                                                                 self.local_stdout_log_path,
-                                                                 self.obs_log_url))
+                                                                 self.uploader))
         self.background_uploader_thread.start()
 
     @staticmethod
     def get_obs_log_file_name():
-        return BatchEnv.get_pod_name() + '.log'
+        return JobContext.current().pod_name + '.log'
 
     @staticmethod
-    def background_upload_log_to_obs(ticker, upload_interval, upload_time_warning_threshold,
-                                     local_stdout_log_path, obs_log_url):
+    def background_upload_log_to_obs(ticker, scheduler, upload_time_warning_threshold, uploader):
         upload_time_is_too_long_warning = False
 
-        while not ticker.wait(upload_interval):
-            if not upload_time_is_too_long_warning:
-                start_time = time.time()
-                BatchLogManager.upload_log_to_obs(local_stdout_log_path, obs_log_url)
-                upload_time = time.time() - start_time
-                if upload_time > upload_time_warning_threshold:
-                    log.warn('upload stdout log time is larger than %s seconds, log file size %s',
-                             upload_time_warning_threshold, os.path.getsize(local_stdout_log_path))
-                    upload_time_is_too_long_warning = True
-            else:
-                BatchLogManager.upload_log_to_obs(local_stdout_log_path, obs_log_url)
-
-        # at exit
-        BatchLogManager.upload_log_to_obs(local_stdout_log_path, obs_log_url)
+        while not ticker.wait(scheduler.interval):
+            file_state = scheduler.get_file_state(uploader.local_path)
+            if not scheduler.should_upload(file_state):
+                continue
+
+            start_time = time.time()
+            uploaded_size = BatchLogManager.upload_log_to_obs(uploader)
+            if uploaded_size is None:
+                # failed, retry at the next tick
+                continue
+
+            upload_time = time.time() - start_time
+            scheduler.record(file_state, upload_time)
+            if not upload_time_is_too_long_warning and upload_time > upload_time_warning_threshold:
+                log.warn('upload stdout log time is larger than %s seconds, uploaded size %s, '
+                         'upload interval is adjusted to %.1f seconds',
+                         upload_time_warning_threshold, uploaded_size, scheduler.interval)
+                upload_time_is_too_long_warning = True
+
+        # at exit, the ticker is set and the bandwidth limiter is lifted,
+        # only the bytes after the last upload are left, within the join timeout of destroy
+        BatchLogManager.upload_log_to_obs(uploader, final=True)
         log.info('final upload stdout log done')
 
     @staticmethod
-    def upload_log_to_obs(local_stdout_log_path, obs_log_url):
-        if not debug:
-            mox.file.copy(local_stdout_log_path, obs_log_url)
+    def upload_log_to_obs(uploader, final=False):
+        try:
+            if final:
+                return uploader.finalize()
+            return uploader.upload()
+        except Exception as e:
+            # the offset is not moved forward, the rest will be uploaded next time
+            log.warning('upload stdout log to %s failed: %s', uploader.remote_url, e)
+            return None
 
     def destroy(self):
         if self.background_uploader_thread is None:
@@ -342,40 +423,33 @@ class BatchLogManager:
 
 
 class AscendVersionManager:
-    driver_version_file_path = '/usr/local/Ascend/driver/version.info'
+    driver_version_file_path = AscendDriverInfo.DRIVER_VERSION_FILE_PATH
 
-    c75_tr5_driver_version = 'Version=20.1.0'
+    c75_tr5_driver_version = AscendDriverInfo.C75_TR5_VERSION_LINE
 
     @staticmethod
     def test_driver_version_file_exists():
         return os.path.isfile(AscendVersionManager.driver_version_file_path)
 
+    @staticmethod
+    def get_driver_info():
+        """
+        :return: AscendDriverInfo, None if there is no driver version file
+        """
+        return AscendDriverInfo.probe(AscendVersionManager.driver_version_file_path)
+
     @staticmethod
     def print_ascend_driver_version():
-        if not AscendVersionManager.test_driver_version_file_exists():
-            log.warn('there is no %s file' % AscendVersionManager.driver_version_file_path)
+        driver_info = AscendVersionManager.get_driver_info()
+        if driver_info is None:
+            log.warning('there is no %s file' % AscendVersionManager.driver_version_file_path)
             log.info('Ascend Driver: Unknown')
             return
 
-        with open(AscendVersionManager.driver_version_file_path) as version_file:
-            for line in version_file:
-                line = line.strip()
-                log.info('Ascend Driver: %s' % line)
-                # we only take the first line into account
-                return
-
-        return
+        # we only take the first line into account
+        log.info('Ascend Driver: %s' % driver_info.first_line)
 
     @staticmethod
     def is_atlas_c75_tr5():
-        if not AscendVersionManager.test_driver_version_file_exists():
-            return False
-
-        with open(AscendVersionManager.driver_version_file_path) as version_file:
-            for line in version_file:
-                line = line.strip()
-                if line == AscendVersionManager.c75_tr5_driver_version:
-                    return True
-                return False
-
-        return False
+        driver_info = AscendVersionManager.get_driver_info()
+        return driver_info is not None and driver_info.is_c75_tr5
@@ -16,6 +16,7 @@ from davincirunsdk.common import RankTableEnv, ModelArts
 from davincirunsdk.notebook.manager import AscendVersionManager, FMKManager
 from davincirunsdk.notebook.utils import init_log, fsync_dir
 from davincirunsdk.rank_table import RankTable, RankTableV1, RankTableV0
+from davincirunsdk.topology import Topology
 
 
 def generate_rank_table():
@@ -32,13 +33,11 @@ def generate_rank_table():
     else:
         rank_table_path = RankTableEnv.get_rank_table_file_path()
         rank_table_cls = RankTableV0
-    try:
-        RankTable.wait_for_available(rank_table_path)
-    except FileNotFoundError:
-        rank_table = None
-    else:
-        rank_table = rank_table_cls(rank_table_path)
-    return rank_table
+    if not os.path.exists(rank_table_path):
+        # wait_for_available waits for the file to be created, do not block the notebook without rank table
+        return None
+    RankTable.wait_for_available(rank_table_path)
+    return rank_table_cls(rank_table_path)
 
 
 def get_rank_table():
@@ -179,7 +178,7 @@ def wait_distributed_train(fmk_manager, destroy_when_finished=True, raise_except
     return fmk_manager.wait(destroy_when_finished, raise_exception)
 
 
-def start_distributed_train(command, work_dir='./', log_dir='./log', *, output_notebook=False):
+def start_distributed_train(command, work_dir='./', log_dir='./log', *, output_notebook=False, spawn_workers=1):
     """启动分布式训练任务
 
     Args:
@@ -187,6 +186,7 @@ def start_distributed_train(command, work_dir='./', log_dir='./log', *, output_n
         work_dir: 工作目录，如果command存在相对路径，需要确保从工作目录访问相对路径正确
         log_dir: 日志输出目录
         output_notebook: 默认为False，当为True时，将自动输出日志到notebook中；如果在非notebook环境中打开，不应当有任何作用
+        spawn_workers: 默认为1，即逐个启动训练进程；大于1时使用线程池并发启动各rank，可缩短多卡节点的启动时间
 
     Examples:
 
@@ -205,14 +205,16 @@ def start_distributed_train(command, work_dir='./', log_dir='./log', *, output_n
     instance = rank_table.get_current_instance()
     server = rank_table.get_server(instance.server_id)
     current_instance = RankTable.convert_server_to_instance(server)
-    fmk_manager = FMKManager(current_instance)
-    fmk_manager.run(rank_table.get_device_num(), command, work_dir, log_dir, output_notebook=output_notebook)
+    fmk_manager = FMKManager(current_instance, topology=Topology.from_rank_table(rank_table))
+    fmk_manager.run(rank_table.get_device_num(), command, work_dir, log_dir, output_notebook=output_notebook,
+                    spawn_workers=spawn_workers)
     return fmk_manager
 
 
 def start_and_wait_distributed_train(command, work_dir='./', log_dir='./log',
                                      *,
                                      output_notebook=False,
+                                     spawn_workers=1,
                                      random_cache_dir=True,
                                      destroy_when_finished=True,
                                      raise_exception=True):
@@ -223,6 +225,7 @@ def start_and_wait_distributed_train(command, work_dir='./', log_dir='./log',
         work_dir (Path-like string): 工作目录，如果command存在相对路径，需要确保从工作目录访问相对路径正确
         log_dir (Path-like string): 日志输出目录
         output_notebook: 默认为False，当为True时，将自动输出日志到notebook中；如果在非notebook环境中打开，不应当有任何作用
+        spawn_workers: 默认为1，即逐个启动训练进程；大于1时使用线程池并发启动各rank，可缩短多卡节点的启动时间
         random_cache_dir: 默认为True，是否使用随机缓存目录，避免在工作目录下生成大量算子缓存
         destroy_when_finished: 默认为True，是否在结束时销毁所有子进程；通常及时销毁可以帮助释放NPU资源，除非你想深入进程细节
         raise_exception: 默认为True，是否在子进程失败时raise exception，以确保外部得到exception提示，这在流水线中判断执行结果很有用
@@ -243,7 +246,8 @@ def start_and_wait_distributed_train(command, work_dir='./', log_dir='./log',
             command,
             work_dir=work_dir,
             log_dir=log_dir,
-            output_notebook=output_notebook
+            output_notebook=output_notebook,
+            spawn_workers=spawn_workers
         )
         return wait_distributed_train(
             fmk_manager,
@@ -5,21 +5,22 @@
 #  https://opensource.org/licenses/MIT.
 #
 
-import asyncio
-from asyncio import Queue
 import threading
 
-import sh
-from tornado import ioloop
+
+# sh and tornado (and asyncio) are only needed to tail the logs in the notebook,
+# import them on use so that LogRecorder is cheap to import
 
 
 def tail(filename, msg, pid):
+    import sh
+
     for line in sh.tail("-f", "--pid", pid, filename, _iter=True):
         print(f'{msg}: {line}', end='')
 
 
 class TailManager:
-    threads = Queue()
+    threads = None
     _started = False
 
     @classmethod
@@ -28,25 +29,39 @@ class TailManager:
         cls.start_thread(thread)
         cls.start_clean_inactivate()
 
+    @classmethod
+    def get_threads(cls):
+        if cls.threads is None:
+            from asyncio import Queue
+            cls.threads = Queue()
+        return cls.threads
+
     @classmethod
     def start_thread(cls, thread):
+        from tornado import ioloop
+
         thread.start()
-        ioloop.IOLoop.current().add_callback(cls.threads.put, thread)
+        ioloop.IOLoop.current().add_callback(cls.get_threads().put, thread)
 
     @classmethod
     def start_clean_inactivate(cls):
         if cls._started:
             return
+        from tornado import ioloop
+
         ioloop.IOLoop.current().add_callback(cls.clean_inactivate)
         cls._started = True
 
     @classmethod
     async def clean_inactivate(cls, interval=2):
+        import asyncio
+
+        threads = cls.get_threads()
         while True:
-            for _ in range(cls.threads.qsize()):
-                t: threading.Thread = await cls.threads.get()
+            for _ in range(threads.qsize()):
+                t: threading.Thread = await threads.get()
                 if t.is_alive():
-                    await cls.threads.put(t)
+                    await threads.put(t)
                 else:
                     t.join()
             await asyncio.sleep(interval)
@@ -0,0 +1,163 @@
+import os
+import selectors
+import signal
+import threading
+
+from davincirunsdk.common import ModelArtsLog
+
+log = ModelArtsLog.get_modelarts_logger()
+
+
+class ProcessExitWatcher:
+    """
+    wait for the exit of child processes without busy polling
+
+    the exit events come from (in order of preference):
+    ---
+    pidfd: os.pidfd_open + selectors, linux >= 5.3 and python >= 3.9
+    sigchld: a SIGCHLD handler writing to a self-pipe, main thread only
+    timer: wake up every `period` seconds, the last resort
+    ---
+    wait() only tells the caller that something may have happened,
+    the caller still decides by Popen.poll()
+    """
+    MODE_PIDFD = 'pidfd'
+    MODE_SIGCHLD = 'sigchld'
+    MODE_TIMER = 'timer'
+
+    def __init__(self, processes, period=1):
+        self.period = period
+        self.mode = None
+
+        self.selector = selectors.DefaultSelector()
+        self.pidfds = []
+        self.sigchld_handler_installed = False
+        self.origin_sigchld_handler = None
+
+        # self-pipe, wake up wait() by interrupt() or SIGCHLD
+        self.wakeup_r, self.wakeup_w = os.pipe()
+        os.set_blocking(self.wakeup_r, False)
+        os.set_blocking(self.wakeup_w, False)
+        self.selector.register(self.wakeup_r, selectors.EVENT_READ)
+
+        if self.open_pidfds(processes):
+            self.mode = ProcessExitWatcher.MODE_PIDFD
+        elif self.install_sigchld_handler():
+            self.mode = ProcessExitWatcher.MODE_SIGCHLD
+        else:
+            self.mode = ProcessExitWatcher.MODE_TIMER
+
+        log.debug('process exit watcher mode: %s' % self.mode)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def open_pidfds(self, processes):
+        if not hasattr(os, 'pidfd_open'):
+            return False
+
+        for process in processes:
+            try:
+                pidfd = os.pidfd_open(process.pid)
+            except ProcessLookupError:
+                # already reaped, Popen.poll() has got the return code
+                continue
+            except OSError:
+                # ENOSYS (kernel < 5.3) or forbidden by seccomp
+                self.close_pidfds()
+                return False
+
+            self.pidfds.append(pidfd)
+            self.selector.register(pidfd, selectors.EVENT_READ, process)
+
+        return True
+
+    def close_pidfds(self):
+        for pidfd in self.pidfds:
+            self.selector.unregister(pidfd)
+            os.close(pidfd)
+        self.pidfds = []
+
+    def install_sigchld_handler(self):
+        # signal handler can only be set in the main thread
+        if threading.current_thread() is not threading.main_thread():
+            return False
+
+        origin_handler = signal.getsignal(signal.SIGCHLD)
+
+        def receive_sigchld(signum, stack):
+            self.interrupt()
+            # keep the origin handler working, e.g. SigHandler.wait_child
+            if callable(origin_handler):
+                origin_handler(signum, stack)
+
+        signal.signal(signal.SIGCHLD, receive_sigchld)
+        self.sigchld_handler_installed = True
+        self.origin_sigchld_handler = origin_handler
+        return True
+
+    def interrupt(self):
+        """
+        wake up wait(), safe to call from signal handlers and other threads
+        """
+        if self.wakeup_w is None:
+            return
+
+        try:
+            os.write(self.wakeup_w, b'\0')
+        except (BlockingIOError, OSError):
+            # the pipe is full (a wake up is pending already) or closed
+            pass
+
+    def drain_wakeup_pipe(self):
+        try:
+            while os.read(self.wakeup_r, 512):
+                pass
+        except BlockingIOError:
+            pass
+
+    def wait(self, timeout=None):
+        """
+        block until one of the processes may have exited, interrupt() or timeout
+
+        :return: the processes which have exited for sure (pidfd mode only)
+        """
+        if self.mode == ProcessExitWatcher.MODE_TIMER:
+            timeout = self.period if timeout is None else min(timeout, self.period)
+
+        exited_processes = []
+        for key, _ in self.selector.select(timeout):
+            if key.fd == self.wakeup_r:
+                self.drain_wakeup_pipe()
+                continue
+
+            # a pidfd stays readable after the process exits, only report it once
+            self.selector.unregister(key.fd)
+            self.pidfds.remove(key.fd)
+            os.close(key.fd)
+            exited_processes.append(key.data)
+
+        return exited_processes
+
+    def close(self):
+        if self.selector is None:
+            return
+
+        self.close_pidfds()
+
+        if self.sigchld_handler_installed:
+            # None means the origin handler was not installed from python
+            origin_handler = self.origin_sigchld_handler
+            signal.signal(signal.SIGCHLD, signal.SIG_DFL if origin_handler is None else origin_handler)
+            self.sigchld_handler_installed = False
+
+        self.selector.close()
+        self.selector = None
+
+        wakeup_r, wakeup_w = self.wakeup_r, self.wakeup_w
+        self.wakeup_r = self.wakeup_w = None
+        os.close(wakeup_r)
+        os.close(wakeup_w)
@@ -46,18 +46,29 @@ rank table v1格式，即notebook生成的rank table格式：
 }
 """
 
+import hashlib
 import json
+import logging
+import re
+import socket
+import struct
+import sys
 import time
 import os
+from array import array
 
+from davincirunsdk.common import FileHelper
 from davincirunsdk.common import ModelArts
 from davincirunsdk.common import ModelArtsLog
 from davincirunsdk.common import RankTableEnv
+from davincirunsdk.file_watcher import FileChangeWatcher
 
 log = ModelArtsLog.get_modelarts_logger()
 
 
 class Device:
+    __slots__ = ('device_id', 'device_ip', 'rank_id')
+
     def __init__(self, device_id, device_ip, rank_id):
         self.device_id = device_id
         self.device_ip = device_ip
@@ -66,6 +77,8 @@ class Device:
 
 
 class Instance:
+    __slots__ = ('pod_name', 'server_id', 'devices')
+
     def __init__(self, pod_name, server_id, devices):
         self.pod_name = pod_name
         self.server_id = server_id
@@ -86,6 +99,8 @@ class Instance:
 
 
 class Group:
+    __slots__ = ('group_name', 'device_count', 'instance_count', 'instance_list')
+
     def __init__(self, group_name, device_count, instance_count, instance_list):
         self.group_name = group_name
         self.device_count = int(device_count)
@@ -102,13 +117,333 @@ class Group:
         return instance_object_list
 
 
+def pack_int(value):
+    try:
+        packed = int(value)
+    except (TypeError, ValueError):
+        return None
+    # keep the origin string if it's not canonical, e.g. '01'
+    if packed < 0 or packed > 0xFFFFFFFF or str(packed) != value:
+        return None
+    return packed
+
+
+def unpack_int(value):
+    return str(value)
+
+
+def pack_ipv4(value):
+    try:
+        packed = socket.inet_aton(value)
+    except (OSError, TypeError):
+        return None
+    # inet_aton also accepts the short forms, e.g. '127.1'
+    if socket.inet_ntoa(packed) != value:
+        return None
+    return struct.unpack('!I', packed)[0]
+
+
+def unpack_ipv4(value):
+    return socket.inet_ntoa(struct.pack('!I', value))
+
+
+# canonical values of a whole column joined by '\n', no leading zeros, signs or spaces
+INT_COLUMN_PATTERN = re.compile(r'(?:0|[1-9][0-9]*)(?:\n(?:0|[1-9][0-9]*))*')
+IPV4_COLUMN_PATTERN = re.compile(r'{ip}(?:\n{ip})*'.format(ip=r'\.'.join([r'(?:0|[1-9][0-9]{0,2})'] * 4)))
+
+
+def match_column(pattern, values):
+    """
+    :return: whether every value of the column matches the pattern
+    """
+    try:
+        joined = '\n'.join(values)
+    except TypeError:
+        return False
+    # a value containing '\n' would match as two values
+    return joined.count('\n') == len(values) - 1 and pattern.fullmatch(joined) is not None
+
+
+def pack_int_column(values):
+    """
+    pack a whole column at once, in C loops
+    :return: array('I'), None if any value can not be packed, the column is packed value by value then
+    """
+    if not values:
+        return array('I')
+    if not match_column(INT_COLUMN_PATTERN, values):
+        return None
+    try:
+        packed = array('I', map(int, values))
+    except OverflowError:
+        return None
+    if RankTableColumns.UNPACKED in packed:
+        return None
+    return packed
+
+
+def pack_ipv4_column(values):
+    """
+    :return: array('I'), None if any value can not be packed
+    """
+    if not values:
+        return array('I')
+    if not match_column(IPV4_COLUMN_PATTERN, values):
+        return None
+    try:
+        # the pattern only matches the dotted-decimal form, inet_aton checks the range
+        packed_bytes = b''.join(map(socket.inet_aton, values))
+    except OSError:
+        return None
+    packed = array('I')
+    packed.frombytes(packed_bytes)
+    if sys.byteorder == 'little':
+        packed.byteswap()
+    if RankTableColumns.UNPACKED in packed:
+        return None
+    return packed
+
+
+class RankTableColumns:
+    """
+    struct-of-arrays storage of the v1 rank table, one row per device, the rows of a server are contiguous
+    ---
+    device_id: array('I')
+    device_ip: array('I'), packed IPv4
+    rank_id: array('I')
+    ---
+    a value which can not be packed (e.g. an IPv6 device ip) is kept as a string in `unpacked`
+    """
+    __slots__ = ('server_ids', 'server_offsets', 'device_id', 'device_ip', 'rank_id', 'unpacked')
+
+    UNPACK = {
+        'device_id': unpack_int,
+        'device_ip': unpack_ipv4,
+        'rank_id': unpack_int,
+    }
+    # placeholder of the unpacked values
+    UNPACKED = 0xFFFFFFFF
+
+    def __init__(self):
+        self.server_ids = []
+        # the rows of server i: [server_offsets[i], server_offsets[i + 1])
+        self.server_offsets = array('I', [0])
+        self.device_id = array('I')
+        self.device_ip = array('I')
+        self.rank_id = array('I')
+        # (column, row) -> str
+        self.unpacked = {}
+
+    # column -> (pack a whole column, pack a value)
+    PACK = {
+        'device_id': (pack_int_column, pack_int),
+        'device_ip': (pack_ipv4_column, pack_ipv4),
+        'rank_id': (pack_int_column, pack_int),
+    }
+
+    @staticmethod
+    def from_server_list(server_list):
+        """
+        pack column by column, a server by server add_server costs a python call per value
+        """
+        columns = RankTableColumns()
+        devices = []
+        for server in server_list:
+            devices.extend(server['device'])
+            columns.server_ids.append(server['server_id'])
+            columns.server_offsets.append(len(devices))
+
+        for column, (pack_column, pack_value) in RankTableColumns.PACK.items():
+            values = [device[column] for device in devices]
+            column_array = pack_column(values)
+            if column_array is None:
+                column_array = array('I')
+                for value in values:
+                    columns.append_value(column, column_array, pack_value(value), value)
+            setattr(columns, column, column_array)
+        return columns
+
+    def add_server(self, server_id, devices):
+        """
+        :param devices: [(device_id, device_ip, rank_id), ...]
+        """
+        for device_id, device_ip, rank_id in devices:
+            self.append_value('device_id', self.device_id, pack_int(device_id), device_id)
+            self.append_value('device_ip', self.device_ip, pack_ipv4(device_ip), device_ip)
+            self.append_value('rank_id', self.rank_id, pack_int(rank_id), rank_id)
+        self.server_ids.append(server_id)
+        self.server_offsets.append(len(self.rank_id))
+
+    def append_value(self, column, column_array, packed, value):
+        if packed is None or packed == RankTableColumns.UNPACKED:
+            self.unpacked[(column, len(column_array))] = value
+            packed = RankTableColumns.UNPACKED
+        column_array.append(packed)
+
+    def get_value(self, column, row):
+        packed = getattr(self, column)[row]
+        if packed == RankTableColumns.UNPACKED:
+            return self.unpacked[(column, row)]
+        return RankTableColumns.UNPACK[column](packed)
+
+    def get_device_num(self):
+        return len(self.rank_id)
+
+    def get_server_num(self):
+        return len(self.server_ids)
+
+    def get_server_rows(self, server_index):
+        return range(self.server_offsets[server_index], self.server_offsets[server_index + 1])
+
+    def get_server_index_of_row(self, row):
+        # the offsets are ascending, binary search
+        lo, hi = 0, len(self.server_ids)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.server_offsets[mid + 1] <= row:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def get_device(self, row):
+        return {
+            'device_id': self.get_value('device_id', row),
+            'device_ip': self.get_value('device_ip', row),
+            'rank_id': self.get_value('rank_id', row)
+        }
+
+    def get_server(self, server_index):
+        return {
+            'server_id': self.server_ids[server_index],
+            'device': [self.get_device(row) for row in self.get_server_rows(server_index)]
+        }
+
+    def get_server_list(self):
+        return [self.get_server(server_index) for server_index in range(len(self.server_ids))]
+
+    def write_json(self, f, header):
+        """
+        write the v1 rank table server by server, without building the whole dict
+        """
+        f.write('{')
+        for key, value in header.items():
+            f.write('%s: %s, ' % (json.dumps(key), json.dumps(value)))
+        f.write('"server_list": [')
+        for server_index in range(len(self.server_ids)):
+            if server_index > 0:
+                f.write(', ')
+            f.write(json.dumps(self.get_server(server_index)))
+        f.write(']}')
+
+
 class RankTable:
     STATUS_FIELD = 'status'
     COMPLETED_STATUS = 'completed'
 
+    # dump the whole rank tables into the log when it's true, only the summaries by default
+    DEBUG_RANK_TABLE_ENV = 'DEBUG_RANK_TABLE'
+
+    # placeholder of rank_rows
+    NO_ROW = 0xFFFFFFFF
+
     def __init__(self):
         self.rank_table_path = ""
-        self.rank_table = {}
+
+        # the fields of the v1 rank table except server_list
+        self.header = {}
+        self.columns = RankTableColumns()
+        # server_id -> server index
+        self.server_index = {}
+        # packed rank_id -> row of the columns, an array indexed by rank id if the rank ids are dense, else a dict
+        self.rank_rows = array('I')
+        # unpacked rank_id -> row
+        self.unpacked_rank_rows = {}
+        # v1 rank table built from the columns, reset when the columns are changed
+        self.rank_table_cache = None
+
+    @property
+    def rank_table(self):
+        """
+        v1 rank table, built from the columns on the first access, don't modify it
+        """
+        if self.rank_table_cache is None:
+            rank_table = dict(self.header)
+            rank_table['server_list'] = self.columns.get_server_list()
+            self.rank_table_cache = rank_table
+        return self.rank_table_cache
+
+    @rank_table.setter
+    def rank_table(self, rank_table):
+        self.header = {key: value for key, value in rank_table.items() if key != 'server_list'}
+        self.build_index(RankTableColumns.from_server_list(rank_table.get('server_list', [])))
+
+    def build_index(self, columns):
+        """
+        index the columns of the v1 rank table, call it when the rank table is loaded
+        """
+        self.columns = columns
+        self.rank_table_cache = None
+        self.server_index = {}
+        for server_index, server_id in enumerate(columns.server_ids):
+            self.server_index.setdefault(server_id, server_index)
+
+        # rank ids are 0 ~ N-1 normally, an array indexed by rank id,
+        # a dict if they are sparse, so a huge rank id doesn't allocate a huge array
+        rank_num = len(columns.rank_id)
+        self.unpacked_rank_rows = {}
+        if columns.rank_id == array('I', range(rank_num)):
+            # the rank ids are the row numbers, as generated
+            self.rank_rows = array('I', columns.rank_id)
+            return
+
+        max_rank_id = max((rank_id for rank_id in columns.rank_id if rank_id != RankTableColumns.UNPACKED),
+                          default=-1)
+        if max_rank_id < 2 * rank_num:
+            self.rank_rows = array('I', [RankTable.NO_ROW]) * (max_rank_id + 1)
+        else:
+            self.rank_rows = {}
+        for row, rank_id in enumerate(columns.rank_id):
+            if rank_id != RankTableColumns.UNPACKED:
+                self.rank_rows[rank_id] = row
+            else:
+                self.unpacked_rank_rows[columns.unpacked[('rank_id', row)]] = row
+
+    def get_row_of_rank(self, rank_id):
+        """
+        :return: row of the columns, None if not found
+        """
+        rank_id = str(rank_id)
+        packed = pack_int(rank_id)
+        if packed is None:
+            return self.unpacked_rank_rows.get(rank_id)
+        if isinstance(self.rank_rows, dict):
+            return self.rank_rows.get(packed)
+        if packed >= len(self.rank_rows) or self.rank_rows[packed] == RankTable.NO_ROW:
+            return None
+        return self.rank_rows[packed]
+
+    @staticmethod
+    def is_debug():
+        return os.environ.get(RankTable.DEBUG_RANK_TABLE_ENV, '').lower() == 'true'
+
+    @staticmethod
+    def summarize(data):
+        if 'group_list' in data:
+            instance_list = [instance for group in data['group_list'] for instance in group.get('instance_list', [])]
+            return 'status: %s, groups: %d, instances: %d, devices: %d' % (
+                data.get(RankTable.STATUS_FIELD), len(data['group_list']), len(instance_list),
+                sum(len(instance.get('devices') or []) for instance in instance_list))
+
+        server_list = data.get('server_list', [])
+        return 'status: %s, servers: %d, devices: %d' % (
+            data.get(RankTable.STATUS_FIELD), len(server_list), sum(len(server['device']) for server in server_list))
+
+    @staticmethod
+    def log_rank_table(title, data):
+        log.info('%s, %s' % (title, RankTable.summarize(data)))
+        if RankTable.is_debug():
+            log.info('\n' + json.dumps(data, indent=4))
 
     @staticmethod
     def read_from_file(file_path):
@@ -116,20 +451,45 @@ class RankTable:
             return json.load(json_file)
 
     @staticmethod
-    def wait_for_available(rank_table_file, period=1):
-        log.info('Wait for Rank table file ready')
-        complete_flag = False
-        while not complete_flag:
-            with open(rank_table_file) as json_file:
-                data = json.load(json_file)
-                if data[RankTableV0.STATUS_FIELD] == RankTableV0.COMPLETED_STATUS:
-                    log.info('Rank table file (K8S generated) is ready for read')
-                    log.info('\n' + json.dumps(data, indent=4))
-                    return True
+    def try_read_from_file(file_path):
+        """
+        :return: None if the file is missing or partially written
+        """
+        try:
+            data = RankTable.read_from_file(file_path)
+        except (OSError, ValueError) as e:
+            log.debug('Rank table file is not readable: %s' % e)
+            return None
+        return data if isinstance(data, dict) else None
 
-            time.sleep(period)
+    @staticmethod
+    def wait_for_available(rank_table_file, period=1, timeout=None):
+        """
+        wait for the status of the rank table file is completed,
+        the file is only re-read when its size or mtime changes
 
-        return False
+        :param timeout: seconds, wait forever if None
+        :return: False if timeout
+        """
+        log.info('Wait for Rank table file ready')
+        deadline = None if timeout is None else time.time() + timeout
+        with FileChangeWatcher(rank_table_file, period) as watcher:
+            while True:
+                if watcher.changed():
+                    data = RankTable.try_read_from_file(rank_table_file)
+                    if data is not None and data.get(RankTableV0.STATUS_FIELD) == RankTableV0.COMPLETED_STATUS:
+                        RankTable.log_rank_table('Rank table file (K8S generated) is ready for read', data)
+                        return True
+
+                if deadline is None:
+                    watcher.wait()
+                    continue
+
+                remain_time = deadline - time.time()
+                if remain_time <= 0:
+                    log.error('Rank table file is not ready in %s seconds' % timeout)
+                    return False
+                watcher.wait(remain_time)
 
     @staticmethod
     def convert_server_to_instance(server):
@@ -146,22 +506,60 @@ class RankTable:
         return self.rank_table_path
 
     def get_server(self, server_id):
-        for server in self.rank_table['server_list']:
-            if server['server_id'] == server_id:
-                log.info('Current server')
-                log.info('\n' + json.dumps(server, indent=4))
-                return server
+        server_index = self.server_index.get(server_id)
+        if server_index is None:
+            log.error('server [%s] is not found' % server_id)
+            return None
 
-        log.error('server [%s] is not found' % server_id)
-        return None
+        server = self.columns.get_server(server_index)
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug('server [%s]: %s', server_id, json.dumps(server))
+        return server
+
+    def get_server_by_rank(self, rank_id):
+        """
+        :return: (server, device), (None, None) if not found
+        """
+        row = self.get_row_of_rank(rank_id)
+        if row is None:
+            return None, None
+
+        server_index = self.columns.get_server_index_of_row(row)
+        return self.columns.get_server(server_index), self.columns.get_device(row)
+
+    def get_server_num(self):
+        return self.columns.get_server_num()
 
 
 class RankTableV0(RankTable):
+    """
+    the converted v1 file is reused while the v0 content is not changed:
+    ---
+    ${v1 file}.digest: {"v0_sha256": ..., "v1_size": ..., "v1_mtime_ns": ...}, written after the v1 file
+    ${v1 file}.lock: flock, the ranks on the same host convert one by one
+    _memo: v1 file -> (v0 sha256, parsed state), skip the parsing in the same process, e.g. notebook
+    ---
+    """
+    # bump it when the output of the conversion changes
+    CONVERTER_VERSION = '1'
+
+    _memo = {}
 
     def __init__(self, rank_table_v0_path):
         super().__init__()
 
-        json_data = self.read_from_file(file_path=rank_table_v0_path)
+        with open(rank_table_v0_path, 'rb') as json_file:
+            raw_data = json_file.read()
+        digest = hashlib.sha256(RankTableV0.CONVERTER_VERSION.encode() + b'\0' + raw_data).hexdigest()
+        v1_path = RankTableV0.get_v1_file_path()
+
+        memo = RankTableV0._memo.get(v1_path)
+        if memo is not None and memo[0] == digest and RankTableV0.is_v1_file_fresh(v1_path, digest):
+            log.info('Rank table file (V1) is not changed, reuse %s' % v1_path)
+            self.load_state(memo[1])
+            return
+
+        json_data = json.loads(raw_data)
 
         self.status = json_data[RankTableV0.STATUS_FIELD]
         if self.status != RankTableV0.COMPLETED_STATUS:
@@ -174,8 +572,63 @@ class RankTableV0(RankTable):
 
         self.group_count = int(json_data['group_count'])
         self.group_list = self.parse_group_list(json_data['group_list'])
+        # pod_name -> instance, the first one wins
+        self.instance_index = {}
+        for group in self.group_list:
+            for instance in group.instance_list:
+                self.instance_index.setdefault(instance.pod_name, instance)
+        # the device count declared by the groups
+        self.group_device_num = sum(group.device_count for group in self.group_list)
+
+        os.makedirs(RankTableEnv.get_rank_table_v1_file_dir(), exist_ok=True)
+        with FileHelper.lock(v1_path + '.lock'):
+            if RankTableV0.is_v1_file_fresh(v1_path, digest):
+                log.info('Rank table file (V1) is converted from the same content, reuse %s' % v1_path)
+                v1_data = self.read_from_file(v1_path)
+                self.rank_table_path = v1_path
+                self.header = {key: value for key, value in v1_data.items() if key != 'server_list'}
+                columns = RankTableColumns.from_server_list(v1_data['server_list'])
+            else:
+                self.rank_table_path, self.header, columns = self.convert_v0_to_v1_format_file()
+                RankTableV0.write_digest_file(v1_path, digest)
+        self.build_index(columns)
+
+        RankTableV0._memo[v1_path] = (digest, self.dump_state())
 
-        self.rank_table_path, self.rank_table = self.convert_v0_to_v1_format_file()
+    @staticmethod
+    def get_v1_file_path():
+        return os.path.join(RankTableEnv.get_rank_table_v1_file_dir(), RankTableEnv.HCCL_JSON_FILE_NAME)
+
+    @staticmethod
+    def get_digest_file_path(v1_path):
+        return v1_path + '.digest'
+
+    @staticmethod
+    def is_v1_file_fresh(v1_path, digest):
+        try:
+            with open(RankTableV0.get_digest_file_path(v1_path)) as f:
+                digest_data = json.load(f)
+            v1_stat = os.stat(v1_path)
+        except (OSError, ValueError):
+            return False
+
+        # the v1 file may be modified by others, e.g. route plan
+        return digest_data == {'v0_sha256': digest, 'v1_size': v1_stat.st_size, 'v1_mtime_ns': v1_stat.st_mtime_ns}
+
+    @staticmethod
+    def write_digest_file(v1_path, digest):
+        v1_stat = os.stat(v1_path)
+        with FileHelper.atomic_write(RankTableV0.get_digest_file_path(v1_path)) as f:
+            json.dump({'v0_sha256': digest, 'v1_size': v1_stat.st_size, 'v1_mtime_ns': v1_stat.st_mtime_ns}, f)
+
+    def dump_state(self):
+        return (self.status, self.group_count, self.group_list, self.instance_index, self.group_device_num,
+                self.rank_table_path, self.header, self.columns)
+
+    def load_state(self, state):
+        (self.status, self.group_count, self.group_list, self.instance_index, self.group_device_num,
+         self.rank_table_path, self.header, columns) = state
+        self.build_index(columns)
 
     @staticmethod
     def parse_group_list(group_list):
@@ -206,20 +659,14 @@ class RankTableV0(RankTable):
 
             return None
 
-        for group in self.group_list:
-            for instance in group.instance_list:
-                if instance.pod_name == pod_name:
-                    return instance
-        return None
+        return self.instance_index.get(pod_name)
 
     def convert_v0_to_v1_format_file(self):
-        rank_table_v1_file = {
-            'status': 'completed',
-            'version': '1.0',
-            'server_count': '0',
-            'server_list': []
-        }
+        """
+        collect the devices and write the v1 rank table file in one pass
 
+        :return: (path, header, RankTableColumns)
+        """
         logic_index = 0
         server_map = {}
         # collect all devices in all groups (mix common-framework and custom-image), rtf-T2 (prior-C7x)
@@ -227,46 +674,38 @@ class RankTableV0(RankTable):
             if group.device_count == 0:
                 continue
             for instance in group.instance_list:
-                if instance.server_id not in server_map:
-                    server_map[instance.server_id] = []
-
+                server_devices = server_map.setdefault(instance.server_id, [])
                 for device in instance.devices:
-                    v1_device = {
-                        'device_id': device.device_id,
-                        'device_ip': device.device_ip,
-                        'rank_id': str(logic_index)
-                    }
+                    server_devices.append((device.device_id, device.device_ip, str(logic_index)))
                     logic_index += 1
-                    server_map[instance.server_id].append(v1_device)
 
-        server_count = 0
-        for server_id in server_map:
-            rank_table_v1_file['server_list'].append({
-                'server_id': server_id,
-                'device': server_map[server_id]
-            })
-            server_count += 1
+        columns = RankTableColumns()
+        for server_id, server_devices in server_map.items():
+            columns.add_server(server_id, server_devices)
 
-        rank_table_v1_file['server_count'] = str(server_count)
+        header = {
+            'status': 'completed',
+            'version': '1.0',
+            'server_count': str(columns.get_server_num())
+        }
 
-        log.info('Rank table file (V1)')
-        log.info('\n' + json.dumps(rank_table_v1_file, indent=4))
+        log.info('Rank table file (V1), servers: %d, devices: %d' % (columns.get_server_num(),
+                                                                     columns.get_device_num()))
 
-        if not os.path.exists(RankTableEnv.get_rank_table_v1_file_dir()):
-            os.makedirs(RankTableEnv.get_rank_table_v1_file_dir())
+        os.makedirs(RankTableEnv.get_rank_table_v1_file_dir(), exist_ok=True)
 
-        path = os.path.join(RankTableEnv.get_rank_table_v1_file_dir(), RankTableEnv.HCCL_JSON_FILE_NAME)
-        with open(path, 'w') as f:
-            f.write(json.dumps(rank_table_v1_file))
-            log.info('Rank table file (V1) is generated')
+        path = RankTableV0.get_v1_file_path()
+        with FileHelper.atomic_write(path) as f:
+            columns.write_json(f, header)
+        log.info('Rank table file (V1) is generated')
 
-        return path, rank_table_v1_file
+        if RankTable.is_debug():
+            log.info('\n' + json.dumps(dict(header, server_list=columns.get_server_list()), indent=4))
+
+        return path, header, columns
 
     def get_device_num(self):
-        total_device_num = 0
-        for group in self.group_list:
-            total_device_num += group.device_count
-        return total_device_num
+        return self.group_device_num
 
 
 class RankTableV1(RankTable):
@@ -276,28 +715,21 @@ class RankTableV1(RankTable):
         self.rank_table = self.read_from_file(file_path=rank_table_path)
 
     def get_current_instance(self):
-        current_server = None
-        server_list = self.rank_table['server_list']
-        if len(server_list) == 1:
-            current_server = server_list[0]
-        elif len(server_list) > 1:
+        current_server_index = None
+        server_num = self.columns.get_server_num()
+        if server_num == 1:
+            current_server_index = 0
+        elif server_num > 1:
             host_ip = ModelArts.get_current_host_ip()
             if host_ip is not None:
-                for server in server_list:
-                    if server['server_id'] == host_ip:
-                        current_server = server
-                        break
+                current_server_index = self.server_index.get(host_ip)
             else:
-                current_server = server_list[0]
+                current_server_index = 0
 
-        if current_server is None:
+        if current_server_index is None:
             log.error('server is not found')
             return None
-        return self.convert_server_to_instance(current_server)
+        return self.convert_server_to_instance(self.columns.get_server(current_server_index))
 
     def get_device_num(self):
-        server_list = self.rank_table['server_list']
-        device_num = 0
-        for server in server_list:
-            device_num += len(server['device'])
-        return device_num
+        return self.columns.get_device_num()
@@ -0,0 +1,189 @@
+"""
+route planners, reorder the ranks in the rank table by the network topology
+
+a planner provides:
+---
+init(topo_file, rank_file, save_rank_file, cursrvip) -> (ret, customdev, custom_id)
+    topo_file: the decompressed topo file
+    rank_file: the v1 rank table file
+    save_rank_file: where to write the planned v1 rank table
+    cursrvip: server_id of the current server
+    ret: False if nothing is planned
+    customdev: [(rank_id, device_id, device_ip), ...] of the current server in the planned rank table
+    custom_id: server_id of the current server
+---
+the same as RoutePlan.init of the vendor library (/usr/local/route/route_plan)
+
+planners are selected by the ROUTE_PLANNER env:
+---
+unset: the vendor planner if the library is installed, or the reference planner
+vendor | reference: the builtin planners
+${name}: a planner registered in the `davincirunsdk.route_planners` entry points
+${module}:${attr}: a planner class (or object) importable from the python path
+---
+"""
+import importlib
+import json
+import os
+import sys
+
+from davincirunsdk.common import FileHelper
+from davincirunsdk.common import ModelArtsLog
+from davincirunsdk.rank_table import RankTableV1, RankTableColumns, pack_ipv4
+
+log = ModelArtsLog.get_modelarts_logger()
+
+ROUTE_PLANNER_ENV = 'ROUTE_PLANNER'
+ENTRY_POINT_GROUP = 'davincirunsdk.route_planners'
+
+SDR_LIBRARY_PATH = '/usr/local/route'
+
+
+class VendorRoutePlanner:
+    """
+    adapter of the vendor library
+    """
+
+    def __init__(self, library_path=SDR_LIBRARY_PATH):
+        if library_path not in sys.path:
+            sys.path.append(library_path)
+        # raise ImportError if the library is not installed
+        from route_plan import RoutePlan
+        self.route_plan = RoutePlan
+
+    def init(self, topo_file, rank_file, save_rank_file, cursrvip):
+        return self.route_plan.init(topo_file=topo_file, rank_file=rank_file, save_rank_file=save_rank_file,
+                                    cursrvip=cursrvip)
+
+
+class ReferenceRoutePlanner:
+    """
+    make the ranks under the same ToR contiguous, a pure python planner
+
+    the ToR of a server is looked up in the server_list of the topo file (tor_id | tor | switch_id),
+    a server not in the topo file is grouped by the subnet (/subnet_prefix_len) of its server_id.
+    the groups are ordered by their first server in the rank table, so are the servers in a group,
+    the devices of a server keep their order, the rank ids are renumbered from 0
+    """
+    TOR_FIELDS = ('tor_id', 'tor', 'switch_id')
+    SUBNET_PREFIX_LEN = 24
+
+    def __init__(self, subnet_prefix_len=SUBNET_PREFIX_LEN):
+        self.subnet_prefix_len = subnet_prefix_len
+
+    @staticmethod
+    def read_server_tors(topo_file):
+        """
+        :return: server_id -> ToR
+        """
+        with open(topo_file) as f:
+            topojson = json.load(f)
+
+        server_tors = {}
+        for server in topojson.get('server_list') or []:
+            for field in ReferenceRoutePlanner.TOR_FIELDS:
+                if field in server:
+                    server_tors[server.get('server_id')] = str(server[field])
+                    break
+        return server_tors
+
+    def get_group_key(self, server_id, server_tors):
+        if server_id in server_tors:
+            return 'tor', server_tors[server_id]
+
+        packed_ip = pack_ipv4(server_id)
+        if packed_ip is None:
+            return 'server', server_id
+        return 'subnet', packed_ip >> (32 - self.subnet_prefix_len)
+
+    def plan(self, columns, server_tors):
+        """
+        :return: the server indexes in the planned order
+        """
+        groups = {}
+        for server_index, server_id in enumerate(columns.server_ids):
+            groups.setdefault(self.get_group_key(server_id, server_tors), []).append(server_index)
+        return [server_index for group in groups.values() for server_index in group]
+
+    def init(self, topo_file, rank_file, save_rank_file, cursrvip):
+        rank_table = RankTableV1(rank_file)
+        columns = rank_table.columns
+        server_order = self.plan(columns, ReferenceRoutePlanner.read_server_tors(topo_file))
+        if server_order == list(range(columns.get_server_num())):
+            log.info('Reference route plan, the ranks are in order already')
+            return False, None, None
+
+        planned_columns = RankTableColumns()
+        rank_id = 0
+        for server_index in server_order:
+            devices = []
+            for row in columns.get_server_rows(server_index):
+                devices.append((columns.get_value('device_id', row), columns.get_value('device_ip', row), str(rank_id)))
+                rank_id += 1
+            planned_columns.add_server(columns.server_ids[server_index], devices)
+
+        with FileHelper.atomic_write(save_rank_file) as f:
+            planned_columns.write_json(f, rank_table.header)
+
+        if cursrvip not in planned_columns.server_ids:
+            log.error('Reference route plan, server %s is not found' % cursrvip)
+            return False, None, None
+
+        server = planned_columns.get_server(planned_columns.server_ids.index(cursrvip))
+        customdev = [(device['rank_id'], device['device_id'], device['device_ip']) for device in server['device']]
+        return True, customdev, cursrvip
+
+
+BUILTIN_PLANNERS = {
+    'vendor': VendorRoutePlanner,
+    'reference': ReferenceRoutePlanner,
+}
+
+
+def get_entry_points():
+    try:
+        from importlib import metadata
+    except ImportError:
+        return []
+
+    entry_points = metadata.entry_points()
+    if hasattr(entry_points, 'select'):
+        return list(entry_points.select(group=ENTRY_POINT_GROUP))
+    return list(entry_points.get(ENTRY_POINT_GROUP, []))
+
+
+def instantiate(planner):
+    # a planner class or a planner object
+    return planner() if isinstance(planner, type) else planner
+
+
+def load_route_planner(name=None):
+    """
+    :param name: ROUTE_PLANNER env if None
+    :return: planner, None if it's not available
+    """
+    name = name or os.getenv(ROUTE_PLANNER_ENV, '')
+    try:
+        if not name:
+            try:
+                return VendorRoutePlanner()
+            except ImportError:
+                log.info('Route plan library is not found in %s, use the reference planner' % SDR_LIBRARY_PATH)
+                return ReferenceRoutePlanner()
+
+        if name in BUILTIN_PLANNERS:
+            return BUILTIN_PLANNERS[name]()
+
+        for entry_point in get_entry_points():
+            if entry_point.name == name:
+                return instantiate(entry_point.load())
+
+        if ':' in name:
+            module_name, _, attr = name.partition(':')
+            return instantiate(getattr(importlib.import_module(module_name), attr))
+    except Exception as e:
+        log.error('Load route planner [%s] failed: %s: %s' % (name, type(e).__name__, e))
+        return None
+
+    log.error('Route planner [%s] is not found' % name)
+    return None
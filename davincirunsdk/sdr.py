@@ -1,21 +1,97 @@
+import binascii
+import hashlib
 import json
 import os
 import sys
-import base64
-import gzip
 import time
+import zlib
 
+from davincirunsdk.common import FileHelper
+from davincirunsdk.common import ModelArts
 from davincirunsdk.common import ModelArtsLog
 from davincirunsdk.common import RankTableEnv
+from davincirunsdk.file_watcher import FileChangeWatcher
 from davincirunsdk.rank_table import Device, Instance
+from davincirunsdk.route_planner import load_route_planner
 
 log = ModelArtsLog.get_modelarts_logger()
 
 TOPO_FILE_PATH = os.getenv('TOPO_FILE_PATH', '/user/config/ranktable_tor.json')
-SDR_LIBRARY_PATH = '/usr/local/route'
+
+
+class TopoLoader:
+    """
+    load the topo file (base64 of the gzip of the topo json)
+
+    the file is decoded and decompressed chunk by chunk,
+    the result is cached by the file stat, an unchanged file is never decoded twice
+    """
+    READ_SIZE = 1 << 16
+
+    # file path -> ((size, mtime_ns, inode), decompressed string)
+    _cache = {}
+
+    @staticmethod
+    def get_state(file_path):
+        file_stat = os.stat(file_path)
+        return file_stat.st_size, file_stat.st_mtime_ns, file_stat.st_ino
+
+    @staticmethod
+    def load(file_path):
+        """
+        :return: the decompressed string
+        :raise OSError, ValueError (incl. binascii.Error, UnicodeDecodeError), zlib.error: the file is not ready
+        """
+        state = TopoLoader.get_state(file_path)
+        cached = TopoLoader._cache.get(file_path)
+        if cached is not None and cached[0] == state:
+            return cached[1]
+
+        decompressed_string = TopoLoader.decode(file_path)
+        TopoLoader._cache[file_path] = (state, decompressed_string)
+        return decompressed_string
+
+    @staticmethod
+    def decode(file_path):
+        # 16 + MAX_WBITS: gzip header and trailer
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        decompressed_chunks = []
+        encoded_remain = b''
+        with open(file_path, 'rb') as topo_file:
+            while True:
+                encoded = topo_file.read(TopoLoader.READ_SIZE)
+                if not encoded:
+                    break
+                # base64 is decoded in groups of 4 characters, keep the rest for the next chunk
+                encoded = encoded_remain + encoded.translate(None, b' \t\r\n')
+                split = len(encoded) - len(encoded) % 4
+                encoded_remain = encoded[split:]
+                decompressor = TopoLoader.decompress(decompressor, binascii.a2b_base64(encoded[:split]),
+                                                     decompressed_chunks)
+
+        if encoded_remain:
+            raise ValueError('incomplete base64 content')
+        decompressed_chunks.append(decompressor.flush())
+        if not decompressor.eof:
+            raise ValueError('incomplete gzip content')
+        return b''.join(decompressed_chunks).decode('utf-8')
+
+    @staticmethod
+    def decompress(decompressor, data, decompressed_chunks):
+        decompressed_chunks.append(decompressor.decompress(data))
+        while decompressor.eof and decompressor.unused_data:
+            # the next gzip member, the same as gzip.decompress
+            data = decompressor.unused_data
+            decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            decompressed_chunks.append(decompressor.decompress(data))
+        return decompressor
 
 
 class RouteHelper:
+    # seconds to wait for the topo file
+    TOPO_WAIT_TIME_ENV = 'ROUTE_TOPO_WAIT_TIME'
+    DEFAULT_TOPO_WAIT_TIME = 60 * 5
+
     def do_route_plan(self, rank_file, instance):
         # Default disable route plan acceleration.
         # It's allowed to set env ROUTE_PLAN = true to start the acceleration.
@@ -31,22 +107,13 @@ class RouteHelper:
             log.info("Route Plan ends with only support for Python 3 now.")
             return None
 
-        # Check if route plan so files path is available.
-        if os.path.exists(SDR_LIBRARY_PATH) is None:
-            log.error("Cannot find software defined route module path.")
-            return None
-        sys.path.append(SDR_LIBRARY_PATH)
-
-        # Check if route plan so code files exist.
-        try:
-            from route_plan import RoutePlan
-        except ModuleNotFoundError:
-            log.error("Route plan so files not found. "
-                      "Please check files in {}".format(SDR_LIBRARY_PATH))
+        # The vendor library (/usr/local/route) or the planner selected by env ROUTE_PLANNER.
+        route_planner = load_route_planner()
+        if route_planner is None:
             return None
 
-        log.info('Route plan begins. Current server {}'.format(
-            instance.server_id))
+        log.info('Route plan begins with {}. Current server {}'.format(
+            type(route_planner).__name__, instance.server_id))
 
         # Decompress topo file by base64 and gzip
         try:
@@ -61,7 +128,7 @@ class RouteHelper:
             os.path.dirname(rank_file), "jobstart_routeplan.json")
         # Start route plan acceleration.
         try:
-            ret, customdev, custom_id = RoutePlan.init(
+            ret, customdev, custom_id = route_planner.init(
                 topo_file=output_topo_file_path,
                 rank_file=rank_file,
                 save_rank_file=save_rank_file,
@@ -90,64 +157,111 @@ class RouteHelper:
         return current_instance
 
     @staticmethod
-    def wait_for_topo_available(input_topo_file_path, period=1):
+    def get_topo_wait_time():
+        wait_time = os.getenv(RouteHelper.TOPO_WAIT_TIME_ENV)
+        if wait_time is None:
+            return RouteHelper.DEFAULT_TOPO_WAIT_TIME
+
+        try:
+            wait_time = float(wait_time)
+        except ValueError:
+            wait_time = -1
+        if wait_time < 0:
+            log.warning('invalid %s: %s, use the default value %ds' % (
+                RouteHelper.TOPO_WAIT_TIME_ENV, os.getenv(RouteHelper.TOPO_WAIT_TIME_ENV),
+                RouteHelper.DEFAULT_TOPO_WAIT_TIME))
+            return RouteHelper.DEFAULT_TOPO_WAIT_TIME
+        return wait_time
+
+    @staticmethod
+    def wait_for_topo_available(input_topo_file_path, period=1, maximum_wait_time=None):
         log.info('Wait for Rank table file ready')
 
-        wait_time = 0
-        maximum_wait_time = os.getenv('ROUTE_TOPO_WAIT_TIME', 60 * 5)
+        if maximum_wait_time is None:
+            maximum_wait_time = RouteHelper.get_topo_wait_time()
+        deadline = time.time() + maximum_wait_time
         decompressed_topo_string = ""
 
-        while True:
-            wait_time += period
-
-            if wait_time > maximum_wait_time:
-                log.info("Route plan wait time reaches the maximum {}s "
-                         "for generating topo file {}".format(
-                          maximum_wait_time, input_topo_file_path))
-                return decompressed_topo_string
-
-            if not os.path.exists(input_topo_file_path):
-                time.sleep(period)
-                continue
-            try:
-                with open(input_topo_file_path, 'r') as input_topo_file:
-                    compressed_topo_string = input_topo_file.read()
-                    decompressed_topo_string = gzip.decompress(
-                        base64.b64decode(compressed_topo_string)).decode(
-                        'utf-8')
-                    topojson = json.loads(decompressed_topo_string)
-                    if topojson["status"] == "completed":
-                        return decompressed_topo_string
-            except Exception as exception:
-                log.debug("Route plan topo file {} is not available with compressed content {}"
-                          .format(input_topo_file_path, compressed_topo_string),
-                          exception)
-
-            time.sleep(period)
-
-        return decompressed_topo_string
+        with FileChangeWatcher(input_topo_file_path, period) as watcher:
+            while True:
+                # only decode the topo file when it's changed
+                if watcher.changed():
+                    try:
+                        decompressed_topo_string = TopoLoader.load(input_topo_file_path)
+                        topojson = json.loads(decompressed_topo_string)
+                        if topojson["status"] == "completed":
+                            return decompressed_topo_string
+                    except (OSError, ValueError, KeyError, TypeError, zlib.error) as exception:
+                        log.debug("Route plan topo file {} is not available: {}".format(
+                            input_topo_file_path, exception))
+
+                remain_time = deadline - time.time()
+                if remain_time <= 0:
+                    log.info("Route plan wait time reaches the maximum {}s "
+                             "for generating topo file {}".format(
+                              maximum_wait_time, input_topo_file_path))
+                    return decompressed_topo_string
+
+                watcher.wait(remain_time)
+
+    @staticmethod
+    def get_topo_cache_dir():
+        # per job, the staged topo file is never shared with other jobs
+        return os.path.join(RankTableEnv.get_rank_table_v1_file_dir(), 'route_plan', ModelArts.get_job_id())
+
+    @staticmethod
+    def get_topo_summary(decompressed_topo_string):
+        try:
+            topojson = json.loads(decompressed_topo_string)
+        except ValueError:
+            return 'invalid json'
+
+        if not isinstance(topojson, dict):
+            return 'not a json object'
+        server_count = topojson.get('server_count')
+        if server_count is None:
+            server_count = len(topojson.get('server_list') or [])
+        return 'status: {}, server count: {}'.format(topojson.get('status'), server_count)
 
     @staticmethod
     def decompress_topo_file(input_topo_file_path):
+        """
+        stage the decompressed topo file into the cache dir of the job
 
+        :return: path of the decompressed topo file
+        """
         decompressed_topo_string = RouteHelper.wait_for_topo_available(
             input_topo_file_path)
 
-        log.info("Route plan decompress topo file as {}".format(
-            decompressed_topo_string))
+        decompressed_topo = decompressed_topo_string.encode('utf-8')
+        digest = hashlib.sha256(decompressed_topo).hexdigest()
+        log.info("Route plan decompress topo file, size: {}, {}, sha256: {}".format(
+            len(decompressed_topo), RouteHelper.get_topo_summary(decompressed_topo_string), digest))
 
-        output_topo_file_path = os.path.join(
-            os.path.dirname(os.getcwd()),
-            "ranktable_tor_decompress.json")
+        cache_dir = RouteHelper.get_topo_cache_dir()
+        os.makedirs(cache_dir, exist_ok=True)
+        output_topo_file_path = os.path.join(cache_dir, "ranktable_tor_decompress.json")
 
-        with os.fdopen(os.open(os.path.realpath(output_topo_file_path),
-                               os.O_WRONLY | os.O_CREAT, 0o640),
-                       'w') as output_topo_file:
-            output_topo_file.write(decompressed_topo_string)
-            output_topo_file.close()
+        if RouteHelper.is_same_file(output_topo_file_path, len(decompressed_topo), digest):
+            log.info("Route plan reuse the decompressed topo file {}".format(output_topo_file_path))
+            return output_topo_file_path
+
+        # a new file replaces the old one as a whole, no stale bytes are left behind
+        with FileHelper.atomic_write(output_topo_file_path, 'wb', 0o640) as output_topo_file:
+            output_topo_file.write(decompressed_topo)
 
         return output_topo_file_path
 
+    @staticmethod
+    def is_same_file(file_path, size, digest):
+        try:
+            if os.path.getsize(file_path) != size:
+                return False
+            with open(file_path, 'rb') as f:
+                return hashlib.sha256(f.read()).hexdigest() == digest
+        except OSError:
+            return False
+
     @staticmethod
     def log_exception(exception):
         # Default disable exception traceback.
@@ -1,7 +1,10 @@
 # coding:utf-8
 import argparse
+import heapq
+import mmap
 import os
 import re
+from concurrent.futures import ProcessPoolExecutor
 
 
 def init_parser():
@@ -10,34 +13,193 @@ def init_parser():
     parser.add_argument("-s", "--start", help="start time")
     parser.add_argument("-e", "--end", help="end time")
     parser.add_argument("-o", "--output", help="output file")
+    parser.add_argument("-j", "--jobs", type=int, default=0,
+                        help="processes splitting the devices, 0 means one process per device")
+    parser.add_argument("-m", "--merge", help="merge the logs of all devices into one time-ordered file")
     return parser.parse_args()
 
 
+WRITE_BUFFER_SIZE = 1 << 20
+
+# e.g. 2021-01-20-14:49:37
+time_pattern = re.compile(rb'\d{4}-\d{2}-\d{2}-\d{2}:\d{2}:\d{2}')
+
+
+def get_line_time(line):
+    matched = time_pattern.search(line)
+    return None if matched is None else matched.group()
+
+
+def next_line_start(mm, offset):
+    """
+    :return: the start of the first line at or after offset
+    """
+    if offset <= 0:
+        return 0
+    line_end = mm.find(b'\n', offset - 1)
+    return len(mm) if line_end < 0 else line_end + 1
+
+
+def first_timed_line(mm, offset, end):
+    """
+    :return: (line start, time) of the first line with a timestamp in [offset, end), (end, None) if not found
+    """
+    while offset < end:
+        line_end = mm.find(b'\n', offset, end)
+        if line_end < 0:
+            line_end = end
+        line_time = get_line_time(mm[offset:line_end])
+        if line_time is not None:
+            return offset, line_time
+        offset = line_end + 1
+    return end, None
+
+
+def find_window_start(mm, start_time):
+    """
+    binary search the byte offset of the first record not earlier than start_time,
+    the device log is roughly time-ordered, the records around the offset are filtered again when streaming
+    """
+    lo, hi = 0, len(mm)
+    while lo < hi:
+        mid = next_line_start(mm, (lo + hi) // 2)
+        if mid >= hi:
+            break
+
+        line_start, line_time = first_timed_line(mm, mid, hi)
+        if line_time is None or line_time >= start_time:
+            hi = mid
+        else:
+            lo = next_line_start(mm, line_start + 1)
+    return lo
+
+
+def extract_time_window(mm, f_out, start_time, end_time):
+    """
+    write the records in [start_time, end_time] to f_out,
+    a line without timestamp is carried along with the previous record
+    """
+    offset = find_window_start(mm, start_time)
+    size = len(mm)
+    in_window = False
+    while offset < size:
+        line_end = mm.find(b'\n', offset)
+        line_end = size if line_end < 0 else line_end + 1
+
+        line_time = get_line_time(mm[offset:line_end])
+        if line_time is not None:
+            if line_time > end_time:
+                break
+            in_window = line_time >= start_time
+
+        if in_window:
+            f_out.write(mm[offset:line_end])
+        offset = line_end
+
+
+def list_sorted_by_mtime(input_path):
+    """
+    :return: files in input_path, latest modified first
+    """
+    mtime_list = []
+    with os.scandir(input_path) as entries:
+        for entry in entries:
+            try:
+                mtime_list.append((entry.stat().st_mtime, entry.path))
+            except OSError:
+                continue
+    mtime_list.sort(reverse=True)
+    return [path for _, path in mtime_list]
+
+
 def parse_log(input_path, output_file, start_time, end_time):
-    name_list = os.listdir(input_path)
-    full_list = [os.path.join(input_path, i) for i in name_list]
     # list file sorted by date
-    time_sorted_list = sorted(full_list, key=os.path.getmtime, reverse=True)
-    latest_log = time_sorted_list[0]
-    f_out = open(output_file, "w")
-    # 暂时全部日志
-    time_pattern = re.compile(r'\d{4}-\d{2}-\d{2}-\d{2}:\d{2}:\d{2}')
+    time_sorted_list = list_sorted_by_mtime(input_path)
     # convert time from %Y-%m-%d-%H-%M-%S to %Y%m%d%H%M%S
     device_start_time = start_time.replace("-", "").replace(":", "")
+    selected_list = []
     for device in time_sorted_list:
-        try:
-            with open(device, "r") as f:
-                for line in f:
-                    if start_time <= time_pattern.findall(line)[0] <= end_time:
-                        f_out.write(line)
-            # find the first device log file
-            device_time = re.findall(r"\d{14}", device)[0]
-            if device_time < device_start_time:
-                break
-        except:
-            pass
+        selected_list.append(device)
+        # find the first device log file
+        device_time = re.findall(r"\d{14}", os.path.basename(device))
+        if device_time and device_time[0] < device_start_time:
+            break
+
+    # 暂时全部日志
+    start_time_bytes = start_time.encode()
+    end_time_bytes = end_time.encode()
+    with open(output_file, "wb", buffering=WRITE_BUFFER_SIZE) as f_out:
+        # oldest file first, the output is time-ordered
+        for device in reversed(selected_list):
+            try:
+                with open(device, "rb") as f:
+                    if os.fstat(f.fileno()).st_size > 0:
+                        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                            extract_time_window(mm, f_out, start_time_bytes, end_time_bytes)
+            except (OSError, ValueError) as e:
+                print('parse %s failed: %s' % (device, e))
+
+
+def iter_records(file_path):
+    """
+    :return: iterator of (time, record), a record is a line with timestamp and the lines carried along with it
+    """
+    record_time = b''
+    record = []
+    with open(file_path, "rb", buffering=WRITE_BUFFER_SIZE) as f:
+        for line in f:
+            line_time = get_line_time(line)
+            if line_time is not None and record:
+                yield record_time, record
+                record = []
+            if line_time is not None:
+                record_time = line_time
+            record.append(line)
+    if record:
+        yield record_time, record
+
+
+def merge_logs(output_files, merged_output):
+    """
+    k-way merge the time-ordered outputs of the devices, each line is prefixed with the device name
+    """
+    def prefixed_records(output_file):
+        prefix = os.path.basename(output_file).encode() + b': '
+        for record_time, record in iter_records(output_file):
+            yield record_time, [prefix + line for line in record]
+
+    with open(merged_output, "wb", buffering=WRITE_BUFFER_SIZE) as f_out:
+        for _, record in heapq.merge(*[prefixed_records(output_file) for output_file in output_files],
+                                     key=lambda item: item[0]):
+            f_out.writelines(record)
+
+
+def split_device_logs(device_path, output_path, start_time, end_time, jobs=0, merged_output=None):
+    """
+    split the logs of all devices in a process pool
+
+    :param jobs: size of the process pool, 0 means one process per device
+    :param merged_output: path of the merged output, not merged if None
+    :return: output files
+    """
+    device_names = ["device-" + str(index) for index in range(0, 8)] + ["device-os-0", "device-os-4"]
+    device_names = [device_name for device_name in device_names
+                    if os.path.isdir(os.path.join(device_path, device_name))]
+    output_files = [os.path.join(output_path, device_name) for device_name in device_names]
+
+    tasks = [(os.path.join(device_path, device_name), output_file, start_time, end_time)
+             for device_name, output_file in zip(device_names, output_files)]
+    if jobs == 1 or len(tasks) <= 1:
+        for task in tasks:
+            parse_log(*task)
+    elif tasks:
+        with ProcessPoolExecutor(max_workers=jobs or len(tasks)) as executor:
+            for future in [executor.submit(parse_log, *task) for task in tasks]:
+                future.result()
 
-    f_out.close()
+    if merged_output is not None:
+        merge_logs(output_files, merged_output)
+    return output_files
 
 
 if __name__ == '__main__':
@@ -60,10 +222,5 @@ if __name__ == '__main__':
         print("=== python splitLog.py -s start_time -e end_time -o output ... ===")
         exit(0)
 
-    # 处理device 0~7的日志
-    for index in range(0, 8):
-        parse_log(DEVICE_PATH + "/device-" + str(index), output_path + "/device-" + str(index), args.start, args.end)
-    # 处理device-os-0的日志
-    parse_log(DEVICE_PATH + "/device-os-0", output_path + "/device-os-0", args.start, args.end)
-    # 处理device-os-4的日志
-    parse_log(DEVICE_PATH + "/device-os-4", output_path + "/device-os-4", args.start, args.end)
+    # 处理device 0~7, device-os-0, device-os-4的日志
+    split_device_logs(DEVICE_PATH, output_path, args.start, args.end, jobs=args.jobs, merged_output=args.merge)
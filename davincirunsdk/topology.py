@@ -0,0 +1,162 @@
+from davincirunsdk.common import ModelArtsLog
+from davincirunsdk.rank_table import RankTableColumns
+
+log = ModelArtsLog.get_modelarts_logger()
+
+
+def format_ranks(ranks):
+    """
+    compact a rank list for env vars, e.g. [0, 1, 2, 3, 8, 16, 17] -> '0-3,8,16-17'
+    """
+    ranges = []
+    for rank in ranks:
+        if ranges and rank == ranges[-1][1] + 1:
+            ranges[-1][1] = rank
+        else:
+            ranges.append([rank, rank])
+    return ','.join(str(start) if start == end else '%d-%d' % (start, end) for start, end in ranges)
+
+
+def parse_ranks(ranks_str):
+    """
+    the reverse of format_ranks
+    """
+    ranks = []
+    for part in ranks_str.split(','):
+        if not part:
+            continue
+        start, _, end = part.partition('-')
+        ranks.extend(range(int(start), int(end or start) + 1))
+    return ranks
+
+
+class Topology:
+    """
+    topology of the ranks, analysed once from the (v1) rank table
+    ---
+    server blocks: the ranks on the same server, ordered by rank id
+    subnet groups: the ranks whose device ips are in the same subnet (/subnet_prefix_len),
+                   the NICs in a subnet are normally connected to the same ToR
+    hierarchical groups: intra-server groups (the server blocks)
+                         + inter-server groups (the ranks with the same local index on each server)
+    ---
+    the groups of a rank are exported as env vars (DAVINCIRUN_TOPO_*) by FMK.gen_env_for_fmk
+    """
+    SUBNET_PREFIX_LEN = 24
+
+    ALGO_RING = 'ring'
+    ALGO_HIERARCHICAL = 'hierarchical'
+
+    ENV_PREFIX = 'DAVINCIRUN_TOPO_'
+
+    def __init__(self, server_ids, server_blocks, rank_subnets):
+        """
+        :param server_ids: [server_id, ...]
+        :param server_blocks: [[rank_id, ...], ...], aligned with server_ids
+        :param rank_subnets: rank_id -> subnet key
+        """
+        self.server_ids = server_ids
+        self.server_blocks = server_blocks
+
+        # rank_id -> (server index, local index)
+        self.rank_locations = {}
+        for server_index, block in enumerate(server_blocks):
+            for local_index, rank_id in enumerate(block):
+                self.rank_locations[rank_id] = (server_index, local_index)
+
+        # subnet key -> [rank_id, ...]
+        subnet_groups = {}
+        for rank_id in sorted(rank_subnets):
+            subnet_groups.setdefault(rank_subnets[rank_id], []).append(rank_id)
+        self.subnet_groups = list(subnet_groups.values())
+        self.rank_subnet_index = {}
+        for subnet_index, group in enumerate(self.subnet_groups):
+            for rank_id in group:
+                self.rank_subnet_index[rank_id] = subnet_index
+
+        max_local_size = max((len(block) for block in server_blocks), default=0)
+        self.inter_server_groups = [[block[local_index] for block in server_blocks if local_index < len(block)]
+                                    for local_index in range(max_local_size)]
+
+        # the env vars are formatted on demand and shared by the ranks of the same group
+        self.formatted = {}
+
+    @staticmethod
+    def from_rank_table(rank_table, subnet_prefix_len=SUBNET_PREFIX_LEN):
+        """
+        :param rank_table: RankTable (RankTableV1 or converted RankTableV0)
+        """
+        columns = rank_table.columns
+        subnet_mask = (0xFFFFFFFF << (32 - subnet_prefix_len)) & 0xFFFFFFFF
+
+        server_blocks = []
+        rank_subnets = {}
+        for server_index in range(columns.get_server_num()):
+            block = []
+            for row in columns.get_server_rows(server_index):
+                rank_id = int(columns.get_value('rank_id', row))
+                block.append(rank_id)
+
+                packed_ip = columns.device_ip[row]
+                if packed_ip == RankTableColumns.UNPACKED:
+                    # e.g. IPv6, not grouped with the others
+                    rank_subnets[rank_id] = columns.get_value('device_ip', row)
+                else:
+                    rank_subnets[rank_id] = packed_ip & subnet_mask
+            server_blocks.append(sorted(block))
+
+        topology = Topology(list(columns.server_ids), server_blocks, rank_subnets)
+        log.info('rank topology, servers: %d, subnets: %d, suggested algorithm: %s',
+                 len(server_blocks), len(topology.subnet_groups), topology.get_suggested_algo())
+        return topology
+
+    def get_suggested_algo(self):
+        """
+        hierarchical when there are several servers with several devices each, and the same number of devices
+        """
+        block_sizes = set(len(block) for block in self.server_blocks)
+        if len(self.server_blocks) > 1 and len(block_sizes) == 1 and block_sizes.pop() > 1:
+            return Topology.ALGO_HIERARCHICAL
+        return Topology.ALGO_RING
+
+    def get_server_block(self, rank_id):
+        server_index, _ = self.rank_locations[rank_id]
+        return self.server_blocks[server_index]
+
+    def get_subnet_group(self, rank_id):
+        return self.subnet_groups[self.rank_subnet_index[rank_id]]
+
+    def get_inter_server_group(self, rank_id):
+        _, local_index = self.rank_locations[rank_id]
+        return self.inter_server_groups[local_index]
+
+    def format_group(self, kind, index, group):
+        key = (kind, index)
+        if key not in self.formatted:
+            self.formatted[key] = format_ranks(group)
+        return self.formatted[key]
+
+    def get_envs(self, rank_id):
+        """
+        :return: env vars of the rank, {} if the rank is not in the rank table
+        """
+        rank_id = int(rank_id)
+        if rank_id not in self.rank_locations:
+            return {}
+
+        server_index, local_index = self.rank_locations[rank_id]
+        subnet_index = self.rank_subnet_index[rank_id]
+        prefix = Topology.ENV_PREFIX
+        return {
+            prefix + 'SERVER_COUNT': str(len(self.server_blocks)),
+            prefix + 'SERVER_INDEX': str(server_index),
+            prefix + 'LOCAL_RANK': str(local_index),
+            prefix + 'LOCAL_SIZE': str(len(self.server_blocks[server_index])),
+            prefix + 'SERVER_RANKS': self.format_group('server', server_index, self.server_blocks[server_index]),
+            prefix + 'INTER_SERVER_RANKS': self.format_group('inter', local_index,
+                                                             self.inter_server_groups[local_index]),
+            prefix + 'SUBNET_COUNT': str(len(self.subnet_groups)),
+            prefix + 'SUBNET_INDEX': str(subnet_index),
+            prefix + 'SUBNET_RANKS': self.format_group('subnet', subnet_index, self.subnet_groups[subnet_index]),
+            prefix + 'SUGGESTED_ALGO': self.get_suggested_algo(),
+        }
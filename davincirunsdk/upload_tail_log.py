@@ -1,36 +1,35 @@
 # coding:utf-8
 import argparse
+import mmap
 import os
 from pathlib import Path
-import subprocess
-from subprocess import check_output
-import heapq
 import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
 
-try:
-    import moxing as mox
-except ImportError:
-    debug = True
-else:
-    debug = False
+from davincirunsdk.common import ModelArts
+
+# seconds to wait for the running tasks to finish the file being written after the deadline
+STOP_GRACE_TIME = 5
 
 
 def init_parser():
     parser = argparse.ArgumentParser()
     parser.add_argument("-l", "--lines", type=int, default=1024, help="log lines")
     parser.add_argument("-o", "--output", help="obs path, format s3://training/log/")
+    parser.add_argument("-w", "--workers", type=int, default=4, help="parallelism of collecting log")
+    parser.add_argument("-t", "--timeout", type=float, default=0,
+                        help="deadline (seconds) of collecting log, 0 means no deadline")
     return parser.parse_args()
 
 
 def print_args(input_args):
-    print("upload_tail_log.py -l %d -o %s" % (input_args.lines, input_args.output))
+    print("upload_tail_log.py -l %d -o %s -w %d -t %s" % (input_args.lines, input_args.output,
+                                                         input_args.workers, input_args.timeout))
 
 
 class AscendLogFile:
-    # log type
-    type_plog = 'plog'
-    type_device = 'device'
-
     """
     ascend c76 log filename format:
     ---
@@ -39,49 +38,35 @@ class AscendLogFile:
     ---
     specially, we assume pid is in range of 1 - 999999
     """
-    proc_log_file_name_pattern = re.compile(r'plog-\d{1,6}_\d{17}.log')
-    device_log_file_name_pattern = re.compile(r'device-\d{1,6}_\d{17}.log')
-
-    def __init__(self):
-        self.log_file_name = None
-        self.log_type = None
-
-        self.log_file_created_time = None
-        self.log_file_pid = None
-
-    def set_log_file(self, log_file_name):
-        """
-        firstly, use this func
-        valid and set log file name
-        """
-        valid = False
-        if AscendLogFile.proc_log_file_name_pattern.match(log_file_name):
-            self.log_type = AscendLogFile.type_plog
-            valid = True
+    __slots__ = ('log_file_name', 'log_type', 'log_file_pid', 'log_file_created_time', 'size')
 
-        if AscendLogFile.device_log_file_name_pattern.match(log_file_name):
-            self.log_type = AscendLogFile.type_device
-            valid = True
+    # log type
+    type_plog = 'plog'
+    type_device = 'device'
 
-        if not valid:
-            return False
+    log_file_name_pattern = re.compile(r'(?P<type>plog|device)-(?P<pid>\d{1,6})_(?P<timestamp>\d{17})\.log')
 
+    def __init__(self, log_file_name, log_type, log_file_pid, log_file_created_time, size=0):
         self.log_file_name = log_file_name
+        self.log_type = log_type
+        self.log_file_pid = log_file_pid
+        self.log_file_created_time = log_file_created_time
+        self.size = size
 
-        self.log_file_created_time = self.parse_created_time()
-        self.log_file_pid = self.parse_pid()
-
-        return True
+    @staticmethod
+    def parse(log_file_name, size=0):
+        """
+        :return: AscendLogFile, None if it's not an ascend log file
+        """
+        matched = AscendLogFile.log_file_name_pattern.match(log_file_name)
+        if matched is None:
+            return None
+        return AscendLogFile(log_file_name, matched.group('type'), matched.group('pid'),
+                             matched.group('timestamp'), size)
 
     def get_log_file(self):
         return self.log_file_name
 
-    def __lt__(self, other):
-        """
-        compare pid log file by created time, latest file first
-        """
-        return self.get_created_time() > other.get_created_time()
-
     def get_created_time(self):
         return self.log_file_created_time
 
@@ -91,124 +76,206 @@ class AscendLogFile:
         """
         return self.log_file_pid
 
-    def parse_created_time(self):
-        arr = self.log_file_name.split('_')
-        if len(arr) > 1:
-            timestamp_with_ext = arr[1]
-            return timestamp_with_ext.split('.')[0]
-
-        return None
-
-    def parse_pid(self):
-        arr = self.log_file_name.split('_')
-        if len(arr) > 0:
-            prefix = arr[0]
-            arr = prefix.split('-')
-        if len(arr) > 1:
-            return arr[1]
-
-        return None
-
 
-class AscendLogFilePidCollector:
+class AscendLogIndex:
     """
-    collect ascend log by pid
+    index of the ascend log files in a directory, built by one os.scandir pass
+
+    the names are parsed once, the files of each pid are sorted by created time (latest file first)
     """
 
-    def __init__(self):
+    def __init__(self, log_dir):
+        self.log_dir = log_dir
         # [id1, id2, id3, ...]
         self.pid_arr = []
-        # id -> [id_file_1, id_file_2, ...]
+        # id -> [latest file, ..., oldest file]
         self.pid_to_files_map = {}
 
-    def add_log_file(self, ascend_log_file):
-        """
-        add the log file to inner heap (latest file first)
-        """
-        log_file_pid = ascend_log_file.get_pid()
+    @staticmethod
+    def build(log_dir):
+        index = AscendLogIndex(log_dir)
+        with os.scandir(log_dir) as entries:
+            for entry in entries:
+                log_file = AscendLogFile.parse(entry.name)
+                if log_file is None:
+                    continue
+                try:
+                    if not entry.is_file():
+                        continue
+                    log_file.size = entry.stat().st_size
+                except OSError:
+                    # removed by the log rotation of ascend
+                    continue
+                index.add_log_file(log_file)
+
+        for log_files in index.pid_to_files_map.values():
+            # the timestamps are fixed width, the string order is the time order
+            log_files.sort(key=AscendLogFile.get_created_time, reverse=True)
+        return index
+
+    def add_log_file(self, log_file):
+        log_file_pid = log_file.get_pid()
         if log_file_pid not in self.pid_to_files_map:
             self.pid_arr.append(log_file_pid)
-            self.pid_to_files_map[log_file_pid] = [ascend_log_file]
-        else:
-            heapq.heappush(self.pid_to_files_map[log_file_pid], ascend_log_file)
+            self.pid_to_files_map[log_file_pid] = []
+        self.pid_to_files_map[log_file_pid].append(log_file)
 
     def get_pid_arr(self):
         return self.pid_arr
 
-    def get_log_file(self, log_file_id):
+    def get_latest_files(self, pid, k=None):
         """
-        get log file by its latest created time and remove it from inner heap
+        :return: the latest k (all if None) log files of the pid, latest file first
         """
-        if log_file_id is None or \
-                log_file_id not in self.pid_to_files_map or \
-                len(self.pid_to_files_map[log_file_id]) == 0:
-            return None
+        log_files = self.pid_to_files_map.get(pid, [])
+        return log_files if k is None else log_files[:k]
 
-        return heapq.heappop(self.pid_to_files_map[log_file_id])
 
+class CollectReport:
+    """
+    result of collect_latest_n_log
+    """
 
-def collect_latest_n_log(new_log_dir, n):
+    def __init__(self):
+        # [(new log file, lines), ...]
+        self.collected = []
+        # ${short_name}-${pid}, not (fully) collected before the deadline
+        self.incomplete = []
+        self.timed_out = False
+        self.elapsed = 0
+        # ${short_name}-${pid}, still writing after the grace time, the new log file may be partial
+        self.unfinished = []
+
+    def summary(self):
+        return 'collected %d log files in %.2fs, timed out: %s, incomplete: %s, unfinished: %s' % (
+            len(self.collected), self.elapsed, self.timed_out, self.incomplete, self.unfinished)
+
+
+def collect_latest_n_log(new_log_dir, n, workers=1, timeout=None):
     """
     generate limited lines(n) log file in new_log_dir
+
+    :param workers: size of the thread pool, the directories and pids are collected concurrently
+    :param timeout: deadline in seconds, the partial result is returned when it's hit,
+                    after the running tasks finish the file being written (at most STOP_GRACE_TIME seconds)
+    :return: CollectReport
     """
+    report = CollectReport()
+    start_time = time.time()
+    deadline = start_time + timeout if timeout else None
+
     home = str(Path.home())
     ascend_log_dir = os.path.join(home, 'ascend/log')
 
     if not os.path.isdir(ascend_log_dir):
         print("%s is not found" % ascend_log_dir)
-        return []
+        return report
 
     print('list %s' % ascend_log_dir)
-    if not debug:
+    mox = ModelArts.import_moxing()
+    if mox is not None:
         for f in mox.file.list_directory(ascend_log_dir, recursive=True):
             print(f)
 
     # ~/ascend/log/plog/plog-${pid}_${timestamp}.log
-    plog_collector = AscendLogFilePidCollector()
-
+    # ~/ascend/log/device-${id}/device-${pid}_${timestamp}.log
+    log_dirs = []
     ascend_proc_log_dir = os.path.join(ascend_log_dir, 'plog')
     if os.path.isdir(ascend_proc_log_dir):
-        for target in [f for f in os.listdir(ascend_proc_log_dir)]:
-            ascend_log_file = AscendLogFile()
-            if ascend_log_file.set_log_file(target):
-                plog_collector.add_log_file(ascend_log_file)
+        log_dirs.append((ascend_proc_log_dir, 'plog'))
 
-        generate_limited_lines_pid_log_file(new_log_dir, ascend_proc_log_dir, 'plog', plog_collector, n)
-
-    # ~/ascend/log/device-${id}/device-${pid}_${timestamp}.log
     device_id_pattern = re.compile(r'device-[0-7]')
-    for device_id_dir in [log_dir for log_dir in os.listdir(ascend_log_dir) if device_id_pattern.match(log_dir)]:
-        device_log_collector = AscendLogFilePidCollector()
-        ascend_device_log_dir = os.path.join(ascend_log_dir, device_id_dir)
+    with os.scandir(ascend_log_dir) as entries:
+        for entry in entries:
+            if device_id_pattern.match(entry.name) and entry.is_dir():
+                log_dirs.append((entry.path, entry.name))
+
+    executor = ThreadPoolExecutor(max_workers=max(workers, 1))
+    # the tasks check it before writing each file
+    stop = threading.Event()
+    list_futures = {}
+    pid_futures = {}
+    try:
+        # list the directories, then tail the files of each pid
+        list_futures = {executor.submit(AscendLogIndex.build, log_dir): (log_dir, short_name)
+                        for log_dir, short_name in log_dirs}
+        done, not_done = wait(list_futures, timeout=get_remain_time(deadline))
+        for future in not_done:
+            report.incomplete.append(list_futures[future][1])
+
+        for future in done:
+            log_dir, short_name = list_futures[future]
+            try:
+                log_index = future.result()
+            except OSError as e:
+                print('list %s failed: %s' % (log_dir, e))
+                report.incomplete.append(short_name)
+                continue
+            for pid in log_index.get_pid_arr():
+                pid_future = executor.submit(generate_limited_lines_log_file_of_pid, new_log_dir, short_name,
+                                             log_index, pid, n, deadline, stop)
+                pid_futures[pid_future] = '%s-%s' % (short_name, pid)
+
+        done, not_done = wait(pid_futures, timeout=get_remain_time(deadline))
+        for future in done:
+            new_log_file, written_lines, complete = future.result()
+            if written_lines > 0:
+                report.collected.append((new_log_file, written_lines))
+            if not complete:
+                report.incomplete.append(pid_futures[future])
+        for future in not_done:
+            report.incomplete.append(pid_futures[future])
+
+        report.timed_out = deadline is not None and time.time() >= deadline
+    finally:
+        # the files are uploaded after return, stop the tasks and wait for the files being written
+        stop.set()
+        for future in list(list_futures) + list(pid_futures):
+            future.cancel()
+        executor.shutdown(wait=False)
+        _, not_done = wait(pid_futures, timeout=STOP_GRACE_TIME)
+        report.unfinished = [pid_futures[future] for future in not_done]
+
+    report.elapsed = time.time() - start_time
+    print(report.summary())
+    return report
+
+
+def get_remain_time(deadline):
+    if deadline is None:
+        return None
+    return max(deadline - time.time(), 0)
 
-        for target in [f for f in os.listdir(ascend_device_log_dir)]:
-            ascend_log_file = AscendLogFile()
-            if ascend_log_file.set_log_file(target):
-                device_log_collector.add_log_file(ascend_log_file)
 
-        generate_limited_lines_pid_log_file(new_log_dir, ascend_device_log_dir, device_id_dir, device_log_collector, n)
+def generate_limited_lines_log_file_of_pid(new_log_dir, new_log_short_name, log_index, pid, limited_lines,
+                                           deadline=None, stop=None):
+    """
+    :param stop: threading.Event, stop before writing the next file when it's set
+    :return: (new log file, written lines, complete or not)
+    """
+    remain_lines = limited_lines
+    written_lines = 0
+    new_log_file = os.path.join(new_log_dir, get_new_log_file_name('%s-%s' % (new_log_short_name, pid)))
 
+    for log_file in log_index.get_latest_files(pid):
+        if (deadline is not None and time.time() >= deadline) or (stop is not None and stop.is_set()):
+            return new_log_file, written_lines, False
 
-def generate_limited_lines_pid_log_file(new_log_dir, log_dir, new_log_short_name, log_collector, limited_lines):
-    for pid in log_collector.get_pid_arr():
-        remain_lines = limited_lines
-        new_log_file = os.path.join(new_log_dir, get_new_log_file_name('%s-%s' % (new_log_short_name, pid)))
+        log_file_path = os.path.join(log_index.log_dir, log_file.get_log_file())
+        print('collect file: %s, size: %d' % (log_file_path, log_file.size))
 
-        log_file = log_collector.get_log_file(pid)
-        while log_file:
-            log_file_path = os.path.join(log_dir, log_file.get_log_file())
-            if os.path.isfile(log_file_path):
-                print('collect file: %s, size: %d' % (log_file_path, os.path.getsize(log_file_path)))
-            else:
-                print('collect file: %s, file does not exist' % log_file_path)
+        written_lines += tail_append_to_file(log_file_path, remain_lines, new_log_file)
 
-            current_lines = tail_append_to_file(log_file_path, remain_lines, new_log_file)
+        remain_lines = limited_lines - written_lines
+        if remain_lines <= 0:
+            break
 
-            remain_lines = limited_lines - current_lines
-            if remain_lines <= 0:
-                break
+    return new_log_file, written_lines, True
 
-            log_file = log_collector.get_log_file(pid)
+
+def generate_limited_lines_pid_log_file(new_log_dir, new_log_short_name, log_index, limited_lines):
+    for pid in log_index.get_pid_arr():
+        generate_limited_lines_log_file_of_pid(new_log_dir, new_log_short_name, log_index, pid, limited_lines)
 
 
 def get_new_log_file_name(log_short_name):
@@ -266,18 +333,90 @@ def get_tmp_log_dir():
     return os.path.join("/tmp", log_dir_name)
 
 
-def tail_append_to_file(f, n, append_file):
+def find_tail_start(read_block, size, n, block_size):
+    """
+    find the offset of the last n lines by reading blocks backwards from the end
+
+    :param read_block: func(offset, length) -> bytes
+    :return: offset of the first byte of the last n lines
+    """
+    end = size
+    # the newline at the end of the file terminates the last line, it does not begin a new one
+    if read_block(size - 1, 1) == b'\n':
+        end -= 1
+
+    found_lines = 0
+    while end > 0:
+        begin = max(end - block_size, 0)
+        block = read_block(begin, end - begin)
+        index = len(block)
+        while True:
+            index = block.rfind(b'\n', 0, index)
+            if index == -1:
+                break
+            found_lines += 1
+            if found_lines == n:
+                return begin + index + 1
+        end = begin
+
+    return 0
+
+
+def tail_lines(f, n, block_size=1 << 16, use_mmap=False):
+    """
+    read the last n lines of a file, without reading the whole file
+
+    :param f: file path
+    :param n: tail n lines
+    :param block_size: bytes read backwards every time
+    :param use_mmap: read the blocks from a mmap of the file
+    :return: bytes of the last n lines
+    """
+    if n <= 0:
+        return b''
+
+    with open(f, 'rb') as log_file:
+        size = os.fstat(log_file.fileno()).st_size
+        if size == 0:
+            return b''
+
+        if use_mmap:
+            with mmap.mmap(log_file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                start = find_tail_start(lambda offset, length: mm[offset:offset + length], size, n, block_size)
+                return mm[start:size]
+
+        def read_block(offset, length):
+            log_file.seek(offset)
+            return log_file.read(length)
+
+        start = find_tail_start(read_block, size, n, block_size)
+        return read_block(start, size - start)
+
+
+def tail_append_to_file(f, n, append_file, use_mmap=False):
     """
     :param f: original file
     :param n: tail n lines
     :param append_file: write n lines to a new file
-    :return:
+    :param use_mmap: see tail_lines
+    :return: lines written to the new file (<= n)
     """
-    with open(append_file, 'a') as new_log_file:
-        p = subprocess.Popen(['tail', '-n', str(n), f], stdout=new_log_file)
-        p.wait()
-    file_line_cnt = check_output(['wc', '-l', append_file])
-    return int(file_line_cnt.split(b" ")[0])
+    if not os.path.isfile(f):
+        return 0
+
+    data = tail_lines(f, n, use_mmap=use_mmap)
+    if not data:
+        return 0
+
+    line_cnt = data.count(b'\n')
+    if not data.endswith(b'\n'):
+        # terminate the last line, keep it apart from the lines of the next file
+        data += b'\n'
+        line_cnt += 1
+
+    with open(append_file, 'ab') as new_log_file:
+        new_log_file.write(data)
+    return line_cnt
 
 
 if __name__ == '__main__':
@@ -297,9 +436,10 @@ if __name__ == '__main__':
     tmp_log_dir = get_tmp_log_dir()
     os.makedirs(tmp_log_dir)
 
-    collect_latest_n_log(tmp_log_dir, limited_log_lines)
+    collect_latest_n_log(tmp_log_dir, limited_log_lines, workers=args.workers, timeout=args.timeout)
 
-    if not debug:
+    mox = ModelArts.import_moxing()
+    if mox is not None:
         file_list = mox.file.list_directory(tmp_log_dir, recursive=True)
         file_num = len(file_list)
         print('totally, %d ascend log files to be uploaded' % file_num)
@@ -36,7 +36,7 @@ def setup():
 
 
 def cleanup():
-    del os.environ['RANK_TABLE_FILE']
+    os.environ.pop('RANK_TABLE_FILE', None)
 
     try:
         os.remove(k8s_hccl_path)
@@ -0,0 +1,49 @@
+import threading
+import time
+
+import pytest
+
+from davincirunsdk.bootstrap import StagedBootstrap, StageError
+
+
+def test_stages_run_concurrently():
+    bootstrap = StagedBootstrap(concurrent=True)
+    rank_table_ready = threading.Event()
+    start_time = time.time()
+    bootstrap.add_stage('op', lambda: time.sleep(0.3) or 0)
+    bootstrap.add_stage('rank_table', lambda: rank_table_ready.wait(5) and 'rank_table')
+    bootstrap.add_stage('route_plan', lambda rank_table: rank_table + ' planned', requires=['rank_table'])
+
+    with pytest.raises(TimeoutError):
+        bootstrap.wait('route_plan', timeout=0.01)
+    rank_table_ready.set()
+    assert bootstrap.wait('route_plan') == 'rank_table planned'
+    assert bootstrap.wait('op') == 0
+    assert time.time() - start_time < 0.6
+
+    timings = bootstrap.get_timings()
+    assert set(timings) == {'op', 'rank_table', 'route_plan'}
+    wait_time, run_time = timings['op']
+    assert run_time >= 0.3
+
+
+@pytest.mark.parametrize('concurrent', [True, False])
+def test_failed_stage(concurrent):
+    def fail():
+        raise ValueError('no rank table')
+
+    calls = []
+    bootstrap = StagedBootstrap(concurrent=concurrent)
+    bootstrap.add_stage('rank_table', fail)
+    bootstrap.add_stage('route_plan', lambda rank_table: calls.append(rank_table), requires=['rank_table'])
+    bootstrap.add_stage('slogd', lambda: 'slogd')
+
+    with pytest.raises(StageError) as e:
+        bootstrap.wait('route_plan')
+    assert e.value.name == 'rank_table'
+    assert isinstance(e.value.cause, ValueError)
+    assert calls == []
+    assert bootstrap.wait('slogd') == 'slogd'
+
+    with pytest.raises(ValueError):
+        bootstrap.add_stage('topology', lambda: None, requires=['unknown'])
@@ -0,0 +1,77 @@
+import json
+import os
+
+from davincirunsdk.common import JobContext, OpEnv, ModelArts, BatchEnv, AscendDriverInfo
+from davincirunsdk.manager import AscendVersionManager
+
+
+def test_job_context(monkeypatch):
+    for env_name in JobContext.ENV_NAMES:
+        monkeypatch.delenv(env_name, raising=False)
+    monkeypatch.setenv('MA_VJ_NAME', 'ma-job-123')
+    monkeypatch.setenv('MA_CURRENT_INSTANCE_NAME', 'worker-0')
+    monkeypatch.setenv('MA_ALGORITHM_OPERATOR', json.dumps({'obs': {'obs_url': 's3://bucket/op'}, 'ide_mode': True}))
+
+    job_context = JobContext.current()
+    assert job_context is JobContext.current()
+    assert job_context.job_id == 'modelarts-job-123'
+    assert job_context.instance_name == 'worker-0'
+    assert job_context.host_ip is None
+    assert job_context.op_obs_url == 's3://bucket/op'
+    assert job_context.ide_mode
+    assert job_context.inputs is None
+    assert job_context.log_upload_url is None
+    assert OpEnv.should_handle_operator()
+    assert OpEnv.get_op_obs_uri() == 's3://bucket/op'
+
+    # the raw env string is the cache key
+    monkeypatch.setenv('MA_ALGORITHM_OPERATOR', '{"ide_mode": true}')
+    monkeypatch.setenv('BATCH_TASK_CURRENT_INSTANCE', 'pod-0')
+    assert JobContext.current() is not job_context
+    assert not OpEnv.should_handle_operator()
+    assert not OpEnv.ide_mode()
+    assert ModelArts.get_current_instance_name() == 'pod-0'
+    assert BatchEnv.get_pod_name() == 'pod-0'
+
+    # the env of the training processes, not os.environ
+    assert JobContext.current({'BATCH_JOB_ID': 'job'}).job_id == 'job'
+
+
+def test_only_keep_v1_special_channel_env(monkeypatch):
+    inputs = {'inputs': [{'name': 'data_url', 'local_dir': '/cache/data',
+                          'remote': {'obs': {'obs_url': 's3://bucket/data'}}}]}
+    monkeypatch.setenv('MA_INPUTS', json.dumps(inputs))
+    monkeypatch.setenv('MA_OUTPUTS', json.dumps({'outputs': []}))
+
+    assert JobContext.current().inputs == inputs
+    ModelArts.only_keep_v1_special_channel_env()
+    assert json.loads(os.environ['MA_INPUTS']) == {
+        'inputs': [{'parameter': {'label': 'data_url', 'value': '/cache/data'},
+                    'data_source': {'obs': {'obs_url': '/bucket/data'}}}]}
+    assert 'MA_OUTPUTS' not in os.environ
+    assert JobContext.current().outputs is None
+
+
+def test_ascend_driver_info(tmp_path, monkeypatch):
+    file_path = str(tmp_path / 'version.info')
+    monkeypatch.setattr(AscendVersionManager, 'driver_version_file_path', file_path)
+    assert AscendDriverInfo.probe(file_path) is None
+    assert not AscendVersionManager.is_atlas_c75_tr5()
+
+    with open(file_path, 'w') as f:
+        f.write('Version=20.1.0\nascendhal_version=4.0.0\naicpu_version=1.0\nrequired_firmware_version\n')
+    driver_info = AscendDriverInfo.probe(file_path)
+    assert driver_info.version == '20.1.0'
+    assert driver_info.components == {'ascendhal': '4.0.0', 'aicpu': '1.0'}
+    assert not driver_info.features[AscendDriverInfo.FEATURE_LOGICAL_DEVICE_ID]
+    assert AscendVersionManager.is_atlas_c75_tr5()
+    # cached until the file is changed
+    assert AscendDriverInfo.probe(file_path) is driver_info
+
+    with open(file_path, 'w') as f:
+        f.write('Version=21.0.2\n')
+    os.utime(file_path, ns=(0, 1))
+    driver_info = AscendDriverInfo.probe(file_path)
+    assert driver_info.version == '21.0.2'
+    assert driver_info.features[AscendDriverInfo.FEATURE_LOGICAL_DEVICE_ID]
+    assert not AscendVersionManager.is_atlas_c75_tr5()
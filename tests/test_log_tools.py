@@ -0,0 +1,186 @@
+import os
+import time
+
+import pytest
+
+from davincirunsdk import upload_tail_log
+from davincirunsdk.split_log import parse_log, split_device_logs
+from davincirunsdk.upload_tail_log import tail_lines, tail_append_to_file, collect_latest_n_log, \
+    get_new_log_file_name, AscendLogIndex, AscendLogFile
+
+
+@pytest.mark.parametrize('use_mmap', [False, True])
+@pytest.mark.parametrize('content', [b'', b'\n', b'a', b'a\n', b'a\nb', b'a\nb\n', b'\n\na\n\nb\nc',
+                                     b''.join(b'line-%d\n' % i for i in range(100))])
+def test_tail_lines(tmp_path, content, use_mmap):
+    file_path = str(tmp_path / 'plog.log')
+    with open(file_path, 'wb') as f:
+        f.write(content)
+
+    lines = content.splitlines(keepends=True)
+    for n in range(0, 12):
+        expected = b''.join(lines[-n:]) if n > 0 else b''
+        for block_size in (1, 3, 1 << 16):
+            assert tail_lines(file_path, n, block_size=block_size, use_mmap=use_mmap) == expected
+
+
+def test_tail_append_to_file(tmp_path):
+    first_file = str(tmp_path / 'plog-1_20210120144937340.log')
+    second_file = str(tmp_path / 'plog-1_20210120144937341.log')
+    new_log_file = str(tmp_path / 'new.log')
+    with open(first_file, 'w') as f:
+        f.write('1\n2\n3')
+    with open(second_file, 'w') as f:
+        f.write('4\n5\n6\n')
+
+    assert tail_append_to_file(first_file, 2, new_log_file) == 2
+    assert tail_append_to_file(second_file, 5, new_log_file) == 3
+    assert tail_append_to_file(str(tmp_path / 'missing.log'), 5, new_log_file) == 0
+    with open(new_log_file) as f:
+        assert f.read() == '2\n3\n4\n5\n6\n'
+
+
+def make_ascend_log(home, sub_dir, file_name, lines):
+    log_dir = home / 'ascend' / 'log' / sub_dir
+    log_dir.mkdir(parents=True, exist_ok=True)
+    with open(str(log_dir / file_name), 'w') as f:
+        f.write(''.join('%s\n' % line for line in lines))
+
+
+def test_collect_latest_n_log(tmp_path, monkeypatch):
+    home = tmp_path / 'home'
+    monkeypatch.setenv('HOME', str(home))
+    make_ascend_log(home, 'plog', 'plog-1_20210120144937340.log', ['a1', 'a2'])
+    make_ascend_log(home, 'plog', 'plog-1_20210120144937341.log', ['a3', 'a4'])
+    make_ascend_log(home, 'plog', 'plog-2_20210120144937340.log', ['b1'])
+    make_ascend_log(home, 'device-0', 'device-3_20210120144937340.log', ['c1', 'c2', 'c3'])
+    new_log_dir = tmp_path / 'new'
+    new_log_dir.mkdir()
+
+    report = collect_latest_n_log(str(new_log_dir), 3, workers=4, timeout=60)
+
+    assert not report.timed_out
+    assert not report.incomplete
+    assert sorted(lines for _, lines in report.collected) == [1, 3, 3]
+    for short_name, content in [('plog-1', 'a3\na4\na2\n'), ('plog-2', 'b1\n'), ('device-0-3', 'c1\nc2\nc3\n')]:
+        with open(str(new_log_dir / get_new_log_file_name(short_name))) as f:
+            assert f.read() == content
+
+
+def test_collect_latest_n_log_deadline(tmp_path, monkeypatch):
+    home = tmp_path / 'home'
+    monkeypatch.setenv('HOME', str(home))
+    make_ascend_log(home, 'plog', 'plog-1_20210120144937340.log', ['a1'])
+    new_log_dir = tmp_path / 'new'
+    new_log_dir.mkdir()
+
+    report = collect_latest_n_log(str(new_log_dir), 3, timeout=1e-9)
+    assert report.timed_out
+    assert report.incomplete
+
+
+def test_collect_latest_n_log_stops_writing(tmp_path, monkeypatch):
+    home = tmp_path / 'home'
+    monkeypatch.setenv('HOME', str(home))
+    for index in range(5):
+        make_ascend_log(home, 'plog', 'plog-1_2021012014493734%d.log' % index, ['a%d' % index])
+    new_log_dir = tmp_path / 'new'
+    new_log_dir.mkdir()
+
+    def slow_tail_append_to_file(*args):
+        time.sleep(0.1)
+        return tail_append_to_file(*args)
+
+    monkeypatch.setattr(upload_tail_log, 'tail_append_to_file', slow_tail_append_to_file)
+    report = collect_latest_n_log(str(new_log_dir), 5, timeout=0.15)
+    assert report.timed_out
+    assert report.incomplete == ['plog-1']
+    assert report.unfinished == []
+
+    # nothing is written after return, the directory is ready to upload
+    new_log_file = str(new_log_dir / get_new_log_file_name('plog-1'))
+    with open(new_log_file) as f:
+        content = f.read()
+    time.sleep(0.3)
+    with open(new_log_file) as f:
+        assert f.read() == content
+
+
+def test_ascend_log_index(tmp_path):
+    for file_name in ['plog-1_20210120144937340.log', 'plog-1_20210120144937342.log',
+                      'plog-1_20210120144937341.log', 'plog-22_20210120144937340.log',
+                      'device-3_20210120144937340.log', 'plog-1_2021.log', 'stdout.log']:
+        with open(str(tmp_path / file_name), 'w') as f:
+            f.write('x\n')
+    (tmp_path / 'plog-2_20210120144937340.log.d').mkdir()
+
+    log_index = AscendLogIndex.build(str(tmp_path))
+    assert sorted(log_index.get_pid_arr()) == ['1', '22', '3']
+    assert [log_file.get_log_file() for log_file in log_index.get_latest_files('1', 2)] == \
+        ['plog-1_20210120144937342.log', 'plog-1_20210120144937341.log']
+    assert len(log_index.get_latest_files('1')) == 3
+    assert log_index.get_latest_files('3')[0].log_type == AscendLogFile.type_device
+    assert log_index.get_latest_files('22')[0].size == 2
+    assert log_index.get_latest_files('404') == []
+
+
+def make_device_log(seconds):
+    lines = []
+    for second in seconds:
+        lines.append('[INFO] 2021-01-20-14:%02d:%02d.123 step\n' % (second // 60, second % 60))
+        if second % 3 == 0:
+            lines.append('    traceback of %d\n' % second)
+    return 'untimed header\n' + ''.join(lines)
+
+
+@pytest.mark.parametrize('start, end', [(0, 200), (10, 20), (11, 11), (50, 60), (150, 300), (300, 400)])
+def test_parse_log_time_window(tmp_path, start, end):
+    device_dir = tmp_path / 'device-0'
+    device_dir.mkdir()
+    seconds = [second for second in range(0, 200) if second % 7 != 5] + [199, 199]
+    content = make_device_log(seconds)
+    with open(str(device_dir / 'device-1_20210120144937340.log'), 'w') as f:
+        f.write(content)
+
+    start_time = '2021-01-20-14:%02d:%02d' % (start // 60, start % 60)
+    end_time = '2021-01-20-14:%02d:%02d' % (end // 60, end % 60)
+    output_file = str(tmp_path / 'out')
+    parse_log(str(device_dir), output_file, start_time, end_time)
+
+    expected = []
+    in_window = False
+    for line in content.splitlines(keepends=True):
+        if '2021-01-20' in line:
+            in_window = start_time <= line.split()[1][:19] <= end_time
+        if in_window:
+            expected.append(line)
+    with open(output_file) as f:
+        assert f.read() == ''.join(expected)
+
+
+def test_split_device_logs_merged(tmp_path):
+    device_path = tmp_path / 'device'
+    output_path = tmp_path / 'output'
+    output_path.mkdir()
+    for index, seconds in [(0, range(0, 60, 2)), (3, range(1, 60, 2))]:
+        device_dir = device_path / ('device-%d' % index)
+        device_dir.mkdir(parents=True)
+        # split into an older and a newer file
+        for file_name, file_seconds in [('device-1_20210120144900000.log', [s for s in seconds if s < 30]),
+                                        ('device-1_20210120144930000.log', [s for s in seconds if s >= 30])]:
+            with open(str(device_dir / file_name), 'w') as f:
+                f.write(make_device_log(file_seconds))
+        os.utime(str(device_dir / 'device-1_20210120144900000.log'), (1, 1))
+
+    merged_output = str(tmp_path / 'merged')
+    output_files = split_device_logs(str(device_path), str(output_path), '2021-01-20-14:00:10',
+                                     '2021-01-20-14:00:40', jobs=2, merged_output=merged_output)
+    assert [os.path.basename(output_file) for output_file in output_files] == ['device-0', 'device-3']
+
+    with open(merged_output) as f:
+        lines = f.read().splitlines()
+    timed_lines = [line for line in lines if '2021-01-20' in line]
+    assert [line.split()[2][17:19] for line in timed_lines] == ['%02d' % s for s in range(10, 41)]
+    assert timed_lines[0].startswith('device-0: ')
+    assert 'device-3:     traceback of 21' in lines
+    assert lines[lines.index('device-3:     traceback of 21') - 1].startswith('device-3: [INFO] 2021-01-20-14:00:21')
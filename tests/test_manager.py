@@ -0,0 +1,299 @@
+import gzip
+import io
+import os
+import subprocess
+import threading
+import time
+
+import pytest
+
+from davincirunsdk.fmk import FMK, FMKEnvTemplate
+from davincirunsdk.log_mux import LogMultiplexer, FileSink, PrefixLineSink, RotatingFileSink
+from davincirunsdk.log_upload import IncrementalLogUploader, LocalPartBackend, AdaptiveUploadScheduler, \
+    BandwidthLimiter
+from davincirunsdk.manager import FMKManager, BatchLogManager
+from davincirunsdk.proc_watcher import ProcessExitWatcher
+from davincirunsdk.rank_table import Instance, Device
+
+
+class FakeFMK:
+    def __init__(self, rank_id):
+        self.rank_id = str(rank_id)
+        self.device_id = str(rank_id)
+
+
+def make_manager(commands):
+    manager = FMKManager(Instance('', '127.0.0.1', []))
+    for rank_id, command in enumerate(commands):
+        manager.fmk.append(FakeFMK(rank_id))
+        manager.fmk_processes.append(subprocess.Popen(command, start_new_session=True))
+    return manager
+
+
+def test_exit_watcher_wakes_up_on_exit():
+    process = subprocess.Popen(['sleep', '0.2'])
+    with ProcessExitWatcher([process]) as watcher:
+        start_time = time.time()
+        while process.poll() is None:
+            watcher.wait(timeout=5)
+        assert time.time() - start_time < 2
+
+
+def test_exit_watcher_sigchld_fallback(monkeypatch):
+    monkeypatch.setattr(ProcessExitWatcher, 'open_pidfds', lambda self, processes: False)
+    process = subprocess.Popen(['sleep', '0.2'])
+    with ProcessExitWatcher([process], period=30) as watcher:
+        assert watcher.mode == ProcessExitWatcher.MODE_SIGCHLD
+        start_time = time.time()
+        while process.poll() is None:
+            watcher.wait()
+        assert time.time() - start_time < 2
+
+
+def test_exit_watcher_interrupt():
+    process = subprocess.Popen(['sleep', '30'])
+    try:
+        with ProcessExitWatcher([process]) as watcher:
+            watcher.interrupt()
+            start_time = time.time()
+            assert watcher.wait(timeout=5) == []
+            assert time.time() - start_time < 1
+    finally:
+        process.kill()
+        process.wait()
+
+
+def test_monitor_returns_first_non_zero_code():
+    manager = make_manager([['sleep', '30'], ['sh', '-c', 'sleep 0.1; exit 3']])
+    try:
+        start_time = time.time()
+        assert manager.monitor() == 3
+        assert time.time() - start_time < 1
+    finally:
+        manager.destroy(base_period=0.1)
+
+
+def test_monitor_all_zero():
+    manager = make_manager([['true'], ['sh', '-c', 'sleep 0.1']])
+    assert manager.monitor() == 0
+    manager.destroy(base_period=0.1)
+
+
+def test_log_mux_fan_out(tmp_path):
+    log_mux = LogMultiplexer()
+    stream = io.StringIO()
+    processes = []
+    for rank_id in range(2):
+        process = subprocess.Popen(['sh', '-c', 'for i in 1 2 3; do echo rank%s-$i; done; printf tail' % rank_id],
+                                   stdout=subprocess.PIPE)
+        log_mux.add_source(process.stdout, [FileSink(str(tmp_path / ('rank-%d.txt' % rank_id))),
+                                            PrefixLineSink('rank-%d' % rank_id, stream)])
+        processes.append(process)
+
+    for process in processes:
+        process.wait()
+        assert log_mux.wait_closed(process.stdout, 5)
+    log_mux.close(5)
+
+    for rank_id in range(2):
+        with open(str(tmp_path / ('rank-%d.txt' % rank_id))) as f:
+            assert f.read() == 'rank%d-1\nrank%d-2\nrank%d-3\ntail' % (rank_id, rank_id, rank_id)
+
+    lines = stream.getvalue().splitlines()
+    assert len(lines) == 8
+    assert 'rank-1: rank1-2' in lines
+    assert 'rank-0: tail' in lines
+
+
+def test_log_mux_close_twice(tmp_path):
+    log_mux = LogMultiplexer()
+    process = subprocess.Popen(['echo', 'done'], stdout=subprocess.PIPE)
+    log_mux.add_source(process.stdout, [FileSink(str(tmp_path / 'rank-0.txt'))])
+    process.wait()
+    log_mux.close(5)
+    # the wakeup pipe is closed with the thread
+    assert log_mux.wakeup_r is None and log_mux.wakeup_w is None
+
+    other_r, other_w = os.pipe()
+    try:
+        log_mux.close(5)
+        # the fds reused after the first close are left alone
+        os.write(other_w, b'x')
+        assert os.read(other_r, 1) == b'x'
+    finally:
+        os.close(other_r)
+        os.close(other_w)
+
+    with open(str(tmp_path / 'rank-0.txt')) as f:
+        assert f.read() == 'done\n'
+
+
+def test_rotating_file_sink(tmp_path):
+    file_path = str(tmp_path / 'job-proc-rank-0-device-0.txt')
+    sink = RotatingFileSink(file_path, max_bytes=10, backup_count=2, compress=True)
+    for index in range(5):
+        sink.write(b'%d' % index * 8)
+    sink.close()
+
+    assert sorted(os.listdir(str(tmp_path))) == ['job-proc-rank-0-device-0.txt',
+                                                 'job-proc-rank-0-device-0.txt.1.gz',
+                                                 'job-proc-rank-0-device-0.txt.2.gz']
+    with open(file_path, 'rb') as f:
+        assert f.read() == b'4' * 8
+    with gzip.open(file_path + '.1.gz') as f:
+        assert f.read() == b'3' * 8
+    with gzip.open(file_path + '.2.gz') as f:
+        assert f.read() == b'2' * 8
+
+
+def test_rotating_file_sink_does_not_wait_for_compression(tmp_path, monkeypatch):
+    compressing = threading.Event()
+    finish_segment = RotatingFileSink.finish_segment
+
+    def slow_finish_segment(sink, pending_path):
+        compressing.wait(5)
+        finish_segment(sink, pending_path)
+
+    monkeypatch.setattr(RotatingFileSink, 'finish_segment', slow_finish_segment)
+    file_path = str(tmp_path / 'job-proc-rank-0-device-0.txt')
+    sink = RotatingFileSink(file_path, max_bytes=10, backup_count=3, compress=True)
+    start_time = time.time()
+    for index in range(4):
+        sink.write(b'%d' % index * 8)
+    # the writer is not blocked by the stalled compressor
+    assert time.time() - start_time < 1
+    assert not sink.wait_compressed(timeout=0.01)
+
+    compressing.set()
+    sink.close()
+    assert sorted(os.listdir(str(tmp_path))) == ['job-proc-rank-0-device-0.txt',
+                                                 'job-proc-rank-0-device-0.txt.1.gz',
+                                                 'job-proc-rank-0-device-0.txt.2.gz',
+                                                 'job-proc-rank-0-device-0.txt.3.gz']
+    for index in range(1, 4):
+        with gzip.open('%s.%d.gz' % (file_path, index)) as f:
+            assert f.read() == b'%d' % (3 - index) * 8
+
+
+def test_rotating_file_sink_requires_backup(tmp_path):
+    with pytest.raises(ValueError):
+        RotatingFileSink(str(tmp_path / 'rank-0.txt'), max_bytes=10, backup_count=0)
+    with pytest.raises(ValueError):
+        LogMultiplexer(max_bytes=10, backup_count=0)
+    # no rotation, nothing to keep
+    RotatingFileSink(str(tmp_path / 'rank-0.txt'), max_bytes=0, backup_count=0).close()
+
+
+def test_incremental_log_uploader(tmp_path):
+    local_path = str(tmp_path / 'stdout.log')
+    remote_url = str(tmp_path / 'remote.log')
+    uploader = IncrementalLogUploader(local_path, remote_url, LocalPartBackend(compact_parts=3), part_size=4)
+
+    with open(local_path, 'wb') as f:
+        f.write(b'0123456789')
+    assert uploader.upload() == 10
+    assert uploader.upload() == 0
+    with open(local_path, 'ab') as f:
+        f.write(b'abc')
+    assert uploader.upload() == 3
+    assert uploader.finalize() == 0
+    with open(remote_url, 'rb') as f:
+        assert f.read() == b'0123456789abc'
+
+    # truncated, upload from the beginning
+    with open(local_path, 'wb') as f:
+        f.write(b'xyz')
+    assert uploader.finalize() == 3
+    with open(remote_url, 'rb') as f:
+        assert f.read() == b'xyz'
+
+
+def test_batch_log_manager_upload(tmp_path, monkeypatch):
+    monkeypatch.setenv('DLS_UPLOAD_LOG_OBS_DIR', str(tmp_path / 'obs'))
+    monkeypatch.setenv('DLS_USE_UPLOADER', 'true')
+    monkeypatch.setenv('BATCH_TASK_LOG_PATH', str(tmp_path))
+    monkeypatch.setenv('BATCH_TASK_CURRENT_INSTANCE', 'pod-0')
+    os.makedirs(str(tmp_path / 'obs'))
+    with open(str(tmp_path / 'stdout.log'), 'w') as f:
+        f.write('begin\n')
+
+    batch_log_manager = BatchLogManager(upload_interval=0.05, upload_backend=LocalPartBackend())
+    batch_log_manager.run()
+    with open(str(tmp_path / 'stdout.log'), 'a') as f:
+        f.write('end\n')
+    batch_log_manager.destroy()
+
+    with open(str(tmp_path / 'obs' / 'pod-0.log')) as f:
+        assert f.read() == 'begin\nend\n'
+
+
+def test_adaptive_upload_scheduler():
+    scheduler = AdaptiveUploadScheduler(base_interval=30, min_interval=5, max_interval=300, max_duty_cycle=0.1,
+                                        target_upload_size=1000)
+    assert scheduler.should_upload((10, 1))
+    assert scheduler.record((10, 1), upload_time=0.1, end_time=100) == 30
+    assert not scheduler.should_upload((10, 1))
+
+    # slow upload, stretch the interval
+    assert scheduler.record((20, 2), upload_time=10, end_time=130) > 30
+    # fast growing log, shrink the interval
+    scheduler = AdaptiveUploadScheduler(base_interval=30, min_interval=5, target_upload_size=1000)
+    scheduler.record((0, 1), upload_time=0.1, end_time=100)
+    assert scheduler.record((100000, 2), upload_time=0.1, end_time=110) == 5
+
+
+def test_bandwidth_limiter_lifted_by_ticker():
+    ticker = threading.Event()
+    limiter = BandwidthLimiter(100, ticker)
+    threading.Timer(0.1, ticker.set).start()
+    start_time = time.time()
+    limiter.consume(1000)
+    assert time.time() - start_time < 5
+    assert not limiter.enabled()
+
+
+def test_fmk_env_template(tmp_path, monkeypatch):
+    monkeypatch.setenv('MA_DIAG_MODE_ENV', 'faults')
+    monkeypatch.setenv('HCCL_CONNECT_TIMEOUT', '600')
+    monkeypatch.delenv('ASCEND_PROCESS_LOG_PATH', raising=False)
+    monkeypatch.delenv('NPU_COLLECT_PATH', raising=False)
+    env_template = FMKEnvTemplate(2, str(tmp_path), job_id='job')
+    assert env_template.envs['RANK_SIZE'] == '2'
+    assert env_template.envs['PRINT_MODEL'] == '1'
+    # the user's env is kept
+    assert env_template.envs['HCCL_CONNECT_TIMEOUT'] == '600'
+
+    fmk_instances = [FMK(False, index, Device(str(index), '192.1.0.%d' % index, str(index))) for index in range(2)]
+    rank_envs = [fmk.gen_env_for_fmk(2, env_template) for fmk in fmk_instances]
+    assert fmk_instances[1].env_overlay == {
+        'ASCEND_DEVICE_ID': '1',
+        'DEVICE_ID': '1',
+        'RANK_ID': '1',
+        'ASCEND_PROCESS_LOG_PATH': str(tmp_path / 'job' / 'ascend' / 'process_log' / 'rank_1'),
+        'NPU_COLLECT_PATH': str(tmp_path / 'job' / 'ascend' / 'npu_collect' / 'rank_1'),
+    }
+    assert env_template.diff(rank_envs[1]) == fmk_instances[1].env_overlay
+    assert (tmp_path / 'job' / 'ascend' / 'npu_collect' / 'rank_0' / 'extra-info' / 'graph').is_dir()
+
+    assert rank_envs[0]['RANK_ID'] == '0'
+    assert rank_envs[0]['JOB_ID'] == 'job'
+
+    manager = FMKManager(Instance('', '127.0.0.1', []))
+    manager.env_template = env_template
+    manager.fmk.extend(fmk_instances)
+    assert manager.get_rank_env_overlays()['0']['DEVICE_ID'] == '0'
+    assert manager.get_rank_env(1) == rank_envs[1]
+    assert manager.get_rank_env(2) is None
+
+
+def test_fmk_env_template_user_npu_collect_path(tmp_path, monkeypatch):
+    npu_collect_path = tmp_path / 'npu_collect'
+    monkeypatch.setenv('NPU_COLLECT_PATH', str(npu_collect_path))
+    monkeypatch.setenv('MA_DIAG_MODE_ENV', 'accuracy')
+    FMKEnvTemplate(2, str(tmp_path), job_id='job')
+    # only collected in the faults diag mode
+    assert not npu_collect_path.exists()
+
+    monkeypatch.setenv('MA_DIAG_MODE_ENV', 'faults')
+    FMKEnvTemplate(2, str(tmp_path), job_id='job')
+    assert (npu_collect_path / 'extra-info' / 'graph').is_dir()
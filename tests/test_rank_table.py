@@ -0,0 +1,272 @@
+import gc
+import json
+import os
+import threading
+import time
+import tracemalloc
+from array import array
+
+import pytest
+
+from davincirunsdk.common import RankTableEnv, FileHelper
+from davincirunsdk.file_watcher import FileChangeWatcher, Inotify
+from davincirunsdk.rank_table import RankTable, RankTableV0, RankTableV1, RankTableColumns
+
+k8s_hccl_path = RankTableEnv.get_rank_table_file_path()
+
+
+def write_rank_table(file_path, status):
+    with open(file_path + '.tmp', 'w') as f:
+        json.dump({'status': status, 'group_count': '1', 'group_list': []}, f)
+    os.replace(file_path + '.tmp', file_path)
+
+
+@pytest.fixture(params=[FileChangeWatcher.MODE_INOTIFY, FileChangeWatcher.MODE_STAT])
+def watcher_mode(request, monkeypatch):
+    if request.param == FileChangeWatcher.MODE_STAT:
+        def no_inotify(self, dir_path, mask):
+            raise OSError('inotify is disabled')
+
+        monkeypatch.setattr(Inotify, '__init__', no_inotify)
+    return request.param
+
+
+def test_file_change_watcher_mode(tmp_path, watcher_mode):
+    with FileChangeWatcher(str(tmp_path / 'missing.json'), period=0.05) as watcher:
+        assert watcher.mode == watcher_mode
+        assert not watcher.changed()
+
+
+def test_wait_for_available_partial_and_missing(tmp_path, watcher_mode):
+    file_path = str(tmp_path / 'jobstart_hccl.json')
+
+    def generate():
+        time.sleep(0.1)
+        with open(file_path, 'w') as f:
+            f.write('{"status": "comp')
+        time.sleep(0.1)
+        write_rank_table(file_path, 'initializing')
+        time.sleep(0.1)
+        write_rank_table(file_path, 'completed')
+
+    thread = threading.Thread(target=generate)
+    thread.start()
+    start_time = time.time()
+    assert RankTable.wait_for_available(file_path, period=0.05, timeout=10)
+    assert time.time() - start_time < 5
+    thread.join()
+
+
+def test_wait_for_available_timeout(tmp_path, watcher_mode):
+    file_path = str(tmp_path / 'jobstart_hccl.json')
+    write_rank_table(file_path, 'initializing')
+    start_time = time.time()
+    assert not RankTable.wait_for_available(file_path, period=0.05, timeout=0.3)
+    assert time.time() - start_time < 2
+
+
+def test_wait_for_available_reads_on_change(tmp_path, monkeypatch):
+    file_path = str(tmp_path / 'jobstart_hccl.json')
+    write_rank_table(file_path, 'initializing')
+    read_paths = []
+    read_from_file = RankTable.read_from_file
+
+    def counted_read_from_file(path):
+        read_paths.append(path)
+        return read_from_file(path)
+
+    monkeypatch.setattr(RankTable, 'read_from_file', staticmethod(counted_read_from_file))
+    assert not RankTable.wait_for_available(file_path, period=0.01, timeout=0.3)
+    assert len(read_paths) == 1
+
+
+def test_rank_table_index(monkeypatch):
+    monkeypatch.setenv('MA_CURRENT_INSTANCE_NAME', 'fake-job-pod-1')
+    rank_table = RankTableV0(k8s_hccl_path)
+    assert rank_table.get_current_instance().pod_name == 'fake-job-pod-1'
+    assert rank_table.get_device_num() == 16
+    assert rank_table.get_server_num() == 2
+
+    rank_table_v1 = RankTableV1(rank_table.get_rank_table_path())
+    assert rank_table_v1.get_device_num() == 16
+    assert rank_table_v1.get_server_num() == 2
+    for rank_id in range(16):
+        server, device = rank_table_v1.get_server_by_rank(rank_id)
+        assert device['rank_id'] == str(rank_id)
+        assert rank_table_v1.get_server(server['server_id']) == server
+    assert rank_table_v1.get_server_by_rank(16) == (None, None)
+    assert rank_table_v1.get_server('0.0.0.0') is None
+
+
+def make_rank_table_v1(server_num, device_num_per_server=8):
+    return {
+        'status': 'completed',
+        'version': '1.0',
+        'server_count': str(server_num),
+        'server_list': [{
+            'server_id': '10.%d.%d.1' % (server_index // 256, server_index % 256),
+            'device': [{
+                'device_id': str(device_index),
+                'device_ip': '192.%d.%d.%d' % (device_index + 1, server_index // 256, server_index % 256),
+                'rank_id': str(server_index * device_num_per_server + device_index)
+            } for device_index in range(device_num_per_server)]
+        } for server_index in range(server_num)]
+    }
+
+
+def test_rank_table_columns_round_trip():
+    rank_table = make_rank_table_v1(3, 2)
+    # values which can not be packed are kept as they are
+    rank_table['server_list'][1]['device'][0]['device_ip'] = 'fe80::1'
+    rank_table['server_list'][2]['device'][1]['device_id'] = '01'
+    columns = RankTableColumns.from_server_list(rank_table['server_list'])
+    assert columns.get_server_list() == rank_table['server_list']
+    assert [columns.get_server_index_of_row(row) for row in range(6)] == [0, 0, 1, 1, 2, 2]
+
+
+def test_rank_table_sparse_rank_ids():
+    rank_table = RankTable()
+    rank_table.rank_table = make_rank_table_v1(2, 2)
+    assert isinstance(rank_table.rank_rows, array)
+    assert rank_table.rank_table is rank_table.rank_table
+
+    sparse_rank_table = make_rank_table_v1(2, 2)
+    sparse_rank_table['server_list'][1]['device'][0]['rank_id'] = '4000000000'
+    sparse_rank_table['server_list'][1]['device'][1]['rank_id'] = 'rank-3'
+    rank_table.rank_table = sparse_rank_table
+    assert rank_table.rank_table == sparse_rank_table
+    assert isinstance(rank_table.rank_rows, dict)
+    assert rank_table.get_server_by_rank(4000000000)[1]['device_id'] == '0'
+    assert rank_table.get_server_by_rank('rank-3')[0]['server_id'] == '10.0.1.1'
+    assert rank_table.get_server_by_rank(1)[1]['rank_id'] == '1'
+    assert rank_table.get_server_by_rank(2) == (None, None)
+    assert rank_table.get_server_by_rank('abc') == (None, None)
+    assert rank_table.get_server_by_rank(-1) == (None, None)
+
+
+def measure_memory(load):
+    gc.collect()
+    tracemalloc.start()
+    loaded = load()
+    gc.collect()
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del loaded
+    return memory
+
+
+def measure_time(load, repeat=5):
+    """
+    :return: the best seconds of the repeated loads, outside of tracemalloc
+    """
+    elapsed_list = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        load()
+        elapsed_list.append(time.perf_counter() - start_time)
+    return min(elapsed_list)
+
+
+def test_rank_table_load_benchmark(tmp_path):
+    # 4096 devices
+    file_path = str(tmp_path / 'jobstart_hccl.json')
+    with open(file_path, 'w') as f:
+        json.dump(make_rank_table_v1(512), f)
+
+    def load_objects():
+        # the raw json and the objects of every device, as it was
+        rank_table = RankTable.read_from_file(file_path)
+        return rank_table, [RankTable.convert_server_to_instance(server) for server in rank_table['server_list']]
+
+    def load_columns():
+        return RankTableV1(file_path)
+
+    assert measure_memory(load_columns) * 4 < measure_memory(load_objects)
+    # packing costs a little more than building the objects (about 6.0ms vs 5.2ms), keep it within 2x
+    assert measure_time(load_columns) < measure_time(load_objects) * 2
+
+
+def test_atomic_write(tmp_path):
+    file_path = str(tmp_path / 'jobstart_hccl.json')
+    with FileHelper.atomic_write(file_path) as f:
+        f.write('old')
+
+    with pytest.raises(RuntimeError):
+        with FileHelper.atomic_write(file_path) as f:
+            f.write('partial')
+            raise RuntimeError('interrupted')
+
+    assert os.listdir(str(tmp_path)) == ['jobstart_hccl.json']
+    with open(file_path) as f:
+        assert f.read() == 'old'
+
+
+def test_convert_v0_to_v1(monkeypatch):
+    monkeypatch.setenv(RankTable.DEBUG_RANK_TABLE_ENV, 'true')
+    rank_table = RankTableV0(k8s_hccl_path)
+    with open(rank_table.get_rank_table_path()) as f:
+        assert json.load(f) == rank_table.rank_table
+    assert rank_table.rank_table['server_count'] == '2'
+
+
+def test_convert_v0_to_v1_cache(tmp_path, monkeypatch):
+    v0_path = str(tmp_path / 'jobstart_hccl.json')
+    with open(k8s_hccl_path) as f:
+        v0_data = json.load(f)
+    with open(v0_path, 'w') as f:
+        json.dump(v0_data, f)
+
+    converted = []
+    convert = RankTableV0.convert_v0_to_v1_format_file
+
+    def counted_convert(self):
+        converted.append(self)
+        return convert(self)
+
+    monkeypatch.setattr(RankTableV0, 'convert_v0_to_v1_format_file', counted_convert)
+    monkeypatch.setattr(RankTableV0, '_memo', {})
+
+    rank_table = RankTableV0(v0_path)
+    v1_path = rank_table.get_rank_table_path()
+    assert len(converted) == 1
+    # in-process memo
+    assert RankTableV0(v0_path).rank_table == rank_table.rank_table
+    # sidecar digest file, e.g. another process
+    RankTableV0._memo.clear()
+    assert RankTableV0(v0_path).rank_table == rank_table.rank_table
+    assert len(converted) == 1
+
+    # the v1 file is modified by others
+    with open(v1_path, 'a') as f:
+        f.write(' ')
+    RankTableV0(v0_path)
+    assert len(converted) == 2
+
+    # the v0 file is changed
+    v0_data['group_list'][0]['instance_list'][0]['devices'].pop()
+    with open(v0_path, 'w') as f:
+        json.dump(v0_data, f)
+    assert RankTableV0(v0_path).get_server_num() == 2
+    assert len(converted) == 3
+    with open(v1_path) as f:
+        assert sum(len(server['device']) for server in json.load(f)['server_list']) == 15
+
+
+def test_convert_v0_to_v1_concurrently(monkeypatch):
+    monkeypatch.setattr(RankTableV0, '_memo', {})
+    errors = []
+
+    def load():
+        try:
+            RankTableV0(k8s_hccl_path)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=load) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    with open(RankTableV0.get_v1_file_path()) as f:
+        assert json.load(f)['server_count'] == '2'
@@ -0,0 +1,81 @@
+import base64
+import gzip
+import json
+
+from davincirunsdk import sdr
+from davincirunsdk.rank_table import RankTableV1, Instance
+from davincirunsdk.route_planner import load_route_planner, ReferenceRoutePlanner, VendorRoutePlanner
+
+
+def write_rank_table(file_path, server_ids, device_num=2):
+    rank_table = {
+        'status': 'completed',
+        'version': '1.0',
+        'server_count': str(len(server_ids)),
+        'server_list': [{
+            'server_id': server_id,
+            'device': [{'device_id': str(index), 'device_ip': '192.%d.0.%d' % (index + 1, server_index),
+                        'rank_id': str(server_index * device_num + index)} for index in range(device_num)]
+        } for server_index, server_id in enumerate(server_ids)]
+    }
+    with open(file_path, 'w') as f:
+        json.dump(rank_table, f)
+
+
+def test_reference_route_planner(tmp_path):
+    rank_file = str(tmp_path / 'jobstart_hccl.json')
+    save_rank_file = str(tmp_path / 'jobstart_routeplan.json')
+    topo_file = str(tmp_path / 'ranktable_tor_decompress.json')
+    # tor-a: .1 .3, tor-b: .2, the subnet of 10.1.0.0/24: .4 .6, the subnet of 10.2.0.0/24: .5
+    write_rank_table(rank_file, ['10.0.0.1', '10.0.0.2', '10.0.0.3', '10.1.0.4', '10.2.0.5', '10.1.0.6'])
+    with open(topo_file, 'w') as f:
+        json.dump({'status': 'completed', 'server_list': [
+            {'server_id': '10.0.0.1', 'tor_id': 'a'}, {'server_id': '10.0.0.2', 'tor_id': 'b'},
+            {'server_id': '10.0.0.3', 'tor_id': 'a'}]}, f)
+
+    ret, customdev, custom_id = ReferenceRoutePlanner().init(topo_file, rank_file, save_rank_file, '10.0.0.3')
+    assert ret
+    assert custom_id == '10.0.0.3'
+    assert customdev == [('2', '0', '192.1.0.2'), ('3', '1', '192.2.0.2')]
+
+    planned = RankTableV1(save_rank_file)
+    assert planned.columns.server_ids == ['10.0.0.1', '10.0.0.3', '10.0.0.2', '10.1.0.4', '10.1.0.6', '10.2.0.5']
+    assert [planned.get_server_by_rank(rank_id)[1]['rank_id'] for rank_id in range(12)] == \
+        [str(rank_id) for rank_id in range(12)]
+
+    # in order already
+    assert ReferenceRoutePlanner().init(topo_file, save_rank_file, save_rank_file, '10.0.0.3') == \
+        (False, None, None)
+
+
+class FakePlanner:
+    def init(self, topo_file, rank_file, save_rank_file, cursrvip):
+        return False, None, None
+
+
+def test_load_route_planner(monkeypatch):
+    monkeypatch.delenv('ROUTE_PLANNER', raising=False)
+    monkeypatch.setattr(VendorRoutePlanner, '__init__', lambda self: (_ for _ in ()).throw(ImportError()))
+    assert isinstance(load_route_planner(), ReferenceRoutePlanner)
+    assert isinstance(load_route_planner('reference'), ReferenceRoutePlanner)
+    assert isinstance(load_route_planner('tests.test_route_planner:FakePlanner'), FakePlanner)
+    assert load_route_planner('tests.test_route_planner:MissingPlanner') is None
+    assert load_route_planner('missing') is None
+    assert load_route_planner('vendor') is None
+
+
+def test_do_route_plan_with_reference_planner(tmp_path, monkeypatch):
+    rank_file = str(tmp_path / 'jobstart_hccl.json')
+    write_rank_table(rank_file, ['10.0.0.1', '10.0.1.2', '10.0.0.3'])
+    topo_file = str(tmp_path / 'ranktable_tor.json')
+    with open(topo_file, 'w') as f:
+        f.write(base64.b64encode(gzip.compress(json.dumps({'status': 'completed'}).encode())).decode())
+
+    monkeypatch.setenv('ROUTE_PLAN', 'true')
+    monkeypatch.setenv('ROUTE_PLANNER', 'reference')
+    monkeypatch.setattr(sdr, 'TOPO_FILE_PATH', topo_file)
+    monkeypatch.setattr(sdr.RouteHelper, 'get_topo_cache_dir', staticmethod(lambda: str(tmp_path / 'cache')))
+
+    instance = sdr.RouteHelper().do_route_plan(rank_file, Instance('', '10.0.1.2', []))
+    assert instance.server_id == '10.0.1.2'
+    assert [device.rank_id for device in instance.devices] == ['4', '5']
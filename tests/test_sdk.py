@@ -31,6 +31,15 @@ def test_full_stack():
     assert wait_distributed_train(manager) == 0
 
 
+def test_concurrent_spawn_stack():
+    init_rank_table()
+    manager = start_distributed_train(['python', mock_train_file], spawn_workers=4)
+    spawn_latency = manager.get_spawn_latency()
+    assert len(spawn_latency) == len(manager.fmk_processes)
+    assert all(latency is not None for latency in spawn_latency.values())
+    assert wait_distributed_train(manager) == 0
+
+
 def test_failure_stack():
     init_rank_table()
 
@@ -0,0 +1,118 @@
+import base64
+import gzip
+import json
+import os
+import threading
+import time
+
+import pytest
+
+from davincirunsdk.sdr import TopoLoader, RouteHelper
+
+
+def make_topo(status='completed', server_count=64):
+    return json.dumps({'status': status, 'server_list': [{'server_id': '10.0.0.%d' % index, 'tor': index // 8}
+                                                         for index in range(server_count)]})
+
+
+def write_topo_file(file_path, topo, line_width=76):
+    encoded = base64.b64encode(gzip.compress(topo.encode())).decode()
+    with open(file_path, 'w') as f:
+        f.write('\n'.join(encoded[i:i + line_width] for i in range(0, len(encoded), line_width)))
+
+
+def test_topo_loader(tmp_path, monkeypatch):
+    monkeypatch.setattr(TopoLoader, 'READ_SIZE', 7)
+    monkeypatch.setattr(TopoLoader, '_cache', {})
+    file_path = str(tmp_path / 'ranktable_tor.json')
+    topo = make_topo()
+    write_topo_file(file_path, topo)
+
+    decoded = []
+    decode = TopoLoader.decode
+
+    def counted_decode(path):
+        decoded.append(path)
+        return decode(path)
+
+    monkeypatch.setattr(TopoLoader, 'decode', staticmethod(counted_decode))
+    assert TopoLoader.load(file_path) == topo
+    assert TopoLoader.load(file_path) == topo
+    assert len(decoded) == 1
+
+    # multiple gzip members, the same as gzip.decompress
+    with open(file_path, 'w') as f:
+        f.write(base64.b64encode(gzip.compress(b'{"status": ') + gzip.compress(b'"completed"}')).decode())
+    assert TopoLoader.load(file_path) == '{"status": "completed"}'
+    assert len(decoded) == 2
+
+
+def test_topo_loader_partial(tmp_path):
+    file_path = str(tmp_path / 'ranktable_tor.json')
+    encoded = base64.b64encode(gzip.compress(make_topo().encode()))
+    for size in (len(encoded) // 2, len(encoded) - 1):
+        with open(file_path, 'wb') as f:
+            f.write(encoded[:size])
+        with pytest.raises(ValueError):
+            TopoLoader.decode(file_path)
+
+
+def test_topo_wait_time(monkeypatch):
+    monkeypatch.delenv('ROUTE_TOPO_WAIT_TIME', raising=False)
+    assert RouteHelper.get_topo_wait_time() == 300
+    monkeypatch.setenv('ROUTE_TOPO_WAIT_TIME', '30')
+    assert RouteHelper.get_topo_wait_time() == 30
+    monkeypatch.setenv('ROUTE_TOPO_WAIT_TIME', 'abc')
+    assert RouteHelper.get_topo_wait_time() == 300
+
+
+def test_wait_for_topo_available(tmp_path, monkeypatch):
+    monkeypatch.setenv('ROUTE_TOPO_WAIT_TIME', '10')
+    file_path = str(tmp_path / 'ranktable_tor.json')
+    topo = make_topo()
+
+    def generate():
+        time.sleep(0.1)
+        with open(file_path, 'w') as f:
+            f.write('H4sI')
+        time.sleep(0.1)
+        write_topo_file(file_path, make_topo('initializing'))
+        time.sleep(0.1)
+        write_topo_file(file_path, topo)
+
+    thread = threading.Thread(target=generate)
+    thread.start()
+    start_time = time.time()
+    assert RouteHelper.wait_for_topo_available(file_path, period=0.05) == topo
+    assert time.time() - start_time < 5
+    thread.join()
+
+    not_ready = make_topo('initializing')
+    write_topo_file(file_path, not_ready)
+    assert RouteHelper.wait_for_topo_available(file_path, period=0.05, maximum_wait_time=0.2) == not_ready
+
+
+def test_decompress_topo_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(RouteHelper, 'get_topo_cache_dir', staticmethod(lambda: str(tmp_path / 'cache' / 'job')))
+    file_path = str(tmp_path / 'ranktable_tor.json')
+    topo = make_topo(server_count=8)
+    write_topo_file(file_path, topo)
+
+    output_path = RouteHelper.decompress_topo_file(file_path)
+    assert output_path == str(tmp_path / 'cache' / 'job' / 'ranktable_tor_decompress.json')
+    with open(output_path) as f:
+        assert f.read() == topo
+    mtime_ns = os.stat(output_path).st_mtime_ns
+
+    # identical, reused
+    time.sleep(0.01)
+    assert RouteHelper.decompress_topo_file(file_path) == output_path
+    assert os.stat(output_path).st_mtime_ns == mtime_ns
+
+    # shorter, no stale bytes
+    topo = make_topo(server_count=2)
+    write_topo_file(file_path, topo)
+    RouteHelper.decompress_topo_file(file_path)
+    with open(output_path) as f:
+        assert f.read() == topo
+    assert RouteHelper.get_topo_summary(topo) == 'status: completed, server count: 2'
@@ -0,0 +1,48 @@
+import subprocess
+import sys
+
+import pytest
+
+HEAVY_MODULES = {'tornado', 'sh', 'ipykernel', 'moxing', 'asyncio'}
+# us, davincirun imports in about 50ms here, the budget leaves room for slow machines
+DAVINCIRUN_IMPORT_BUDGET = 300000
+
+
+def import_time(module_name):
+    """
+    :return: {module: cumulative import time in us} of `python -X importtime -c "import module_name"`
+    """
+    output = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import %s' % module_name],
+                            stderr=subprocess.PIPE, universal_newlines=True, check=True).stderr
+    import_times = {}
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, imported = line[len('import time:'):].split('|')
+        import_times[imported.strip()] = int(cumulative)
+    return import_times
+
+
+@pytest.mark.parametrize('module_name', ['davincirunsdk', 'davincirunsdk.davincirun', 'davincirunsdk.notebook.sdk'])
+def test_no_heavy_imports(module_name):
+    import_times = import_time(module_name)
+    assert not HEAVY_MODULES & set(import_times)
+
+
+def test_davincirun_import_budget():
+    import_times = import_time('davincirunsdk.davincirun')
+    assert import_times['davincirunsdk.davincirun'] < DAVINCIRUN_IMPORT_BUDGET
+
+
+def test_lazy_sdk_import():
+    import_times = import_time('davincirunsdk')
+    assert 'davincirunsdk.notebook.sdk' not in import_times
+    # the package used to import the notebook sdk eagerly
+    sdk_import_times = import_time('davincirunsdk.notebook.sdk')
+    assert import_times['davincirunsdk'] * 10 < sdk_import_times['davincirunsdk.notebook.sdk']
+
+    import davincirunsdk
+    from davincirunsdk.notebook.sdk import init_rank_table
+    assert davincirunsdk.init_rank_table is init_rank_table
+    with pytest.raises(AttributeError):
+        davincirunsdk.missing
@@ -0,0 +1,64 @@
+from davincirunsdk.fmk import FMK
+from davincirunsdk.rank_table import RankTable, Device
+from davincirunsdk.topology import Topology, format_ranks, parse_ranks
+
+
+def make_rank_table(servers):
+    """
+    :param servers: [(server_id, [(device_ip, rank_id), ...]), ...]
+    """
+    rank_table = RankTable()
+    rank_table.rank_table = {
+        'status': 'completed',
+        'version': '1.0',
+        'server_count': str(len(servers)),
+        'server_list': [{
+            'server_id': server_id,
+            'device': [{'device_id': str(index), 'device_ip': device_ip, 'rank_id': str(rank_id)}
+                       for index, (device_ip, rank_id) in enumerate(devices)]
+        } for server_id, devices in servers]
+    }
+    return rank_table
+
+
+def test_format_ranks():
+    assert format_ranks([]) == ''
+    assert format_ranks([0, 1, 2, 3, 8, 16, 17]) == '0-3,8,16-17'
+    assert parse_ranks('0-3,8,16-17') == [0, 1, 2, 3, 8, 16, 17]
+
+
+def test_topology():
+    # 2 servers * 4 devices, device k of each server is in subnet 192.(k+1).0.0/24
+    rank_table = make_rank_table([
+        ('10.0.0.1', [('192.%d.0.1' % (index + 1), index) for index in range(4)]),
+        ('10.0.0.2', [('192.%d.0.2' % (index + 1), index + 4) for index in range(4)]),
+    ])
+    topology = Topology.from_rank_table(rank_table)
+
+    assert topology.server_blocks == [[0, 1, 2, 3], [4, 5, 6, 7]]
+    assert topology.subnet_groups == [[0, 4], [1, 5], [2, 6], [3, 7]]
+    assert topology.get_inter_server_group(6) == [2, 6]
+    assert topology.get_suggested_algo() == Topology.ALGO_HIERARCHICAL
+
+    envs = topology.get_envs('5')
+    assert envs['DAVINCIRUN_TOPO_SERVER_INDEX'] == '1'
+    assert envs['DAVINCIRUN_TOPO_LOCAL_RANK'] == '1'
+    assert envs['DAVINCIRUN_TOPO_SERVER_RANKS'] == '4-7'
+    assert envs['DAVINCIRUN_TOPO_INTER_SERVER_RANKS'] == '1,5'
+    assert envs['DAVINCIRUN_TOPO_SUBNET_RANKS'] == '1,5'
+    assert topology.get_envs('8') == {}
+
+    single = Topology.from_rank_table(make_rank_table([('10.0.0.1', [('fe80::1', 0), ('192.1.0.1', 1)])]))
+    assert single.get_suggested_algo() == Topology.ALGO_RING
+    assert single.subnet_groups == [[0], [1]]
+
+
+def test_fmk_topology_env(monkeypatch):
+    monkeypatch.setenv('DAVINCIRUN_TOPO_SUGGESTED_ALGO', 'ring')
+    rank_table = make_rank_table([('10.0.0.%d' % server, [('192.%d.0.%d' % (index + 1, server), server * 2 + index)
+                                                          for index in range(2)]) for server in range(2)])
+    fmk = FMK(False, 1, Device('1', '192.2.0.1', '3'), Topology.from_rank_table(rank_table))
+    envs = fmk.gen_env_for_fmk(4)
+    assert envs['DAVINCIRUN_TOPO_SERVER_RANKS'] == '2-3'
+    # the user's env is kept
+    assert envs['DAVINCIRUN_TOPO_SUGGESTED_ALGO'] == 'ring'